@@ -0,0 +1,224 @@
+"""
+Online aggregation of Monte Carlo runs
+
+For large Monte Carlo experiments, `SummarySink` reduces the streamed, post-processed results (see `experiments/sinks.py`)
+to summary statistics per subset and timestep as each chunk of runs completes, instead of keeping every row:
+* count, mean and standard deviation, with Welford's algorithm (merging each chunk with Chan et al.'s parallel update)
+* quantiles, with the P² algorithm (Jain & Chlamtac), which tracks five markers per quantile
+
+Memory is O(subsets × timesteps × columns × quantiles), whatever the number of runs:
+
+```python
+summary, exceptions = run(experiment, engine="vectorized", chunk_size=1000, stochastic=Stochastic(), sink=SummarySink(["hosts", "clients"]))
+```
+"""
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_COLUMNS = ["hosts", "clients", "avg_price", "platform_daily_revenue"]
+GROUP_COLUMNS = ["subset", "timestep"]
+
+
+class RunningMoments:
+    """Count, mean and sum of squared deviations of groups of observations
+
+    Args:
+        columns (int): number of observed values per observation
+    """
+
+    def __init__(self, columns):
+        self.count = np.zeros(0)
+        self.mean = np.zeros((0, columns))
+        self.m2 = np.zeros((0, columns))
+
+    def grow(self, groups):
+        extra = groups - len(self.count)
+        self.count = np.concatenate([self.count, np.zeros(extra)])
+        self.mean = np.concatenate([self.mean, np.zeros((extra, self.mean.shape[1]))])
+        self.m2 = np.concatenate([self.m2, np.zeros((extra, self.m2.shape[1]))])
+
+    def update(self, groups, values):
+        """Add observations
+
+        Args:
+            groups (np.ndarray): group of each observation
+            values (np.ndarray): (observations, columns) values
+        """
+        size = len(self.count)
+        count = np.bincount(groups, minlength=size).astype(np.float64)
+        observed = count > 0
+        mean = np.zeros_like(self.mean)
+        m2 = np.zeros_like(self.m2)
+        for column in range(values.shape[1]):
+            mean[observed, column] = np.bincount(groups, values[:, column], size)[observed] / count[observed]
+            deviations = values[:, column] - mean[groups, column]
+            m2[:, column] = np.bincount(groups, deviations ** 2, size)
+
+        total = self.count + count
+        weight = np.divide(count, total, out=np.zeros(size), where=total > 0)[:, None]
+        delta = mean - self.mean
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count[:, None] * weight)
+        self.count = total
+
+    def variance(self):
+        """Sample variance (NaN for groups of fewer than two observations)"""
+        denominator = (self.count - 1)[:, None]
+        return np.divide(self.m2, denominator, out=np.full_like(self.m2, np.nan), where=denominator > 0)
+
+
+class P2Quantiles:
+    """P² estimates of quantiles of groups of observations, without storing the observations
+
+    Each (group, column, quantile) keeps five marker heights and positions. The first five observations of a group
+    are stored as the initial markers, and quantiles of groups with fewer observations are computed exactly.
+    P² estimates are approximate, and least accurate for values taking only a few distinct values.
+
+    Args:
+        columns (int): number of observed values per observation
+        quantiles (list): quantiles to estimate, between 0 and 1
+    """
+
+    def __init__(self, columns, quantiles):
+        self.quantiles = np.asarray(quantiles, dtype=np.float64)
+        p = self.quantiles
+        # Marker state is stored as (markers, groups, columns, quantiles), so each marker is contiguous
+        self.increments = np.stack([np.zeros_like(p), p / 2, p, (1 + p) / 2, np.ones_like(p)])[:, None, None, :]
+        self.initial_desired = np.stack([np.ones_like(p), 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, np.full_like(p, 5)])[:, None, None, :]
+        shape = (5, 0, columns, len(self.quantiles))
+        self.count = np.zeros(0, dtype=np.int64)
+        self.heights = np.zeros(shape)
+        self.positions = np.zeros(shape)
+        self.desired = np.zeros(shape)
+
+    def grow(self, groups):
+        extra = groups - len(self.count)
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        for name in ["heights", "positions", "desired"]:
+            values = getattr(self, name)
+            setattr(self, name, np.concatenate([values, np.zeros((5, extra, *values.shape[2:]))], axis=1))
+
+    def update(self, groups, values):
+        """Add one observation to each of the given (distinct) groups
+
+        Args:
+            groups (np.ndarray): distinct groups
+            values (np.ndarray): (groups, columns) values
+        """
+        count = self.count[groups]
+
+        initial = count < 5
+        if initial.any():
+            initial_groups = groups[initial]
+            self.heights[count[initial], initial_groups] = values[initial][:, :, None]
+            self.count[initial_groups] += 1
+            ready = initial_groups[self.count[initial_groups] == 5]
+            if len(ready):
+                self.heights[:, ready] = np.sort(self.heights[:, ready], axis=0)
+                self.positions[:, ready] = np.arange(1, 6)[:, None, None, None]
+                self.desired[:, ready] = self.initial_desired
+            groups, values = groups[~initial], values[~initial]
+            if not len(groups):
+                return
+
+        self.count[groups] += 1
+        # Update contiguous groups in place, otherwise update copies and write them back
+        contiguous = groups[-1] - groups[0] + 1 == len(groups) and (np.diff(groups) > 0).all()
+        selection = slice(groups[0], groups[-1] + 1) if contiguous else groups
+        heights, positions, desired = self.heights[:, selection], self.positions[:, selection], self.desired[:, selection]
+        x = values[:, :, None]
+
+        # Cell of the observation, extending the extreme markers
+        np.minimum(heights[0], x, out=heights[0])
+        np.maximum(heights[4], x, out=heights[4])
+        cell = (x >= heights[1]).astype(np.int8) + (x >= heights[2]) + (x >= heights[3])
+        for i in range(1, 5):
+            positions[i] += cell < i
+        desired += self.increments
+
+        # Adjust the middle markers
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(1, 4):
+                d = desired[i] - positions[i]
+                gap_up = positions[i + 1] - positions[i]
+                gap_down = positions[i - 1] - positions[i]
+                move = ((d >= 1) & (gap_up > 1)) | ((d <= -1) & (gap_down < -1))
+                if not move.any():
+                    continue
+                s = np.sign(d)
+                h_down, h, h_up = heights[i - 1], heights[i], heights[i + 1]
+                parabolic = h + s / (positions[i + 1] - positions[i - 1]) * (
+                    (-gap_down + s) * (h_up - h) / gap_up
+                    + (gap_up - s) * (h - h_down) / -gap_down
+                )
+                linear = np.where(s > 0, h + (h_up - h) / gap_up, h - (h_down - h) / gap_down)
+                adjusted = np.where((h_down < parabolic) & (parabolic < h_up), parabolic, linear)
+                heights[i] = np.where(move, adjusted, h)
+                positions[i] += np.where(move, s, 0)
+
+        if not contiguous:
+            self.heights[:, groups], self.positions[:, groups], self.desired[:, groups] = heights, positions, desired
+
+    def estimates(self):
+        """Return (groups, columns, quantiles) quantile estimates"""
+        estimates = self.heights[2].copy()
+        for count in range(1, 5):
+            groups = np.flatnonzero(self.count == count)
+            if len(groups):
+                observations = self.heights[:count, groups, :, 0]
+                estimates[groups] = np.moveaxis(np.quantile(observations, self.quantiles, axis=1), 0, -1)
+        estimates[self.count == 0] = np.nan
+        return estimates
+
+
+class SummarySink:
+    """Sink reducing post-processed results to summary statistics per subset and timestep
+
+    Args:
+        columns (list): result columns to summarise
+        percentiles (list): percentiles to estimate, between 0 and 100
+
+    `close()` returns a DataFrame indexed by subset and timestep, with a `runs` column, and `<column>_mean`,
+    `<column>_std` and `<column>_p<percentile>` columns for every column, as in `post_processing.percentile_bands()`.
+    """
+
+    def __init__(self, columns=DEFAULT_COLUMNS, percentiles=[5, 50, 95]):
+        self.columns = list(columns)
+        self.percentiles = list(percentiles)
+        self.keys = pd.MultiIndex.from_arrays([[], []], names=GROUP_COLUMNS)
+        self.moments = RunningMoments(len(self.columns))
+        self.quantiles = P2Quantiles(len(self.columns), [percentile / 100 for percentile in self.percentiles])
+
+    def write(self, df: pd.DataFrame):
+        keys = pd.MultiIndex.from_frame(df[GROUP_COLUMNS])
+        new_keys = keys.unique().difference(self.keys)
+        if len(new_keys):
+            self.keys = self.keys.append(new_keys)
+            self.moments.grow(len(self.keys))
+            self.quantiles.grow(len(self.keys))
+
+        groups = self.keys.get_indexer(keys)
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        self.moments.update(groups, values)
+
+        # Each P² update takes one observation per group: the nth run of every group in the chunk
+        ranks = pd.Series(groups).groupby(groups).cumcount().to_numpy()
+        order = np.argsort(ranks, kind="stable")
+        boundaries = np.searchsorted(ranks[order], np.arange(ranks.max() + 2)) if len(ranks) else [0]
+        for (start, end) in zip(boundaries[:-1], boundaries[1:]):
+            rows = order[start:end]
+            self.quantiles.update(groups[rows], values[rows])
+
+    def close(self) -> pd.DataFrame:
+        order = np.lexsort([self.keys.get_level_values(level) for level in reversed(GROUP_COLUMNS)])
+        summary = {"runs": self.moments.count.astype(np.int64)}
+        standard_deviation = np.sqrt(self.moments.variance())
+        estimates = self.quantiles.estimates()
+        for (column_index, column) in enumerate(self.columns):
+            summary[f"{column}_mean"] = self.moments.mean[:, column_index]
+            summary[f"{column}_std"] = standard_deviation[:, column_index]
+            for (quantile_index, percentile) in enumerate(self.percentiles):
+                summary[f"{column}_p{percentile}"] = estimates[:, column_index, quantile_index]
+        return pd.DataFrame(summary, index=self.keys).iloc[order]
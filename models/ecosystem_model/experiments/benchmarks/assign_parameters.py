@@ -0,0 +1,74 @@
+"""
+# Benchmark of `post_processing.assign_parameters`
+
+Compares the subset -> parameter table lookup against the previous implementation, which scanned the
+full DataFrame with `df.eval(...)` once per (subset, parameter) pair.
+
+The previous implementation is quadratic in the sweep size, so for large sweeps it is timed on the first
+`LEGACY_SUBSET_LIMIT` subsets and extrapolated linearly (its cost per subset is proportional to the number of rows).
+
+Usage: `python -m experiments.benchmarks.assign_parameters [timesteps]`
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from radcad.core import generate_parameter_sweep
+
+from experiments.post_processing import assign_parameters
+from model.system_parameters import parameters
+
+
+SUBSETS = [10, 1_000, 10_000]
+LEGACY_SUBSET_LIMIT = 100
+
+
+def legacy_assign_parameters(df, parameters, set_params, subsets=None):
+    parameter_sweep = generate_parameter_sweep(parameters)
+    parameter_sweep = [{param: subset[param] for param in set_params} for subset in parameter_sweep]
+
+    for subset_index in (subsets if subsets is not None else df['subset'].unique()):
+        for (key, value) in parameter_sweep[subset_index].items():
+            df.loc[df.eval(f'subset == {subset_index}'), key] = value
+
+    return df
+
+
+def results(subsets, timesteps):
+    return pd.DataFrame({
+        "subset": np.repeat(np.arange(subsets), timesteps + 1),
+        "timestep": np.tile(np.arange(timesteps + 1), subsets),
+    })
+
+
+def benchmark(subsets, timesteps):
+    sweep = {**parameters, "host_setup_delay": list(range(1, subsets + 1))}
+    set_params = list(parameters)
+
+    df = results(subsets, timesteps)
+    start_time = time.perf_counter()
+    assign_parameters(df, sweep, set_params)
+    duration = time.perf_counter() - start_time
+
+    legacy_subsets = min(subsets, LEGACY_SUBSET_LIMIT)
+    df = results(subsets, timesteps)
+    start_time = time.perf_counter()
+    legacy_assign_parameters(df, sweep, set_params, subsets=range(legacy_subsets))
+    legacy_duration = (time.perf_counter() - start_time) * subsets / legacy_subsets
+
+    return duration, legacy_duration, legacy_subsets < subsets
+
+
+if __name__ == '__main__':
+    timesteps = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+
+    print(f"assign_parameters, {len(parameters)} parameters, {timesteps} timesteps per subset")
+    for subsets in SUBSETS:
+        duration, legacy_duration, extrapolated = benchmark(subsets, timesteps)
+        print(
+            f"{subsets:>6} subsets: {duration:.4f} s (table lookup) vs "
+            f"{legacy_duration:.2f} s (eval scan{', extrapolated' if extrapolated else ''}) "
+            f"-> {legacy_duration / duration:.0f}x speedup"
+        )
@@ -0,0 +1,55 @@
+"""
+# Microbenchmark of the fused single-step kernel
+
+Measures timesteps per second of a single run of the default experiment with:
+* radCAD (`radcad.core.single_run`, with the default experiment's `deepcopy=False`, `drop_substeps=True`)
+* the fused kernel (`model/fused.py`), including storing each state in the result array
+
+Usage: `python -m experiments.benchmarks.fused_step [timesteps]`
+"""
+
+import copy
+import logging
+import sys
+import time
+
+from radcad.core import generate_parameter_sweep, single_run
+
+from experiments.default_experiment import experiment
+import experiments.fused as fused
+
+
+def radcad_steps_per_second(simulation, timesteps):
+    params = generate_parameter_sweep(simulation.model.params)[0]
+    start_time = time.perf_counter()
+    single_run(
+        timesteps=timesteps,
+        initial_state=copy.deepcopy(simulation.model.initial_state),
+        state_update_blocks=simulation.model.state_update_blocks,
+        params=params,
+        deepcopy=False,
+        drop_substeps=True,
+    )
+    return timesteps / (time.perf_counter() - start_time)
+
+
+def fused_steps_per_second(simulation, timesteps):
+    start_time = time.perf_counter()
+    fused.simulate(
+        simulation.model.initial_state,
+        simulation.model.state_update_blocks,
+        simulation.model.params,
+        timesteps,
+    )
+    return timesteps / (time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    timesteps = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    simulation = experiment.simulations[0]
+
+    radcad_rate = radcad_steps_per_second(simulation, timesteps)
+    fused_rate = fused_steps_per_second(simulation, timesteps)
+    print(f"radCAD: {radcad_rate:,.0f} steps/s")
+    print(f"fused:  {fused_rate:,.0f} steps/s ({fused_rate / radcad_rate:.1f}x)")
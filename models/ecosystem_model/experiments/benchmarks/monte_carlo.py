@@ -0,0 +1,45 @@
+"""
+# Benchmark of the stochastic Monte Carlo mode
+
+Times the default experiment with stochastic adoption and price noise (`model/stochastic.py`) on the vectorized engine:
+* simulating all runs
+* post-processing the results
+* summarising the runs as percentile bands (`post_processing.percentile_bands`)
+
+Usage: `python -m experiments.benchmarks.monte_carlo [runs]`
+"""
+
+import copy
+import logging
+import sys
+import time
+
+from experiments.default_experiment import experiment
+from experiments.post_processing import post_process, percentile_bands
+import experiments.vectorized as vectorized
+from model.stochastic import Stochastic
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    monte_carlo_experiment = copy.deepcopy(experiment)
+    monte_carlo_experiment.simulations[0].runs = runs
+
+    start_time = time.perf_counter()
+    df = vectorized.run(monte_carlo_experiment, stochastic=Stochastic(seed=0, price_volatility=0.02))
+    simulation_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    df = post_process(df)
+    post_processing_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    bands = percentile_bands(df, ["hosts", "clients", "avg_price", "platform_daily_revenue"])
+    bands_time = time.perf_counter() - start_time
+
+    print(f"{runs:,} runs of {monte_carlo_experiment.simulations[0].timesteps} timesteps")
+    print(f"simulation:      {simulation_time:.2f} s")
+    print(f"post-processing: {post_processing_time:.2f} s")
+    print(f"percentile bands: {bands_time:.2f} s")
+    print(bands.iloc[-1].round(2).to_string())
@@ -0,0 +1,282 @@
+"""
+# Benchmark suite of the default experiment
+
+Times the default experiment (`experiments/default_experiment.py`) over a matrix of:
+* engines: "radcad", "vectorized" and "fused"
+* timesteps: 365 and 3,650
+* sweep sizes: 1, 100 and 10,000 subsets (sweeping `service_fee`)
+* Monte Carlo runs: 1 and 10
+
+Each case is executed in a fresh process, which records:
+* `run`: `experiments/run.py::run()`, end to end
+* `simulate`: executing the Experiment (radCAD), or simulating its result columns (vectorized and fused engines)
+* `dataframe`: building the raw results DataFrame, from radCAD's list of dictionaries or from the result columns
+* `assign_parameters` (of every System Parameter) and `post_process`: `experiments/post_processing.py`,
+  each on a copy of the raw results
+* `peak_memory`: the growth of the process' peak resident memory (MB) during the case
+
+Cases with more result rows than `MAX_ROWS` of their engine are skipped, e.g. radCAD sweeps of 10,000 subsets.
+
+Usage:
+* `python -m experiments.benchmarks.suite run [--output benchmarks.json] [--engines ...] [--timesteps ...] [--subsets ...] [--runs ...]`
+* `python -m experiments.benchmarks.suite compare baseline.json benchmarks.json [--threshold 0.1]`,
+  which exits with status 1 if any time or peak memory regressed by more than the threshold
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+
+ENGINES = ["radcad", "vectorized", "fused"]
+TIMESTEPS = [365, 3_650]
+SUBSETS = [1, 100, 10_000]
+RUNS = [1, 10]
+# Result rows above which a case is skipped, per engine
+MAX_ROWS = {"radcad": 400_000, "vectorized": 10_000_000, "fused": 4_000_000}
+STAGES = ["run", "simulate", "dataframe", "assign_parameters", "post_process"]
+# Stages shorter than this (s) are not reported as regressions, as timer noise dominates
+MIN_DURATION = 0.01
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def rows(timesteps, subsets, runs):
+    """Result rows of a case, including timestep 0"""
+    return (timesteps + 1) * subsets * runs
+
+
+def executable(timesteps, subsets, runs):
+    """The default experiment with a horizon, a `service_fee` sweep of `subsets` subsets, and Monte Carlo runs"""
+    from experiments.default_experiment import experiment
+
+    benchmark_experiment = copy.deepcopy(experiment)
+    simulation = benchmark_experiment.simulations[0]
+    simulation.timesteps = timesteps
+    simulation.runs = runs
+    if subsets > 1:
+        simulation.model.params["service_fee"] = [0.01 + 0.09 * subset / (subsets - 1) for subset in range(subsets)]
+    return benchmark_experiment
+
+
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def raw_results(engine, benchmark_experiment):
+    """Return the raw results of an Experiment, and the durations of simulating and of building the DataFrame"""
+    import pandas as pd
+    import experiments.fused as fused
+    import experiments.vectorized as vectorized
+
+    if engine == "radcad":
+        _, simulate_duration = timed(benchmark_experiment.run)
+        df, dataframe_duration = timed(pd.DataFrame, benchmark_experiment.results)
+        return df, simulate_duration, dataframe_duration
+
+    simulate = vectorized.simulate if engine == "vectorized" else fused.simulate
+    columns, simulate_duration = timed(lambda: [
+        simulate(
+            simulation.model.initial_state,
+            simulation.model.state_update_blocks,
+            simulation.model.params,
+            simulation.timesteps,
+            simulation.runs,
+            simulation_index,
+        )
+        for (simulation_index, simulation) in enumerate(benchmark_experiment.simulations)
+    ])
+    df, dataframe_duration = timed(lambda: pd.concat([pd.DataFrame(c) for c in columns], ignore_index=True))
+    return df, simulate_duration, dataframe_duration
+
+
+def case(engine, timesteps, subsets, runs, repeat=1):
+    """Time a case in the current process, keeping the fastest of `repeat` repetitions of each stage"""
+    logging.disable(logging.INFO)
+    from experiments.post_processing import assign_parameters, post_process
+    from experiments.run import run, _parameters
+
+    baseline_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    durations = {stage: float("inf") for stage in STAGES}
+    for _ in range(repeat):
+        _, duration = timed(run, executable(timesteps, subsets, runs), engine=engine)
+        durations["run"] = min(durations["run"], duration)
+
+        benchmark_experiment = executable(timesteps, subsets, runs)
+        df, simulate_duration, dataframe_duration = raw_results(engine, benchmark_experiment)
+        durations["simulate"] = min(durations["simulate"], simulate_duration)
+        durations["dataframe"] = min(durations["dataframe"], dataframe_duration)
+
+        parameters = _parameters(benchmark_experiment)
+        _, duration = timed(assign_parameters, df.copy(), parameters, list(parameters))
+        durations["assign_parameters"] = min(durations["assign_parameters"], duration)
+        _, duration = timed(post_process, df.copy(), parameters=parameters)
+        durations["post_process"] = min(durations["post_process"], duration)
+
+    # ru_maxrss is in kB on Linux
+    peak_memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_memory) / 1024
+    return {"times": durations, "peak_memory": peak_memory}
+
+
+def execute(engine, timesteps, subsets, runs, repeat=1):
+    """Time a case in a fresh process, so that its peak memory and imports are not shared with other cases"""
+    process = subprocess.run(
+        [sys.executable, "-m", "experiments.benchmarks.suite", "case", engine, str(timesteps), str(subsets), str(runs), str(repeat)],
+        cwd=PACKAGE_DIRECTORY,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit status {process.returncode}"}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def metadata():
+    import numpy as np
+    import pandas as pd
+    import radcad
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PACKAGE_DIRECTORY, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "radcad": getattr(radcad, "__version__", None),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def suite(engines=ENGINES, timesteps=TIMESTEPS, subsets=SUBSETS, runs=RUNS, repeat=1, max_rows=MAX_ROWS):
+    """Time every case of the matrix, printing each case as it completes
+
+    Returns:
+        dict: `metadata` of the environment, and `results`, one per case, keyed by `case_name()`
+    """
+    results = {}
+    for engine in engines:
+        for case_timesteps in timesteps:
+            for case_subsets in subsets:
+                for case_runs in runs:
+                    name = case_name(engine, case_timesteps, case_subsets, case_runs)
+                    case_rows = rows(case_timesteps, case_subsets, case_runs)
+                    result = {"engine": engine, "timesteps": case_timesteps, "subsets": case_subsets, "runs": case_runs, "rows": case_rows}
+                    if case_rows > max_rows[engine]:
+                        result["skipped"] = f"more than {max_rows[engine]:,} rows"
+                    else:
+                        result.update(execute(engine, case_timesteps, case_subsets, case_runs, repeat))
+                    results[name] = result
+                    print(format_result(name, result), flush=True)
+    return {"metadata": metadata(), "results": results}
+
+
+def case_name(engine, timesteps, subsets, runs):
+    return f"{engine}/timesteps={timesteps}/subsets={subsets}/runs={runs}"
+
+
+def format_result(name, result):
+    if "skipped" in result:
+        return f"{name:<50} skipped: {result['skipped']}"
+    if "error" in result:
+        return f"{name:<50} failed: {result['error']}"
+    times = " ".join(f"{stage}={result['times'][stage]:.3f}s" for stage in STAGES)
+    return f"{name:<50} {times} peak_memory={result['peak_memory']:.0f}MB"
+
+
+def compare(baseline, current, threshold=0.1):
+    """Compare the times and peak memory of the cases of two suite results
+
+    Args:
+        baseline, current (dict): results of `suite()`
+        threshold (float): relative increase above which a time or peak memory is a regression
+
+    Returns:
+        list: (case, measure, baseline value, current value, ratio) of each regression
+    """
+    regressions = []
+    for (name, result) in current["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None or "times" not in result or "times" not in baseline_result:
+            continue
+        measures = [(stage, baseline_result["times"][stage], result["times"][stage]) for stage in STAGES]
+        measures.append(("peak_memory", baseline_result["peak_memory"], result["peak_memory"]))
+        for (measure, baseline_value, value) in measures:
+            floor = MIN_DURATION if measure != "peak_memory" else 1
+            ratio = value / max(baseline_value, floor)
+            if value > floor and ratio > 1 + threshold:
+                regressions.append((name, measure, baseline_value, value, ratio))
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m experiments.benchmarks.suite", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="time the benchmark matrix")
+    run_parser.add_argument("--output", default="benchmarks.json", help="JSON results path")
+    run_parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    run_parser.add_argument("--timesteps", nargs="+", type=int, default=TIMESTEPS)
+    run_parser.add_argument("--subsets", nargs="+", type=int, default=SUBSETS)
+    run_parser.add_argument("--runs", nargs="+", type=int, default=RUNS)
+    run_parser.add_argument("--repeat", type=int, default=1, help="repetitions of each case, keeping the fastest")
+    run_parser.add_argument("--max-rows", type=int, help="skip cases with more result rows, for every engine")
+
+    compare_parser = commands.add_parser("compare", help="report regressions against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative increase reported as a regression")
+
+    case_parser = commands.add_parser("case", help="time a single case in this process, printing JSON")
+    case_parser.add_argument("engine", choices=ENGINES)
+    case_parser.add_argument("timesteps", type=int)
+    case_parser.add_argument("subsets", type=int)
+    case_parser.add_argument("runs", type=int)
+    case_parser.add_argument("repeat", type=int, nargs="?", default=1)
+
+    arguments = parser.parse_args(arguments)
+    if arguments.command == "case":
+        print(json.dumps(case(arguments.engine, arguments.timesteps, arguments.subsets, arguments.runs, arguments.repeat)))
+        return 0
+
+    if arguments.command == "run":
+        max_rows = MAX_ROWS if arguments.max_rows is None else dict.fromkeys(ENGINES, arguments.max_rows)
+        results = suite(arguments.engines, arguments.timesteps, arguments.subsets, arguments.runs, arguments.repeat, max_rows)
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {arguments.output}")
+        return 0
+
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+    with open(arguments.current) as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, arguments.threshold)
+    compared = [name for name in current["results"] if name in baseline["results"]]
+    print(f"Compared {len(compared)} cases against {arguments.baseline} (commit {baseline['metadata'].get('commit')})")
+    for (name, measure, baseline_value, value, ratio) in regressions:
+        unit = "MB" if measure == "peak_memory" else "s"
+        print(f"REGRESSION {name} {measure}: {baseline_value:.3f}{unit} -> {value:.3f}{unit} ({ratio:.2f}x)")
+    if not regressions:
+        print(f"No regressions above {arguments.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
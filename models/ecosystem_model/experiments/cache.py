@@ -0,0 +1,209 @@
+"""
+Content-addressed cache of post-processed results
+
+Results are cached per subset, keyed on a hash of:
+* the subset's System Parameters
+* the Initial State
+* the number of timesteps and Monte Carlo runs
+* the source code of the modules defining the model's Policy and State Update Functions
+  (`model/policy_functions.py`, `model/state_update_functions.py`), the State Update Block structure,
+  and `model/constants.py`
+* the engine and the precision of its results, and the source code of the modules it executes (e.g. `model/vectorized.py` and `experiments/vectorized.py`)
+  and of `experiments/post_processing.py`
+
+so adding one value to a parameter sweep only simulates the new subset, and any change to the model, its engine or
+the post-processing invalidates its cached results. The cache directory is limited in size, evicting the least recently used results.
+"""
+
+import copy
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from radcad.core import generate_parameter_sweep
+
+import model.constants
+from model.schedules import Schedule, json_default
+import model.fused
+import model.vectorized
+import experiments.fused as fused
+import experiments.post_processing as post_processing
+import experiments.vectorized as vectorized
+
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "data", "cache")
+DEFAULT_MAX_BYTES = 1024 ** 3 # 1 GB
+
+# Modules executed by each engine in place of the radCAD Policy and State Update Functions
+ENGINE_MODULES = {
+    "radcad": [],
+    "vectorized": [model.vectorized, vectorized],
+    "fused": [model.fused, fused],
+}
+
+
+def model_source_hash(state_update_blocks, engine="radcad"):
+    """Hash the State Update Block structure, the source of the modules its functions are defined in,
+    and the engine, the source of the modules it executes, and of the post-processing"""
+    functions = [
+        function
+        for block in state_update_blocks
+        for group in ["policies", "variables"]
+        for function in block[group].values()
+    ]
+    modules = sorted({inspect.getmodule(function).__name__: inspect.getmodule(function) for function in functions}.items())
+    structure = [
+        {group: {key: f"{function.__module__}.{function.__qualname__}" for (key, function) in block[group].items()}
+         for group in ["policies", "variables"]}
+        for block in state_update_blocks
+    ]
+
+    digest = hashlib.sha256(json.dumps({"structure": structure, "engine": engine}).encode())
+    sources = modules + [("model.constants", model.constants)] + [(module.__name__, module) for module in ENGINE_MODULES[engine]]
+    for (_name, module) in sources + [("experiments.post_processing", post_processing)]:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+
+def subset_key(param_set, initial_state, timesteps, runs, source_hash, precision=np.float64):
+    """Return the cache key of one subset of a Simulation
+
+    Scheduled System Parameters (see `model/schedules.py`) are keyed on their values over the horizon, so a schedule
+    defined by a function has the same key in every process.
+    """
+    parameters = {
+        key: {"schedule": value.dense(timesteps).tolist()} if isinstance(value, Schedule) else value
+        for (key, value) in param_set.items()
+    }
+    return hashlib.sha256(json.dumps({
+        "parameters": parameters,
+        "initial_state": initial_state,
+        "timesteps": timesteps,
+        "runs": runs,
+        "model": source_hash,
+        "precision": np.dtype(precision).name,
+    }, sort_keys=True, default=json_default).encode()).hexdigest()
+
+
+class ResultCache:
+    """Disk cache of post-processed results per subset, with least-recently-used eviction
+
+    Args:
+        directory (str): cache directory. Defaults to `data/cache`.
+        max_bytes (int): maximum total size of the cached results
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """Return the cached DataFrame, or None on a cache miss"""
+        path = self._path(key)
+        try:
+            df = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        # Record the access for least-recently-used eviction
+        os.utime(path)
+        return df
+
+    def put(self, key, df: pd.DataFrame):
+        path = self._path(key)
+        df.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the cache is within its size limit"""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        total = sum(size for (_mtime, size, _filename) in entries)
+        for (_mtime, size, filename) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, filename))
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def run(self, executable, execute, engine="radcad", precision=np.float64):
+        """Return the post-processed results of an Experiment or Simulation, only executing the subsets that are not cached
+
+        Args:
+            execute (Callable): executes a Simulation and returns the post-processed `(df, exceptions)`, e.g. `experiments/run.py::run`
+            engine (str): the engine `execute` simulates with, part of the cache key
+            precision: dtype of the State Variables `execute` returns, part of the cache key
+
+        Returns:
+            (pd.DataFrame, list): post-processed results in radCAD order, and the exceptions of executed runs
+        """
+        frames = []
+        exceptions = []
+        row_offset = 0
+
+        for (simulation_index, simulation) in enumerate(vectorized.simulations(executable)):
+            param_sweep = generate_parameter_sweep(simulation.model.params) or [simulation.model.params]
+            source_hash = model_source_hash(simulation.model.state_update_blocks, engine)
+            keys = [
+                subset_key(param_set, simulation.model.initial_state, simulation.timesteps, simulation.runs, source_hash, precision)
+                for param_set in param_sweep
+            ]
+
+            subset_frames = {subset: self.get(key) for (subset, key) in enumerate(keys)}
+            missing = [subset for (subset, df) in subset_frames.items() if df is None]
+            logging.info(f"Result cache: {len(param_sweep) - len(missing)} of {len(param_sweep)} subsets cached")
+
+            if missing:
+                missing_simulation = copy.deepcopy(simulation)
+                missing_simulation.model.params = {
+                    key: [param_sweep[subset][key] for subset in missing] for key in param_sweep[0]
+                }
+                df, missing_exceptions = execute(missing_simulation)
+
+                failed = set()
+                for exception in missing_exceptions:
+                    if exception["exception"] is not None:
+                        failed.add(missing[exception["subset"]])
+                    exceptions.append({**exception, "simulation": simulation_index, "subset": missing[exception["subset"]]})
+
+                for (local_subset, subset_df) in df.groupby("subset", sort=False):
+                    subset = missing[local_subset]
+                    subset_df = subset_df.reset_index(drop=True)
+                    if subset not in failed:
+                        self.put(keys[subset], subset_df)
+                    subset_frames[subset] = subset_df
+
+            for (subset, df) in subset_frames.items():
+                if df is None:
+                    continue
+                df = df.copy()
+                df["simulation"] = simulation_index
+                df["subset"] = subset
+                # Label rows by their position in the raw radCAD results, as in `run()`
+                df.index = (
+                    row_offset
+                    + ((df["run"].to_numpy() - 1) * len(param_sweep) + subset) * (simulation.timesteps + 1)
+                    + df["timestep"].to_numpy()
+                )
+                frames.append(df)
+
+            row_offset += simulation.runs * len(param_sweep) * (simulation.timesteps + 1)
+
+        if not frames:
+            return pd.DataFrame(), exceptions
+        return pd.concat(frames).sort_index(kind="stable"), exceptions
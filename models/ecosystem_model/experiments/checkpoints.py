@@ -0,0 +1,161 @@
+"""
+Checkpoints of runs, and forks of runs from a checkpoint with different System Parameters
+
+`Checkpoints` keeps the State Variables of every run every `interval` timesteps, captured from the raw results of
+`experiments/run.py::run`. `fork()` resumes the runs from the checkpoint of a timestep with overridden System Parameters,
+and only simulates the remaining timesteps, e.g. to change the `service_fee` on day 180:
+
+```python
+checkpoints = Checkpoints(interval=30)
+df, _exceptions = run(experiment, engine="vectorized", checkpoints=checkpoints)
+branches = fork(checkpoints, 180, [{"service_fee": 0.03}, {"service_fee": 0.08}])
+```
+
+Every subset of a checkpointed Simulation is forked into one subset per branch (subset `subset * len(branches) + branch`),
+with the same runs. A fork can capture its own checkpoints, so the branches of a scenario tree fork from their parent
+branch and share its simulated prefix, rather than simulating every path from the first timestep.
+
+Forks are executed with the vectorized engine, optionally in stochastic mode: the random streams of a run are skipped
+to the checkpoint, so a fork without overrides reproduces the original run.
+"""
+
+import numpy as np
+import pandas as pd
+from radcad.core import generate_parameter_sweep
+
+from experiments.post_processing import post_process
+import experiments.vectorized as vectorized
+
+
+INDEX_COLUMNS = ["simulation", "subset", "run", "timestep"]
+
+
+def simulation_records(executable):
+    """Return the configuration of each Simulation of an Experiment or Simulation, as recorded by `Checkpoints`"""
+    return [
+        {
+            "state_update_blocks": simulation.model.state_update_blocks,
+            "params": simulation.model.params,
+            "state_variables": list(simulation.model.initial_state),
+            "runs": simulation.runs,
+            "initial_timestep": 0,
+            "timesteps": simulation.timesteps,
+        }
+        for simulation in vectorized.simulations(executable)
+    ]
+
+
+class Checkpoints:
+    """State Variables of every run at every `interval` timesteps
+
+    Args:
+        interval (int): timesteps between checkpoints
+    """
+
+    def __init__(self, interval=30):
+        self.interval = interval
+        self.simulations = []
+        self.frames = []
+        self._states = None
+
+    def record(self, simulations):
+        """Start checkpointing Simulations, given their `simulation_records()`"""
+        self.simulations = simulations
+        self.frames = []
+        self._states = None
+
+    def capture(self, df: pd.DataFrame):
+        """Keep the rows of raw (not post-processed) results at checkpointed timesteps"""
+        state_variables = list(dict.fromkeys(key for simulation in self.simulations for key in simulation["state_variables"]))
+        checkpointed = df["timestep"].to_numpy() % self.interval == 0
+        self.frames.append(df.loc[checkpointed, INDEX_COLUMNS + state_variables].reset_index(drop=True))
+        self._states = None
+
+    @property
+    def states(self) -> pd.DataFrame:
+        """Checkpointed State Variables, indexed by simulation, subset, run and timestep"""
+        if self._states is None:
+            frames = self.frames or [pd.DataFrame(columns=INDEX_COLUMNS)]
+            self._states = pd.concat(frames, ignore_index=True).set_index(INDEX_COLUMNS).sort_index()
+        return self._states
+
+    @property
+    def timesteps(self):
+        """Checkpointed timesteps"""
+        return sorted(self.states.index.unique("timestep"))
+
+    def at(self, timestep) -> pd.DataFrame:
+        """Checkpointed State Variables of a timestep, indexed by simulation, subset and run"""
+        if timestep not in self.timesteps:
+            raise ValueError(f"No checkpoint at timestep {timestep}, checkpointed timesteps: {self.timesteps}")
+        return self.states.xs(timestep, level="timestep")
+
+
+def fork(checkpoints, timestep, branches=[{}], stochastic=None, capture=None, post_processing=True):
+    """Resume checkpointed runs from a timestep with overridden System Parameters, simulating only the remaining timesteps
+
+    Args:
+        checkpoints (Checkpoints): checkpoints of the runs to fork
+        timestep (int): checkpointed timestep to resume from
+        branches (list): System Parameter overrides of each branch, e.g. `[{"service_fee": 0.03}, {"service_fee": 0.08}]`
+        stochastic (Stochastic, optional): stochastic mode of the runs, see `model/stochastic.py`
+        capture (Checkpoints, optional): checkpoints of the forked runs, to fork them further
+        post_processing (bool): post-process the results, otherwise return the raw results (including the resumed checkpoint)
+
+    Returns:
+        pd.DataFrame: results of the timesteps after `timestep`, with a `branch` column
+
+    Raises:
+        ValueError: if `timestep` is not checkpointed, or every checkpointed run ends at or before it
+    """
+    states = checkpoints.at(timestep)
+    end = max(simulation["initial_timestep"] + simulation["timesteps"] for simulation in checkpoints.simulations)
+    if timestep >= end:
+        raise ValueError(f"Nothing to fork from timestep {timestep}: the checkpointed runs end at timestep {end}")
+    records = []
+    frames = []
+
+    for (simulation_index, simulation) in enumerate(checkpoints.simulations):
+        if not vectorized.supports(simulation["state_update_blocks"]):
+            raise ValueError("Forking requires State Update Blocks supported by the vectorized engine")
+        param_sweep = generate_parameter_sweep(simulation["params"]) or [simulation["params"]]
+        sweep = [{**param_set, **branch} for param_set in param_sweep for branch in branches]
+        params = {key: [param_set[key] for param_set in sweep] for key in sweep[0]}
+        remaining = simulation["initial_timestep"] + simulation["timesteps"] - timestep
+        records.append({**simulation, "params": params, "initial_timestep": timestep, "timesteps": max(remaining, 0)})
+        if simulation_index not in states.index.unique("simulation") or remaining <= 0:
+            continue
+
+        # One pair per checkpointed (subset, run) and branch, ordered run-major as in radCAD
+        simulation_states = states.xs(simulation_index, level="simulation")
+        subsets = simulation_states.index.get_level_values("subset").to_numpy()
+        runs = simulation_states.index.get_level_values("run").to_numpy() - 1
+        rows = np.repeat(np.arange(len(simulation_states)), len(branches))
+        branch = np.tile(np.arange(len(branches)), len(simulation_states))
+        order = np.lexsort([branch, subsets[rows], runs[rows]])
+        rows, branch = rows[order], branch[order]
+
+        initial_state = {
+            key: simulation_states[key].to_numpy(dtype=np.float64)[rows] for key in simulation["state_variables"]
+        }
+        frames.append(pd.DataFrame(vectorized.simulate(
+            initial_state,
+            simulation["state_update_blocks"],
+            params,
+            remaining,
+            simulation_index=simulation_index,
+            indices=list(zip(runs[rows], subsets[rows] * len(branches) + branch)),
+            stochastic=stochastic,
+            initial_timestep=timestep,
+        )))
+
+    df = pd.concat(frames, ignore_index=True)
+    df["branch"] = df["subset"] % len(branches)
+    if capture is not None:
+        capture.record(records)
+        capture.capture(df)
+
+    if not post_processing:
+        return df
+    df = df[df["timestep"] > timestep].reset_index(drop=True)
+    return post_process(df, parameters=records[0]["params"])
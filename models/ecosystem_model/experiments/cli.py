@@ -0,0 +1,217 @@
+"""
+Command-line entry point for headless experiments
+
+Executes the default experiment (`experiments/default_experiment.py`) with System Parameter overrides and sweeps,
+and writes the results to a file. Only the modules the chosen engine and output need are imported:
+* `.npz` output writes the raw result columns (including timestep 0) and the System Parameters of each subset with NumPy,
+  without importing pandas, which dominates the start-up time of short runs
+* other outputs (`.csv`, `.parquet`, `.feather`, `.pkl`) write post-processed results (see `experiments/run.py::run`)
+* without an output, the post-processed results of the last timestep are printed as CSV
+
+Usage:
+
+    python -m experiments.cli [--engine vectorized] [--timesteps 365] [--runs 1]
+        [--set service_fee=0.05 ...] [--sweep avg_host_line=10,25,50 ...]
+        [--design latin_hypercube --range avg_host_line=10:50 ... --samples 16 --seed 0]
+        [--precision float32] [--output results.npz]
+
+`--sweep` lists are zipped as in radCAD, `--design` replaces them with a design of `experiments/sweeps.py`.
+Plotting and notebook dependencies are never imported.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import sys
+import time
+
+
+ENGINES = ["radcad", "vectorized", "fused"]
+DESIGNS = ["latin_hypercube", "sobol_sequence", "one_at_a_time"]
+PRECISIONS = ["float64", "float32"]
+DATAFRAME_WRITERS = {".csv": "to_csv", ".parquet": "to_parquet", ".feather": "to_feather", ".pkl": "to_pickle"}
+
+
+def _value(name, text):
+    """Parse a System Parameter value, a number
+
+    Raises:
+        ValueError: for non-numeric values, which would otherwise only fail inside the engine
+    """
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        value = None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"System Parameter {name} must be a number, got {text!r}")
+    return value
+
+
+def _assignment(text):
+    name, separator, value = text.partition("=")
+    if not separator or not name:
+        raise argparse.ArgumentTypeError(f"Expected name=value, got {text}")
+    return name, value
+
+
+def parser():
+    parser = argparse.ArgumentParser(prog="python -m experiments.cli", description="Execute the default experiment headless")
+    parser.add_argument("--engine", choices=ENGINES, default="vectorized")
+    parser.add_argument("--timesteps", type=int, help="timesteps per run. Defaults to the Simulation Configuration.")
+    parser.add_argument("--runs", type=int, help="Monte Carlo runs. Defaults to the Simulation Configuration.")
+    parser.add_argument("--set", type=_assignment, action="append", default=[], metavar="NAME=VALUE",
+                        help="override a System Parameter with a number")
+    parser.add_argument("--sweep", type=_assignment, action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="sweep a System Parameter over comma-separated numbers")
+    parser.add_argument("--design", choices=DESIGNS, help="sweep design of `experiments/sweeps.py`")
+    parser.add_argument("--range", type=_assignment, action="append", default=[], metavar="NAME=LOW:HIGH",
+                        help="System Parameter range of a latin_hypercube or sobol_sequence design")
+    parser.add_argument("--samples", type=int, help="subsets of a latin_hypercube or sobol_sequence design")
+    parser.add_argument("--seed", type=int, help="seed of a latin_hypercube or sobol_sequence design")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float64",
+                        help="dtype of the simulated State Variables, float32 halves the size of the results (vectorized and fused engines)")
+    parser.add_argument("--output", help=f"output path: .npz, or {', '.join(DATAFRAME_WRITERS)}")
+    parser.add_argument("--quiet", action="store_true", help="only log warnings")
+    return parser
+
+
+def configure(arguments):
+    """Return a copy of the default experiment configured by the command-line arguments
+
+    Raises:
+        ValueError: for unknown System Parameters, or non-numeric values
+    """
+    from experiments.default_experiment import experiment
+    from model.system_parameters import parameters
+
+    overrides = {name: [_value(name, value)] for (name, value) in arguments.set}
+    overrides.update({name: [_value(name, value) for value in values.split(",")] for (name, values) in arguments.sweep})
+    unknown = set(overrides) - set(parameters)
+    if unknown:
+        raise ValueError(f"Unknown System Parameters {sorted(unknown)}")
+
+    executable = copy.deepcopy(experiment)
+    for simulation in executable.simulations:
+        simulation.model.params.update(overrides)
+        if arguments.timesteps is not None:
+            simulation.timesteps = arguments.timesteps
+        if arguments.runs is not None:
+            simulation.runs = arguments.runs
+    return executable
+
+
+def design(arguments):
+    """Subset table of the `--design` arguments, or None"""
+    if arguments.design is None:
+        return None
+    import experiments.sweeps as sweeps
+
+    if arguments.design == "one_at_a_time":
+        values = {name: [_value(name, value) for value in values.split(",")] for (name, values) in arguments.sweep}
+        return sweeps.one_at_a_time(values)
+    ranges = {name: tuple(float(bound) for bound in bounds.split(":")) for (name, bounds) in arguments.range}
+    if arguments.samples is None:
+        raise ValueError(f"A {arguments.design} design requires --samples")
+    return getattr(sweeps, arguments.design)(ranges, arguments.samples, arguments.seed)
+
+
+def raw_columns(executable, engine, precision="float64"):
+    """Simulate an Experiment, returning its raw result columns as NumPy arrays, without pandas"""
+    import numpy as np
+
+    if engine == "radcad":
+        executable.run()
+        return {key: np.array([row[key] for row in executable.results]) for key in executable.results[0]}
+
+    if engine == "vectorized":
+        from experiments.vectorized import simulate
+    else:
+        from experiments.fused import simulate
+    frames = []
+    for (simulation_index, simulation) in enumerate(executable.simulations):
+        frames.append(simulate(
+            simulation.model.initial_state,
+            simulation.model.state_update_blocks,
+            simulation.model.params,
+            simulation.timesteps,
+            simulation.runs,
+            simulation_index,
+            precision=precision,
+        ))
+    return {key: np.concatenate([columns[key] for columns in frames]) for key in frames[0]}
+
+
+def write_npz(path, executable, engine, precision="float64"):
+    """Write the raw result columns, and the numeric System Parameters of each subset as `params/<name>` arrays
+
+    Scheduled System Parameters (see `model/schedules.py`) are written as (subsets, timesteps + 1) arrays of their value
+    at each timestep.
+    """
+    import numpy as np
+    from radcad.core import generate_parameter_sweep
+    from model.schedules import Schedule
+
+    columns = raw_columns(executable, engine, precision)
+    params = executable.simulations[0].model.params
+    timesteps = executable.simulations[0].timesteps
+    param_sweep = generate_parameter_sweep(params) or [params]
+    for name in params:
+        values = [param_set[name] for param_set in param_sweep]
+        if any(isinstance(value, Schedule) for value in values):
+            columns[f"params/{name}"] = np.array([
+                value.dense(timesteps) if isinstance(value, Schedule) else np.full(timesteps + 1, value, dtype=np.float64)
+                for value in values
+            ])
+            continue
+        values = np.array(values)
+        if values.dtype.kind in "biuf":
+            columns[f"params/{name}"] = values
+    np.savez(path, **columns)
+    return len(columns["timestep"])
+
+
+def main(argv=None):
+    arguments = parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if arguments.quiet else logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if arguments.design is None and (arguments.range or arguments.samples is not None):
+        parser().error("--range and --samples require --design")
+    if arguments.precision != "float64" and arguments.engine == "radcad":
+        parser().error("--precision requires the vectorized or fused engine")
+
+    start_time = time.perf_counter()
+    try:
+        executable = configure(arguments)
+        table = design(arguments)
+    except ValueError as e:
+        parser().error(str(e))
+
+    if arguments.output is not None and arguments.output.endswith(".npz"):
+        if table is not None:
+            parser().error("A --design requires a post-processed output, not .npz")
+        rows = write_npz(arguments.output, executable, arguments.engine, arguments.precision)
+        logging.info(f"Wrote {rows} raw rows to {arguments.output} in {time.perf_counter() - start_time:.2f} seconds")
+        return 0
+
+    writer = None
+    if arguments.output is not None:
+        extension = "." + arguments.output.rsplit(".", 1)[-1]
+        writer = DATAFRAME_WRITERS.get(extension)
+        if writer is None:
+            parser().error(f"Unknown output format {extension}, expected .npz or one of {list(DATAFRAME_WRITERS)}")
+
+    from experiments.run import run
+
+    df, exceptions = run(executable, engine=arguments.engine, design=table, precision=arguments.precision)
+    if exceptions:
+        logging.warning(f"{len(exceptions)} runs failed")
+    if writer is None:
+        df[df["timestep"] == df["timestep"].max()].to_csv(sys.stdout, index=False)
+    else:
+        getattr(df.reset_index(drop=True), writer)(arguments.output)
+        logging.info(f"Wrote {len(df)} rows to {arguments.output} in {time.perf_counter() - start_time:.2f} seconds")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Columnar result collection
+
+Instead of building one dictionary per timestep per run and letting pandas convert the list of dictionaries
+back into columns, `ColumnarCollector` writes each State Variable straight into a preallocated typed NumPy
+column while the simulation runs: float64 for State Variables, int32 for the simulation/subset/run/substep/timestep
+index columns. `ColumnarCollector.to_dataframe()` hands those columns to pandas without copying.
+
+`single_run()` executes a run with the same substep semantics as radCAD (`radcad.core._single_run` with
+`drop_substeps=True`), keeping only the previous and current state in memory.
+"""
+
+import copy
+import logging
+import pickle
+import traceback
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from radcad.core import generate_parameter_sweep, reduce_signals, _update_state
+
+import experiments.vectorized as vectorized
+
+
+INDEX_COLUMNS = ["simulation", "subset", "run", "substep", "timestep"]
+
+
+class ColumnarCollector:
+    """Preallocated typed result columns
+
+    Args:
+        state_variables (list): State Variable keys, in result column order
+        rows (int): capacity, the maximum number of result rows
+    """
+
+    def __init__(self, state_variables, rows):
+        self.state_variables = list(state_variables)
+        self.values = np.empty((len(self.state_variables), rows), dtype=np.float64)
+        self.index = np.empty((len(INDEX_COLUMNS), rows), dtype=np.int32)
+        self.rows = 0
+
+    def append(self, state):
+        """Write a state (including the index columns) to the next result row"""
+        row = self.rows
+        for (column, key) in enumerate(self.state_variables):
+            self.values[column, row] = state[key]
+        for (column, key) in enumerate(INDEX_COLUMNS):
+            self.index[column, row] = state[key]
+        self.rows += 1
+
+    def to_dataframe(self):
+        """Return the collected rows as a DataFrame backed by the collector's arrays (no copy)"""
+        return pd.concat(
+            [
+                pd.DataFrame(self.values[:, :self.rows].T, columns=self.state_variables, copy=False),
+                pd.DataFrame(self.index[:, :self.rows].T, columns=INDEX_COLUMNS, copy=False),
+            ],
+            axis=1,
+            copy=False,
+        )
+
+
+def single_run(collector, simulation, timesteps, run, subset, initial_state, state_update_blocks, params, deepcopy):
+    """Execute a single run, writing the final substep of every timestep to the collector
+
+    Policy and State Update Functions receive an empty `state_history`, as the history is not kept as dictionaries.
+    """
+    logging.info(f"Starting simulation {simulation} / run {run} / subset {subset}")
+
+    state = {
+        **initial_state,
+        "simulation": simulation,
+        "subset": subset,
+        "run": run + 1,
+        "substep": 0,
+        "timestep": 0,
+    }
+    collector.append(state)
+
+    state_history = []
+    for timestep in range(0, timesteps):
+        substate = state
+        for (substep, psu) in enumerate(state_update_blocks):
+            substate = substate.copy()
+            substate_copy = pickle.loads(pickle.dumps(substate, -1)) if deepcopy else substate.copy()
+            substate["substep"] = substep + 1
+
+            signals = reduce_signals(params, substep, state_history, substate_copy, psu, deepcopy)
+
+            substate.update(map(
+                partial(_update_state, initial_state, params, substep, state_history, substate_copy, signals),
+                psu["variables"].items()
+            ))
+            substate["timestep"] = timestep + 1
+        state = substate
+        collector.append(state)
+
+
+def run(executable):
+    """Execute a radCAD Experiment or Simulation, collecting results into typed columns
+
+    Follows `Engine.raise_exceptions` of each Simulation: either raise, or keep the partial results and
+    return the exceptions in the radCAD format.
+
+    Returns:
+        (pd.DataFrame, list): raw results in radCAD order, and the exceptions of failed runs
+    """
+    simulations = vectorized.simulations(executable)
+    sweeps = [generate_parameter_sweep(simulation.model.params) or [simulation.model.params] for simulation in simulations]
+    rows = sum(
+        simulation.runs * len(param_sweep) * (simulation.timesteps + 1)
+        for (simulation, param_sweep) in zip(simulations, sweeps)
+    )
+    collector = ColumnarCollector(simulations[0].model.initial_state, rows)
+
+    exceptions = []
+    for (simulation_index, (simulation, param_sweep)) in enumerate(zip(simulations, sweeps)):
+        for run in range(simulation.runs):
+            for (subset, param_set) in enumerate(param_sweep):
+                try:
+                    single_run(
+                        collector,
+                        simulation_index,
+                        simulation.timesteps,
+                        run,
+                        subset,
+                        copy.deepcopy(simulation.model.initial_state),
+                        simulation.model.state_update_blocks,
+                        copy.deepcopy(param_set),
+                        simulation.engine.deepcopy,
+                    )
+                except Exception as error:
+                    if simulation.engine.raise_exceptions:
+                        raise
+                    logging.warning(f"Simulation {simulation_index} / run {run} / subset {subset} failed!")
+                    exceptions.append({
+                        "exception": error,
+                        "traceback": traceback.format_exc(),
+                        "simulation": simulation_index,
+                        "run": run,
+                        "subset": subset,
+                        "timesteps": simulation.timesteps,
+                        "parameters": param_set,
+                        "initial_state": simulation.model.initial_state,
+                    })
+
+    return collector.to_dataframe(), exceptions
+
+
+if __name__ == '__main__':
+    # Report the peak resident set size of the list-of-dicts and columnar result paths,
+    # each measured in a fresh Python process, e.g. `python -m experiments.collector 1000`
+    import resource
+    import subprocess
+    import sys
+
+    subsets = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    script = f"""
+import copy, logging, resource
+import pandas as pd
+from experiments.default_experiment import experiment
+import experiments.collector as collector
+
+logging.disable(logging.INFO)
+experiment = copy.deepcopy(experiment)
+experiment.simulations[0].model.params["host_setup_delay"] = list(range(1, {subsets} + 1))
+if "{{path}}" == "columnar":
+    df, _exceptions = collector.run(experiment)
+else:
+    experiment.run()
+    df = pd.DataFrame(experiment.results)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+    # ru_maxrss is reported in kilobytes on Linux, and bytes on macOS
+    unit = 1024 ** 2 if sys.platform == "darwin" else 1024
+    for path in ["list-of-dicts", "columnar"]:
+        output = subprocess.run(
+            [sys.executable, "-c", script.replace("{path}", path)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        print(f"{path}: peak RSS {int(output.split()[-1]) / unit:.1f} MB ({subsets} subsets)")
@@ -0,0 +1,93 @@
+"""
+Steady-state detection for long-horizon runs
+
+Many runs flatten out long before the final timestep, e.g. once `potential_users` reaches 0 and `network_penetration`
+is clamped at 1. `Convergence` stops a run once the chosen State Variables have stayed within a tolerance of their
+previous value for a number of consecutive timesteps, and then either:
+* pads the remaining timesteps with the final state, so results keep the same rows as a full run, or
+* truncates the run, dropping the remaining timesteps and marking every row of the run with `truncated == True`
+
+Supported by the "vectorized" and "fused" engines, which stop stepping converged (run, subset) pairs.
+"""
+
+import numpy as np
+
+
+class Convergence:
+    """Steady-state criterion for the "vectorized" and "fused" engines
+
+    A timestep is stable when every monitored State Variable changed by at most
+    `tolerance * max(1, abs(previous value))`, i.e. an absolute tolerance for values below 1 and a relative one above.
+
+    Args:
+        state_variables (list, optional): State Variables to monitor. Defaults to all State Variables.
+        tolerance (float): tolerance of the change in each State Variable per timestep
+        steps (int): number of consecutive stable timesteps after which a run is stopped
+        truncate (bool): drop the timesteps after a run is stopped, instead of padding them with the final state
+    """
+
+    def __init__(self, state_variables=None, tolerance=1e-9, steps=10, truncate=False):
+        if steps < 1:
+            raise ValueError("The number of stable timesteps must be at least 1")
+        self.state_variables = state_variables
+        self.tolerance = tolerance
+        self.steps = steps
+        self.truncate = truncate
+
+    def keys(self, state_variables):
+        """Return the monitored State Variables, in the given State Variable order"""
+        if self.state_variables is None:
+            return list(state_variables)
+        unknown = set(self.state_variables) - set(state_variables)
+        if unknown:
+            raise ValueError(f"Unknown State Variables {sorted(unknown)}")
+        return [key for key in state_variables if key in self.state_variables]
+
+    def stable(self, previous_value, value):
+        """Return whether a change in a State Variable (scalar or array) is within the tolerance"""
+        return abs(value - previous_value) <= self.tolerance * np.maximum(1, abs(previous_value))
+
+    def monitor(self, state_variables, size):
+        return ConvergenceMonitor(self, state_variables, size)
+
+    def rows(self, stopped, timesteps):
+        """Return the number of result rows of each run, given the last simulated timestep of each run"""
+        return stopped + 1 if self.truncate else np.full(len(stopped), timesteps + 1)
+
+    def finish(self, history, stopped):
+        """Pad or truncate the history of runs stopped before the final timestep
+
+        Args:
+            history (np.ndarray): (runs, timesteps + 1, ...) history, padded in place
+            stopped (np.ndarray): last simulated timestep of each run
+
+        Returns:
+            np.ndarray: the history with runs and timesteps flattened into the first axis
+        """
+        after = np.arange(history.shape[1])[None, :] > stopped[:, None]
+        if self.truncate:
+            return history[~after]
+        final = history[np.arange(len(stopped)), stopped]
+        history[after] = np.broadcast_to(final[:, None], history.shape)[after]
+        return history.reshape(-1, *history.shape[2:])
+
+
+class ConvergenceMonitor:
+    """Counts consecutive stable timesteps of the (run, subset) pairs being stepped together by the vectorized engine"""
+
+    def __init__(self, convergence, state_variables, size):
+        self.convergence = convergence
+        self.keys = convergence.keys(state_variables)
+        self.counts = np.zeros(size, dtype=np.int64)
+
+    def update(self, previous_state, state):
+        """Record a timestep, returning a boolean array of the pairs that have converged"""
+        stable = np.ones(len(self.counts), dtype=bool)
+        for key in self.keys:
+            stable &= self.convergence.stable(previous_state[key], state[key])
+        self.counts = np.where(stable, self.counts + 1, 0)
+        return self.counts >= self.convergence.steps
+
+    def keep(self, mask):
+        """Keep only the pairs in the mask, after removing the converged pairs from the state"""
+        self.counts = self.counts[mask]
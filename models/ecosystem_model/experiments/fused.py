@@ -0,0 +1,166 @@
+"""
+Fused simulation engine
+
+Executes each (run, subset) pair with the fused single-step kernel in `model/fused.py`. Each run is stepped in place
+between two state buffers, and the State Variables of every timestep are stored in a preallocated structured array
+(see `model/state_variables.py::state_dtype`). Returns the same raw result columns as
+`pd.DataFrame(executable.results)` from radCAD with `drop_substeps=True`.
+
+pandas is only imported by the functions returning DataFrames, so that `simulate()` starts without it (see `experiments/cli.py`).
+"""
+
+import numpy as np
+from radcad.core import generate_parameter_sweep
+
+from model.fused import compile_step
+from model.state_variables import state_dtype
+import model.schedules as schedules
+import experiments.vectorized as vectorized
+
+
+def _steps(param_set, state_variables, state_update_blocks, timesteps):
+    """Return the step function of every timestep of a parameter set
+
+    With scheduled System Parameters (see `model/schedules.py`), a step function is compiled for each distinct
+    combination of their values, e.g. once per tariff of a piecewise schedule.
+    """
+    keys = schedules.scheduled(param_set)
+    if not keys:
+        return [compile_step(param_set, state_variables, state_update_blocks)] * (timesteps + 1)
+
+    schedules.densify([param_set], timesteps)
+    compiled = {}
+    steps = []
+    for timestep in range(timesteps + 1):
+        values = tuple(param_set[key][timestep] for key in keys)
+        if values not in compiled:
+            compiled[values] = compile_step(schedules.at(param_set, timestep, keys), state_variables, state_update_blocks)
+        steps.append(compiled[values])
+    return steps
+
+
+def simulate(initial_state, state_update_blocks, params, timesteps, runs=1, simulation_index=0, indices=None, convergence=None, precision=np.float64):
+    """Execute a Simulation's (run, subset) pairs with the fused kernel
+
+    Args:
+        indices (list, optional): (run, subset) pairs to simulate. Defaults to every pair, ordered run-major as in radCAD.
+        convergence (Convergence, optional): stop runs that reach a steady state, see `experiments/convergence.py`
+        precision: dtype of the stored State Variables, e.g. np.float32 to halve the size of the results.
+            Runs are stepped in double precision either way.
+
+    Returns:
+        dict: result columns, each a NumPy array of length len(indices) * (timesteps + 1), unless runs are truncated
+    """
+    param_sweep = generate_parameter_sweep(params) or [params]
+    if indices is None:
+        indices = [(run, subset) for run in range(runs) for subset in range(len(param_sweep))]
+
+    state_variables = list(initial_state)
+    steps = [_steps(param_set, state_variables, state_update_blocks, timesteps) for param_set in param_sweep]
+    if convergence is not None:
+        monitored = [state_variables.index(key) for key in convergence.keys(state_variables)]
+        tolerance = convergence.tolerance
+
+    rows = timesteps + 1
+    history = np.empty(len(indices) * rows, dtype=state_dtype(state_variables, precision))
+    stopped = np.full(len(indices), timesteps)
+    for (position, (_run, subset)) in enumerate(indices):
+        subset_steps = steps[subset]
+        state = [float(initial_state[key]) for key in state_variables]
+        # Each step writes into the buffer of the state before the previous one
+        buffer = [0.0] * len(state_variables)
+        start = position * rows
+        history[start] = tuple(state)
+        stable = 0
+        for timestep in range(1, rows):
+            previous_state, state = state, subset_steps[timestep](state, buffer)
+            buffer = previous_state
+            history[start + timestep] = tuple(state)
+
+            if convergence is not None:
+                if all(abs(state[i] - previous_state[i]) <= tolerance * max(1, abs(previous_state[i])) for i in monitored):
+                    stable += 1
+                    if stable >= convergence.steps:
+                        stopped[position] = timestep
+                        break
+                else:
+                    stable = 0
+
+    if convergence is None:
+        run_rows = np.full(len(indices), rows)
+    else:
+        history = convergence.finish(history.reshape(len(indices), rows), stopped)
+        run_rows = convergence.rows(stopped, timesteps)
+
+    columns = {key: history[key] for key in state_variables}
+    columns.update(vectorized.index_columns(
+        simulation_index,
+        np.array([run for (run, _subset) in indices], dtype=np.int64),
+        np.array([subset for (_run, subset) in indices], dtype=np.int64),
+        run_rows,
+        len(state_update_blocks),
+    ))
+    if convergence is not None and convergence.truncate:
+        columns["truncated"] = np.repeat(stopped < timesteps, run_rows)
+
+    return columns
+
+
+def run(executable, convergence=None, precision=np.float64):
+    """Execute a radCAD Experiment or Simulation with the fused kernel
+
+    Args:
+        convergence (Convergence, optional): see `experiments/convergence.py`
+        precision: dtype of the stored State Variables, see `simulate()`
+
+    Returns:
+        pd.DataFrame: raw (not post-processed) results, with the same columns and row order as radCAD
+    """
+    import pandas as pd
+
+    return pd.concat(
+        [
+            pd.DataFrame(simulate(
+                simulation.model.initial_state,
+                simulation.model.state_update_blocks,
+                simulation.model.params,
+                simulation.timesteps,
+                simulation.runs,
+                simulation_index,
+                convergence=convergence,
+                precision=precision,
+            ))
+            for (simulation_index, simulation) in enumerate(vectorized.simulations(executable))
+        ],
+        ignore_index=True,
+    )
+
+
+def validate(executable, rtol=1e-9, atol=1e-6):
+    """Check that the fused kernel reproduces the radCAD results of an Experiment or Simulation,
+    e.g. after updating `model/fused.py` to a changed Policy or State Update Function
+
+    Raises:
+        AssertionError: if any State Variable differs by more than the given tolerance
+
+    Returns:
+        float: the maximum absolute difference across all State Variables
+    """
+    import pandas as pd
+
+    executable.run()
+    return vectorized.compare(pd.DataFrame(executable.results), run(executable), rtol, atol)
+
+
+if __name__ == '__main__':
+    import copy
+
+    from experiments.default_experiment import experiment
+
+    validation_experiment = copy.deepcopy(experiment)
+    validation_experiment.simulations[0].runs = 2
+    validation_experiment.simulations[0].model.params.update({
+        "host_setup_delay": [14, 30, 90],
+        "avg_client_allocation": [5, 10, 20, 40],
+    })
+    print(f"Maximum absolute difference to radCAD: {validate(validation_experiment)}")
@@ -22,4 +22,8 @@ sys.path.append("../../..")
 pd.options.mode.chained_assignment = 'raise'
 
 # Set plotly as the default plotting backend for pandas
-pd.options.plotting.backend = "plotly"
\ No newline at end of file
+pd.options.plotting.backend = "plotly"
+
+# Log experiment progress to the notebook output
+from experiments.run import configure_logging
+configure_logging()
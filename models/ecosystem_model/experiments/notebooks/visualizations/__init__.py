@@ -6,6 +6,14 @@ import plotly.graph_objects as go
 from ipywidgets import widgets
 from plotly.subplots import make_subplots
 
+from experiments.notebooks.visualizations.data import (
+    animation_frames,
+    downsample,
+    lttb,
+    min_max,
+    surface,
+    DEFAULT_POINTS,
+)
 from experiments.notebooks.visualizations.plotly_theme import (
     cadlabs_colors,
     cadlabs_colorway_sequence,
@@ -22,19 +30,22 @@ pd.options.plotting.backend = "plotly"
 
 # 3D Surface
 
-def plot_surface(df):
-        grouped = df.groupby(["avg_price", "clients"]).last()["hosts"]
+# Plotly axis of a State Variable, by column; other columns are titled by their name
+AXES = {
+    "avg_price": {"title": {"text": "AVG Price (ZAR/Mbps/Day)"}, "type": "log"},
+    "clients": {"title": {"text": "Clients"}},
+    "hosts": {"title": {"text": "Hosts"}},
+}
 
-        x = df.groupby(["run"]).first()["avg_price"].unique()
-        y = df.groupby(["run"]).first()["clients"].unique()
-        z = []
 
-        for avg_price in y:
-            row = []
-            for clients in x:
-                z_value = grouped[avg_price][clients]
-                row.append(z_value)
-            z.append(row)
+def axis(column):
+    return AXES.get(column, {"title": {"text": column.replace("_", " ").title()}})
+
+
+def plot_surface(df, x="avg_price", y="clients", z="hosts", bins=None):
+        """3D surface of the last value of `z` over `x` and `y`, see `data.surface()` for `bins`"""
+        scene = {"xaxis": axis(x), "yaxis": axis(y), "zaxis": axis(z)}
+        x, y, z = surface(df, x, y, z, bins)
 
         fig = go.Figure(
             data=[
@@ -61,19 +72,29 @@ def plot_surface(df):
             autosize=False,
             legend_title="",
             margin=dict(l=65, r=50, b=65, t=90),
-            scene={
-                "xaxis": {
-                    "title": {"text": "AVG Price (ZAR/Mbps/Day)"},
-                    "type": "log",
-                },
-                "yaxis": {"title": {"text": "Clients"}},
-                "zaxis": {"title": {"text": "Hosts"}},
-            },
+            scene=scene,
         )
 
         return fig
 
 
+# Time series
+
+def plot_line(df, y, x="timestep", animation_frame=None, points=DEFAULT_POINTS, statistic="mean", **kwargs):
+    """`px.line()` of results downsampled to `points` points per series
+
+    With an `animation_frame`, the runs and subsets of each frame are aggregated by `statistic` (see `data.animation_frames()`),
+    otherwise each run of each subset is downsampled (see `data.downsample()`).
+    `y` is a column or a list of columns, as in `px.line()`.
+    """
+    columns = [y] if isinstance(y, str) else list(y)
+    if animation_frame is not None:
+        df = animation_frames(df, animation_frame, columns, x, statistic, points=points)
+    else:
+        df = downsample(df, x, columns, points)
+    return px.line(df, x=x, y=y, animation_frame=animation_frame, **kwargs)
+
+
 
 """
     def plot_validator_environment_yield_surface(df):
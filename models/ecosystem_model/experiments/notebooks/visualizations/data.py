@@ -0,0 +1,187 @@
+"""
+Plotting data layer for large sweeps
+
+Reduces results to what a figure can show before they are passed to plotly, so figures of thousands of subsets and long
+horizons render quickly in the browser:
+* `surface()`: Z grid of a 3D surface by a vectorized pivot, optionally binned to a grid size
+* `lttb()` and `min_max()`: indices of a time series downsampled to a number of points, e.g. the figure's width in pixels.
+  Largest-Triangle-Three-Buckets keeps the visual shape of a series, min-max keeps every extreme.
+* `downsample()`: rows of a results DataFrame downsampled per series
+* `animation_frames()`: per-frame aggregates of an `animation_frame` figure, with a bounded number of frames and points
+
+Plotly is not imported, so the data layer can be used and profiled without a notebook.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# About the plot area width of a notebook figure in pixels
+DEFAULT_POINTS = 1000
+DEFAULT_FRAMES = 100
+
+
+def surface(df: pd.DataFrame, x="avg_price", y="clients", z="hosts", bins=None):
+    """Z grid of a 3D surface, with the last value of `z` in each (x, y) cell
+
+    Args:
+        bins (int, optional): bin `x` and `y` into this many equal-width bins, averaging `z` over the cells of each bin,
+            so the grid size does not depend on the number of distinct values
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): sorted x and y values (bin centres if binned), and the Z grid with one row
+            per y value and one column per x value, NaN where no results fall in a cell
+    """
+    if bins is None:
+        grid = df.groupby([y, x], sort=True)[z].last().unstack(x)
+        return grid.columns.to_numpy(), grid.index.to_numpy(), grid.to_numpy(dtype=np.float64)
+
+    cells = df.groupby([y, x], sort=False)[z].last().reset_index()
+    x_bins, x_centres = _bins(cells[x].to_numpy(dtype=np.float64), bins)
+    y_bins, y_centres = _bins(cells[y].to_numpy(dtype=np.float64), bins)
+    cell = y_bins * bins + x_bins
+    totals = np.bincount(cell, cells[z].to_numpy(dtype=np.float64), minlength=bins * bins)
+    counts = np.bincount(cell, minlength=bins * bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grid = (totals / counts).reshape(bins, bins)
+    return x_centres, y_centres, grid
+
+
+def _bins(values, bins):
+    edges = np.linspace(values.min(), values.max(), bins + 1)
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, bins - 1), (edges[:-1] + edges[1:]) / 2
+
+
+def lttb(x, y, points=DEFAULT_POINTS):
+    """Largest-Triangle-Three-Buckets downsampling
+
+    Args:
+        x (np.ndarray): sorted x values, shared by every series
+        y (np.ndarray): values of one series, or (series, len(x)) values of several series sharing `x`
+        points (int): points to keep, including the first and last
+
+    Returns:
+        np.ndarray: sorted indices of the kept points, with the shape of `y` with its last axis reduced to `points`
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+    length = len(x)
+    if points >= length or points < 3:
+        indices = np.broadcast_to(np.arange(length), y.shape)
+        return indices[0] if single else indices
+
+    # Bucket i (1 ... points - 2) spans indices [edges[i - 1], edges[i]), the first and last points are buckets of their own
+    edges = (np.floor(np.arange(points - 1) * (length - 2) / (points - 2)) + 1).astype(np.int64)
+    edges[-1] = length - 1
+    rows = np.arange(len(y))
+    selected = np.empty((len(y), points), dtype=np.int64)
+    selected[:, 0] = 0
+    selected[:, -1] = length - 1
+    previous = np.zeros(len(y), dtype=np.int64)
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average point, or the last point
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[end:next_end].mean()
+        next_y = y[:, end:next_end].mean(axis=1)
+        previous_x, previous_y = x[previous], y[rows, previous]
+        areas = np.abs(
+            (previous_x - next_x)[:, None] * (y[:, start:end] - previous_y[:, None])
+            - (previous_x[:, None] - x[start:end]) * (next_y - previous_y)[:, None]
+        )
+        previous = start + np.argmax(areas, axis=1)
+        selected[:, bucket + 1] = previous
+
+    return selected[0] if single else selected
+
+
+def min_max(x, y, points=DEFAULT_POINTS):
+    """Min-max downsampling: the first and last points, and the minimum and maximum of `points // 2 - 1` equal buckets
+
+    Args:
+        x (np.ndarray): sorted x values
+        y (np.ndarray): values of one series
+
+    Returns:
+        np.ndarray: sorted unique indices of the kept points, at most `points`
+    """
+    y = np.asarray(y, dtype=np.float64)
+    length = len(y)
+    buckets = points // 2 - 1
+    if points >= length or buckets < 1:
+        return np.arange(length)
+
+    bucket = np.arange(length) * buckets // length
+    # Sorted by bucket then value, so each bucket's minimum is its first index and its maximum its last
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], length) - 1
+    return np.unique(np.concatenate([[0, length - 1], order[starts], order[ends]]))
+
+
+def downsample(df: pd.DataFrame, x="timestep", columns=None, points=DEFAULT_POINTS, method="lttb", by=("subset", "run")):
+    """Downsample the rows of every series of results to about `points` points
+
+    A row is kept if it is selected for any of `columns`, so a wide DataFrame can be plotted with `px.line(df, x, y=columns)`.
+
+    Args:
+        x (str): column of the x axis, sorted within each series
+        columns (str or list, optional): column(s) plotted on the y axis. Defaults to every numeric column but `x` and `by`.
+        method (str): "lttb" or "min_max", see `lttb()` and `min_max()`
+        by (tuple): columns identifying each series, e.g. subset and run. Missing columns are ignored.
+
+    Returns:
+        pd.DataFrame: the kept rows, in their original order
+    """
+    if method not in ["lttb", "min_max"]:
+        raise ValueError(f"Unknown downsampling method {method}")
+    by = [column for column in by if column in df.columns]
+    if columns is None:
+        columns = [column for column in df.select_dtypes("number").columns if column != x and column not in by]
+    elif isinstance(columns, str):
+        columns = [columns]
+
+    groups = df.groupby(by, sort=False).indices if by else {None: np.arange(len(df))}
+    lengths = {len(indices) for indices in groups.values()}
+    keep = np.zeros(len(df), dtype=bool)
+    if method == "lttb" and len(lengths) == 1:
+        # Series of equal length are downsampled together, assuming they share their x values
+        rows = np.stack(list(groups.values()))
+        x_values = df[x].to_numpy(dtype=np.float64)[rows[0]]
+        for column in columns:
+            y_values = df[column].to_numpy(dtype=np.float64)[rows]
+            keep[np.take_along_axis(rows, lttb(x_values, y_values, points), axis=1)] = True
+    else:
+        downsample_indices = lttb if method == "lttb" else min_max
+        x_values = df[x].to_numpy(dtype=np.float64)
+        for column in columns:
+            y_values = df[column].to_numpy(dtype=np.float64)
+            for indices in groups.values():
+                keep[indices[downsample_indices(x_values[indices], y_values[indices], points)]] = True
+    return df[keep]
+
+
+def animation_frames(df: pd.DataFrame, frame, columns, x="timestep", statistic="mean", frames=DEFAULT_FRAMES, points=DEFAULT_POINTS, method="lttb"):
+    """Precomputed data of a line figure animated over a System Parameter, e.g. `px.line(..., animation_frame=frame)`
+
+    The results of every run and subset with the same `frame` value are aggregated at each `x` value, at most `frames`
+    evenly spaced frame values are kept, and each frame is downsampled to about `points` points.
+
+    Args:
+        frame (str): column of the animation frames, e.g. a swept System Parameter
+        columns (str or list): column(s) plotted on the y axis
+        statistic: aggregation of the runs and subsets of a frame, e.g. "mean", "median" or "max"
+
+    Returns:
+        pd.DataFrame: `frame`, `x` and `columns`, sorted by frame and x
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    values = np.sort(df[frame].unique())
+    if len(values) > frames:
+        values = values[np.unique(np.linspace(0, len(values) - 1, frames).round().astype(np.int64))]
+        df = df[df[frame].isin(values)]
+
+    aggregated = df.groupby([frame, x], sort=True, observed=True)[columns].agg(statistic).reset_index()
+    return downsample(aggregated, x, columns, points, method, by=(frame,)).reset_index(drop=True)
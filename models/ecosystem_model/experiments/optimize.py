@@ -0,0 +1,284 @@
+"""
+Optimization and calibration of the System Parameters
+
+Instead of grid sweeping, `optimize()` searches given ranges of System Parameters for the values that minimize or
+maximize an objective over the post-processed results, subject to constraints, e.g. maximize the cumulative
+`platform_daily_revenue` subject to `hosts_daily_profit` > 0 on the final day:
+
+```python
+result = optimize(
+    objective=lambda df: df["platform_daily_revenue"].sum(),
+    bounds={"service_fee": (0.01, 0.2), "onboarding_coefficient": (0.25, 1)},
+    constraints=[lambda df: df["hosts_daily_profit"].iloc[-1]],
+    maximize=True,
+)
+```
+
+Two derivative-free optimizers are available, both searching the unit hypercube of the bounds:
+* "nelder-mead": Nelder–Mead simplex, evaluating the reflection, expansion and both contraction points of an iteration together
+* "cma-es": Covariance Matrix Adaptation Evolution Strategy, evaluating each generation together
+
+Each batch of candidates is executed as one parameter sweep (one subset per candidate), with the vectorized engine
+where the model supports it, or on a process pool. Evaluations are memoized, so a candidate is never simulated twice.
+"""
+
+import copy
+import logging
+import math
+from dataclasses import dataclass
+from dataclasses import fields
+
+import numpy as np
+import pandas as pd
+
+from experiments.default_experiment import experiment
+from experiments.run import run
+import experiments.vectorized as vectorized
+from model.system_parameters import Parameters
+
+
+@dataclass
+class OptimizationResult:
+    """Best candidate found, and the history of every evaluated candidate"""
+    parameters: dict
+    objective: float
+    feasible: bool
+    evaluations: int
+    history: pd.DataFrame
+
+
+class Evaluator:
+    """Memoized batch evaluation of candidate System Parameters
+
+    Args:
+        objective (Callable): `objective(df) -> float` over the post-processed results of one candidate (all of its runs)
+        names (list): the System Parameter of each candidate dimension
+        constraints (list): `constraint(df) -> float` functions, satisfied when the value is at least 0
+        maximize (bool): maximize instead of minimize the objective
+        penalty (float): loss added per unit of constraint violation
+        simulation (optional): radCAD Simulation providing the other System Parameters, Initial State, timesteps and runs.
+            Defaults to the default experiment's Simulation.
+        processes (int): worker processes per batch, see `experiments/run.py::run`
+        cache (ResultCache, optional): result cache shared across optimizations, see `experiments/cache.py`
+    """
+
+    def __init__(self, objective, names, constraints=[], maximize=False, penalty=1e9, simulation=None, processes=1, cache=None):
+        self.objective = objective
+        self.names = names
+        self.constraints = constraints
+        self.maximize = maximize
+        self.penalty = penalty
+        self.simulation = simulation or experiment.simulations[0]
+        self.processes = processes
+        self.cache = cache
+        self.engine = "vectorized" if vectorized.supports(self.simulation.model.state_update_blocks) else "radcad"
+        self.memo = {}
+        self.history = []
+
+    def _key(self, candidate):
+        return tuple(float(value) for value in candidate)
+
+    def _simulate(self, candidates):
+        simulation = copy.deepcopy(self.simulation)
+        simulation.model.params.update({
+            name: [candidate[column] for candidate in candidates] for (column, name) in enumerate(self.names)
+        })
+        df, _exceptions = run(simulation, engine=self.engine, processes=self.processes, cache=self.cache)
+        subsets = dict(iter(df.groupby("subset")))
+
+        for (subset, candidate) in enumerate(candidates):
+            subset_df = subsets.get(subset)
+            if subset_df is None:
+                # The candidate's runs failed
+                value, violation = math.nan, math.inf
+            else:
+                value = float(self.objective(subset_df))
+                violation = sum(max(0.0, -float(constraint(subset_df))) for constraint in self.constraints)
+            loss = (-value if self.maximize else value) + self.penalty * violation
+            if math.isnan(loss):
+                loss = math.inf
+            self.memo[candidate] = loss
+            self.history.append({**dict(zip(self.names, candidate)), "objective": value, "violation": violation, "loss": loss})
+
+    def __call__(self, candidates):
+        """Return the loss (penalized objective, to minimize) of each candidate, simulating the candidates not yet evaluated
+
+        Args:
+            candidates (np.ndarray): (candidates, parameters) array of System Parameter values
+        """
+        keys = [self._key(candidate) for candidate in candidates]
+        missing = list(dict.fromkeys(key for key in keys if key not in self.memo))
+        if missing:
+            self._simulate(missing)
+        return np.array([self.memo[key] for key in keys])
+
+    @property
+    def evaluations(self):
+        return len(self.history)
+
+
+def _nelder_mead(loss, x0, max_evaluations, evaluations, xtol, ftol):
+    k = len(x0)
+    simplex = [x0]
+    for column in range(k):
+        vertex = x0.copy()
+        vertex[column] = vertex[column] + 0.25 if vertex[column] + 0.25 <= 1 else vertex[column] - 0.25
+        simplex.append(vertex)
+    simplex = np.array(simplex)
+    losses = loss(simplex)
+
+    while evaluations() < max_evaluations:
+        order = np.argsort(losses, kind="stable")
+        simplex, losses = simplex[order], losses[order]
+        if np.max(np.abs(simplex[1:] - simplex[0])) <= xtol and np.max(np.abs(losses[1:] - losses[0])) <= ftol:
+            break
+
+        centroid = simplex[:-1].mean(axis=0)
+        worst = simplex[-1]
+        reflection = np.clip(centroid + (centroid - worst), 0, 1)
+        expansion = np.clip(centroid + 2 * (centroid - worst), 0, 1)
+        outside_contraction = np.clip(centroid + 0.5 * (centroid - worst), 0, 1)
+        inside_contraction = np.clip(centroid - 0.5 * (centroid - worst), 0, 1)
+        # Evaluate the candidate points of the iteration in one batch
+        reflection_loss, expansion_loss, outside_loss, inside_loss = loss(
+            np.array([reflection, expansion, outside_contraction, inside_contraction])
+        )
+
+        replacement = None
+        if reflection_loss < losses[0]:
+            replacement = (expansion, expansion_loss) if expansion_loss < reflection_loss else (reflection, reflection_loss)
+        elif reflection_loss < losses[-2]:
+            replacement = (reflection, reflection_loss)
+        elif reflection_loss < losses[-1]:
+            if outside_loss <= reflection_loss:
+                replacement = (outside_contraction, outside_loss)
+        elif inside_loss < losses[-1]:
+            replacement = (inside_contraction, inside_loss)
+
+        if replacement is not None:
+            simplex[-1], losses[-1] = replacement
+        else:
+            # Shrink towards the best vertex
+            simplex[1:] = simplex[0] + 0.5 * (simplex[1:] - simplex[0])
+            losses[1:] = loss(simplex[1:])
+
+
+def _cma_es(loss, x0, max_evaluations, evaluations, xtol, ftol, rng, sigma=0.3):
+    n = len(x0)
+    population = 4 + int(3 * math.log(n))
+    parents = population // 2
+    weights = math.log(parents + 0.5) - np.log(np.arange(1, parents + 1))
+    weights /= weights.sum()
+    mueff = 1 / np.sum(weights ** 2)
+
+    cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    cs = (mueff + 2) / (n + mueff + 5)
+    c1 = 2 / ((n + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0, math.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+    chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+    mean = x0.copy()
+    pc, ps = np.zeros(n), np.zeros(n)
+    B, D, C = np.eye(n), np.ones(n), np.eye(n)
+    generation = 0
+
+    while evaluations() < max_evaluations:
+        generation += 1
+        z = rng.standard_normal((population, n))
+        candidates = np.clip(mean + sigma * (z * D) @ B.T, 0, 1)
+        losses = loss(candidates)
+
+        order = np.argsort(losses, kind="stable")
+        selected = candidates[order[:parents]]
+        previous_mean = mean
+        mean = weights @ selected
+        step = (mean - previous_mean) / sigma
+
+        invsqrt_C = B @ np.diag(1 / D) @ B.T
+        ps = (1 - cs) * ps + math.sqrt(cs * (2 - cs) * mueff) * invsqrt_C @ step
+        hsig = np.linalg.norm(ps) / math.sqrt(1 - (1 - cs) ** (2 * generation)) / chi_n < 1.4 + 2 / (n + 1)
+        pc = (1 - cc) * pc + hsig * math.sqrt(cc * (2 - cc) * mueff) * step
+
+        deviations = (selected - previous_mean) / sigma
+        C = (
+            (1 - c1 - cmu) * C
+            + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C)
+            + cmu * (deviations.T * weights) @ deviations
+        )
+        sigma *= math.exp((cs / damps) * (np.linalg.norm(ps) / chi_n - 1))
+
+        C = np.triu(C) + np.triu(C, 1).T
+        eigenvalues, B = np.linalg.eigh(C)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+        if sigma * np.max(D) <= xtol or np.ptp(losses) <= ftol:
+            break
+
+
+OPTIMIZERS = ["nelder-mead", "cma-es"]
+
+
+def optimize(objective, bounds, constraints=[], maximize=False, method="nelder-mead", x0=None, max_evaluations=200,
+             xtol=1e-4, ftol=1e-8, penalty=1e9, seed=None, simulation=None, processes=1, cache=None):
+    """Search System Parameters for the candidate that minimizes (or maximizes) an objective subject to constraints
+
+    Args:
+        objective (Callable): `objective(df) -> float` over the post-processed results of one candidate (all of its runs)
+        bounds (dict): System Parameter -> (lower bound, upper bound)
+        constraints (list): `constraint(df) -> float` functions, satisfied when the value is at least 0.
+            Violations are penalized by `penalty` per unit.
+        method (str): "nelder-mead" or "cma-es"
+        x0 (dict, optional): starting System Parameters. Defaults to the middle of the bounds.
+        max_evaluations (int): budget of simulated candidates, checked between batches
+        xtol (float): stop once the search has converged to within this fraction of the bounds
+        ftol (float): ... and the losses of the current candidates differ by at most this
+
+    Returns:
+        OptimizationResult
+    """
+    if method not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer {method}")
+    names = list(bounds)
+    unknown = set(names) - {field.name for field in fields(Parameters)}
+    if unknown:
+        raise ValueError(f"Unknown System Parameters {sorted(unknown)}")
+
+    limits = np.array([bounds[name] for name in names], dtype=np.float64)
+    scale = lambda unit: limits[:, 0] + np.atleast_2d(unit) * (limits[:, 1] - limits[:, 0])
+    if x0 is None:
+        start = np.full(len(names), 0.5)
+    else:
+        start = np.clip((np.array([x0[name] for name in names]) - limits[:, 0]) / (limits[:, 1] - limits[:, 0]), 0, 1)
+
+    evaluator = Evaluator(objective, names, constraints, maximize, penalty, simulation, processes, cache)
+    loss = lambda unit: evaluator(scale(unit))
+    evaluations = lambda: evaluator.evaluations
+
+    logging.info(f"Optimizing {names} with {method}")
+    if method == "nelder-mead":
+        _nelder_mead(loss, start, max_evaluations, evaluations, xtol, ftol)
+    else:
+        _cma_es(loss, start, max_evaluations, evaluations, xtol, ftol, np.random.default_rng(seed))
+
+    history = pd.DataFrame(evaluator.history)
+    best = history.loc[history["loss"].idxmin()]
+    return OptimizationResult(
+        parameters={name: float(best[name]) for name in names},
+        objective=float(best["objective"]),
+        feasible=bool(best["violation"] == 0),
+        evaluations=evaluator.evaluations,
+        history=history,
+    )
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    # Maximize cumulative platform revenue subject to hosts being profitable by the final day
+    result = optimize(
+        objective=lambda df: df["platform_daily_revenue"].sum(),
+        bounds={"service_fee": (0.01, 0.2), "host_line_cost": (0.01, 0.1), "client_competitor_price": (1, 3)},
+        constraints=[lambda df: df["hosts_daily_profit"].iloc[-1]],
+        maximize=True,
+    )
+    print(result.parameters, result.objective, f"feasible: {result.feasible}", f"{result.evaluations} simulations")
@@ -0,0 +1,301 @@
+"""
+Parallel execution of parameter sweeps
+
+Splits the (simulation, run, subset) triples of an Experiment into contiguous chunks, executes the
+chunks on a pool of worker processes, and merges the results in radCAD order.
+
+Each worker receives the Simulation configurations once when it starts, rather than a pickled `Model`
+per run, and then only receives the (simulation, run, subset) triples of its next chunk. A worker process
+that dies fails only the chunk it was executing: the chunk is reported in the returned exceptions, and a
+replacement worker continues with the remaining chunks.
+"""
+
+import collections
+import copy
+import itertools
+import logging
+import math
+import multiprocessing
+import traceback
+from multiprocessing.connection import wait
+
+import numpy as np
+import pandas as pd
+from radcad.core import generate_parameter_sweep, single_run
+from radcad.utils import flatten
+
+import experiments.collector as collector
+import experiments.fused as fused
+import experiments.vectorized as vectorized
+
+
+# Engines that simulate a list of (run, subset) pairs at once, other than radCAD
+ENGINES = {"vectorized": vectorized, "fused": fused}
+
+
+def _configurations(executable):
+    return [
+        {
+            "initial_state": simulation.model.initial_state,
+            "state_update_blocks": simulation.model.state_update_blocks,
+            "params": simulation.model.params,
+            "param_sweep": generate_parameter_sweep(simulation.model.params) or [simulation.model.params],
+            "timesteps": simulation.timesteps,
+            "runs": simulation.runs,
+            "deepcopy": simulation.engine.deepcopy,
+            "drop_substeps": simulation.engine.drop_substeps,
+        }
+        for simulation in vectorized.simulations(executable)
+    ]
+
+
+def _exception(configuration, simulation, run, subset, exception, trace=None):
+    # Same structure as the radCAD exceptions returned with `Engine.raise_exceptions == False`
+    return {
+        "exception": exception,
+        "traceback": trace,
+        "simulation": simulation,
+        "run": run,
+        "subset": subset,
+        "timesteps": configuration["timesteps"],
+        "parameters": configuration["param_sweep"][subset],
+        "initial_state": configuration["initial_state"],
+    }
+
+
+def _failed_chunk(configurations, chunk, error, trace=None):
+    # Every (simulation, run, subset) triple of a chunk that raised, or whose worker exited, is reported as failed
+    return (None, [
+        _exception(configurations[simulation], simulation, run, subset, error, trace)
+        for (simulation, run, subset) in chunk
+    ])
+
+
+def execute_chunk(configurations, engine, chunk, columnar=False, convergence=None, stochastic=None, precision=np.float64):
+    """Execute a chunk of (simulation, run, subset) triples in the current process
+
+    Args:
+        columnar (bool): collect radCAD results into typed columns, see `experiments/collector.py`
+        convergence (Convergence, optional): stop runs that reach a steady state, see `experiments/convergence.py`
+        stochastic (Stochastic, optional): stochastic mode of the "vectorized" engine, see `model/stochastic.py`
+        precision: dtype of the stored State Variables of the "vectorized" and "fused" engines, e.g. np.float32
+
+    Returns:
+        (pd.DataFrame, list): raw results of the chunk, and the exceptions raised by its runs
+    """
+    frames = []
+    exceptions = []
+
+    if engine in ENGINES:
+        options = {"convergence": convergence, "precision": precision}
+        if stochastic is not None:
+            options["stochastic"] = stochastic
+        for (simulation, triples) in itertools.groupby(chunk, key=lambda triple: triple[0]):
+            configuration = configurations[simulation]
+            frames.append(pd.DataFrame(ENGINES[engine].simulate(
+                configuration["initial_state"],
+                configuration["state_update_blocks"],
+                configuration["params"],
+                configuration["timesteps"],
+                simulation_index=simulation,
+                indices=[(run, subset) for (_simulation, run, subset) in triples],
+                **options,
+            )))
+    elif columnar:
+        rows = sum(configurations[simulation]["timesteps"] + 1 for (simulation, _run, _subset) in chunk)
+        results = collector.ColumnarCollector(configurations[chunk[0][0]]["initial_state"], rows)
+        for (simulation, run, subset) in chunk:
+            configuration = configurations[simulation]
+            try:
+                collector.single_run(
+                    results,
+                    simulation,
+                    configuration["timesteps"],
+                    run,
+                    subset,
+                    copy.deepcopy(configuration["initial_state"]),
+                    configuration["state_update_blocks"],
+                    copy.deepcopy(configuration["param_sweep"][subset]),
+                    configuration["deepcopy"],
+                )
+            except Exception as exception:
+                exceptions.append(_exception(configuration, simulation, run, subset, exception, traceback.format_exc()))
+        frames.append(results.to_dataframe())
+    else:
+        rows = []
+        for (simulation, run, subset) in chunk:
+            configuration = configurations[simulation]
+            result, exception, trace = single_run(
+                simulation,
+                configuration["timesteps"],
+                run,
+                subset,
+                copy.deepcopy(configuration["initial_state"]),
+                configuration["state_update_blocks"],
+                copy.deepcopy(configuration["param_sweep"][subset]),
+                configuration["deepcopy"],
+                configuration["drop_substeps"],
+            )
+            rows.extend(flatten(result))
+            if exception:
+                exceptions.append(_exception(configuration, simulation, run, subset, exception, trace))
+        frames.append(pd.DataFrame(rows))
+
+    return pd.concat(frames, ignore_index=True), exceptions
+
+
+def _worker(configurations, engine, columnar, convergence, stochastic, precision, connection):
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        _chunk_index, chunk = task
+        try:
+            connection.send(("done", execute_chunk(configurations, engine, chunk, columnar, convergence, stochastic, precision)))
+        except Exception as error:
+            connection.send(("failed", (error, traceback.format_exc())))
+
+
+def chunks(executable, chunk_size=None, processes=1):
+    """Split the (simulation, run, subset) triples of an Experiment or Simulation into contiguous chunks, in radCAD order
+
+    Args:
+        chunk_size (int, optional): triples per chunk. Defaults to splitting the work into four chunks per process.
+    """
+    triples = [
+        (simulation_index, run, subset)
+        for (simulation_index, simulation) in enumerate(vectorized.simulations(executable))
+        for run in range(simulation.runs)
+        for subset in range(len(generate_parameter_sweep(simulation.model.params) or [None]))
+    ]
+    if not chunk_size:
+        chunk_size = max(1, math.ceil(len(triples) / (4 * processes)))
+    return [triples[start:start + chunk_size] for start in range(0, len(triples), chunk_size)]
+
+
+def imap(executable, processes=1, chunk_size=None, engine="radcad", columnar=False, convergence=None, stochastic=None, precision=np.float64):
+    """Execute a radCAD Experiment or Simulation in chunks, yielding the results of each chunk in radCAD order
+
+    A chunk is yielded as soon as it and all preceding chunks are complete, so the caller only holds
+    the chunks that completed out of order. With a single process, chunks are executed in the current process.
+    Either way, a chunk that raises is yielded as failed rather than aborting the remaining chunks.
+
+    Args:
+        processes (int): number of worker processes
+        chunk_size (int, optional): (simulation, run, subset) triples per chunk, see `chunks()`
+        engine (str): "radcad", "vectorized" or "fused"
+        columnar (bool): collect radCAD results into typed columns, see `experiments/collector.py`
+        convergence (Convergence, optional): stop runs that reach a steady state ("vectorized" and "fused" engines),
+            see `experiments/convergence.py`
+        stochastic (Stochastic, optional): stochastic mode of the "vectorized" engine, see `model/stochastic.py`
+        precision: dtype of the stored State Variables of the "vectorized" and "fused" engines, e.g. np.float32
+
+    Yields:
+        (pd.DataFrame, list): raw results of the chunk (None if the chunk failed), and the exceptions of its failed runs
+    """
+    configurations = _configurations(executable)
+    work = chunks(executable, chunk_size, processes)
+
+    if processes <= 1:
+        for (chunk_index, chunk) in enumerate(work):
+            try:
+                result = execute_chunk(configurations, engine, chunk, columnar, convergence, stochastic, precision)
+            except Exception as error:
+                logging.warning(f"Chunk {chunk_index} failed: {error}")
+                result = _failed_chunk(configurations, chunk, error, traceback.format_exc())
+            yield result
+        return
+
+    pending = collections.deque(range(len(work)))
+
+    context = multiprocessing.get_context()
+    # Worker process sentinel -> (process, connection, index of the chunk being executed)
+    workers = {}
+    completed = {}
+    next_chunk_index = 0
+
+    def fail_chunk(chunk_index, error, trace=None):
+        logging.warning(f"Chunk {chunk_index} failed: {error}")
+        completed[chunk_index] = _failed_chunk(configurations, work[chunk_index], error, trace)
+
+    def dispatch(sentinel):
+        process, connection, _chunk_index = workers[sentinel]
+        workers[sentinel] = (process, connection, None)
+        try:
+            if pending:
+                chunk_index = pending[0]
+                connection.send((chunk_index, work[chunk_index]))
+                workers[sentinel] = (process, connection, pending.popleft())
+            else:
+                connection.send(None)
+        except OSError:
+            # The worker exited, handled once its sentinel is ready
+            pass
+
+    def start_worker():
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=_worker, args=(configurations, engine, columnar, convergence, stochastic, precision, child_connection), daemon=True)
+        process.start()
+        child_connection.close()
+        workers[process.sentinel] = (process, connection, None)
+        dispatch(process.sentinel)
+
+    for _ in range(min(processes, len(work))):
+        start_worker()
+
+    try:
+        while workers:
+            connections = {connection: sentinel for (sentinel, (_process, connection, _chunk_index)) in workers.items()}
+            ready = wait(list(connections) + list(workers))
+
+            for connection in [item for item in ready if item in connections]:
+                sentinel = connections[connection]
+                _process, _connection, chunk_index = workers[sentinel]
+                try:
+                    status, payload = connection.recv()
+                except EOFError:
+                    # The worker died, handled below once its sentinel is ready
+                    continue
+                if status == "done":
+                    completed[chunk_index] = payload
+                else:
+                    fail_chunk(chunk_index, *payload)
+                dispatch(sentinel)
+
+            for sentinel in [item for item in ready if item in workers]:
+                process, connection, chunk_index = workers.pop(sentinel)
+                process.join()
+                connection.close()
+                # A chunk still assigned to an exited worker was not completed
+                if chunk_index is not None:
+                    fail_chunk(chunk_index, ChildProcessError(
+                        f"Worker process {process.pid} exited with code {process.exitcode}"
+                    ))
+                if pending:
+                    start_worker()
+
+            while next_chunk_index in completed:
+                yield completed.pop(next_chunk_index)
+                next_chunk_index += 1
+    finally:
+        for (process, connection, _chunk_index) in workers.values():
+            process.terminate()
+            process.join()
+            connection.close()
+
+
+def run(executable, processes, chunk_size=None, engine="radcad", columnar=False, convergence=None, stochastic=None, precision=np.float64):
+    """Execute a radCAD Experiment or Simulation on a pool of worker processes, see `imap()`
+
+    Returns:
+        (pd.DataFrame, list): raw results in radCAD order, and the exceptions of failed runs and chunks
+    """
+    frames = []
+    exceptions = []
+    for (df, chunk_exceptions) in imap(executable, processes, chunk_size, engine, columnar, convergence, stochastic, precision):
+        if df is not None:
+            frames.append(df)
+        exceptions.extend(chunk_exceptions)
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return df, exceptions
@@ -1,7 +1,9 @@
+import numpy as np
 import pandas as pd
 from radcad.core import generate_parameter_sweep
 
 import model.constants as constants
+from model.schedules import Schedule
 from model.system_parameters import parameters, Parameters
 
 
@@ -11,19 +13,56 @@ legend_state_variable_name_mapping = {
 }
 
 
-def assign_parameters(df: pd.DataFrame, parameters: Parameters, set_params=[]):
-    if set_params:
+def parameter_table(parameters: Parameters, set_params=[], design: pd.DataFrame = None) -> pd.DataFrame:
+    """Build a table of System Parameter values indexed by subset, using compact dtypes:
+    int32 for integer parameters, float64 for other numeric parameters, and categorical for the rest.
+    Columns of scheduled System Parameters (see `model/schedules.py`) keep their `Schedule` objects.
+
+    If a design (subset table, see `experiments/sweeps.py`) is given, its columns are used directly,
+    and the other System Parameters take their first value.
+    """
+    if design is not None:
+        table = pd.DataFrame({
+            param: design[param].to_numpy() if param in design else np.repeat(parameters[param][:1], len(design))
+            for param in set_params
+        })
+    else:
         parameter_sweep = generate_parameter_sweep(parameters)
-        parameter_sweep = [{param: subset[param] for param in set_params} for subset in parameter_sweep]
+        table = pd.DataFrame({param: [subset[param] for subset in parameter_sweep] for param in set_params})
+
+    for param in set_params:
+        values = table[param]
+        if pd.api.types.is_integer_dtype(values) and values.between(np.iinfo(np.int32).min, np.iinfo(np.int32).max).all():
+            table[param] = values.astype(np.int32)
+        elif not pd.api.types.is_numeric_dtype(values) and not any(isinstance(value, Schedule) for value in values):
+            table[param] = values.astype("category")
+
+    return table
+
+
+def assign_parameters(df: pd.DataFrame, parameters: Parameters, set_params=[], design: pd.DataFrame = None):
+    if set_params:
+        table = parameter_table(parameters, set_params, design)
+        subsets = df['subset'].to_numpy()
 
-        for subset_index in df['subset'].unique():
-            for (key, value) in parameter_sweep[subset_index].items():
-                df.loc[df.eval(f'subset == {subset_index}'), key] = value
+        for param in set_params:
+            values = table[param]
+            if values.dtype == object and any(isinstance(value, Schedule) for value in values):
+                # Scheduled System Parameters take their value at each row's timestep
+                timesteps = df['timestep'].to_numpy()
+                horizon = int(timesteps.max()) if len(timesteps) else 0
+                dense = np.array([
+                    value.dense(horizon) if isinstance(value, Schedule) else np.full(horizon + 1, value, dtype=np.float64)
+                    for value in values
+                ])
+                df[param] = dense[subsets, timesteps]
+            else:
+                df[param] = values.array.take(subsets)
 
     return df
 
 # Assign variables to the pandas DataFrame
-def post_process(df: pd.DataFrame, drop_timestep_zero=True, parameters=parameters):
+def post_process(df: pd.DataFrame, drop_timestep_zero=True, parameters=parameters, design: pd.DataFrame = None):
     # Assign parameters to DataFrame
     assign_parameters(df, parameters, [
         # Parameters to assign to DataFrame
@@ -42,7 +81,7 @@ def post_process(df: pd.DataFrame, drop_timestep_zero=True, parameters=parameter
         'initial_population',
         'network_inefficiencies'
 
-    ])
+    ], design)
 
     
     # Convert decimals to percentages
@@ -65,3 +104,34 @@ def post_process(df: pd.DataFrame, drop_timestep_zero=True, parameters=parameter
         df = df.drop(df.query('timestep == 0').index)
 
     return df
+
+
+def percentile_bands(df: pd.DataFrame, columns, percentiles=[5, 25, 50, 75, 95]) -> pd.DataFrame:
+    """Summarise Monte Carlo runs by percentiles of each column, per subset and timestep
+
+    Returns:
+        pd.DataFrame: indexed by subset and timestep, with a `<column>_p<percentile>` column per column and percentile
+    """
+    subsets = df["subset"].to_numpy()
+    timesteps = df["timestep"].to_numpy()
+    groups = subsets.astype(np.int64) * (timesteps.max() + 1) + timesteps
+    order = np.argsort(groups, kind="stable")
+    group_ids, sizes = np.unique(groups, return_counts=True)
+    index = pd.MultiIndex.from_arrays(
+        [group_ids // (timesteps.max() + 1), group_ids % (timesteps.max() + 1)], names=["subset", "timestep"]
+    )
+
+    bands = {}
+    if (sizes == sizes[0]).all():
+        # Every (subset, timestep) has the same number of runs: compute the percentiles of a (groups, runs) array
+        for column in columns:
+            values = df[column].to_numpy(dtype=np.float64)[order].reshape(len(sizes), -1)
+            for (percentile, band) in zip(percentiles, np.percentile(values, percentiles, axis=1)):
+                bands[f"{column}_p{percentile}"] = band
+        return pd.DataFrame(bands, index=index)
+
+    grouped = df.groupby(["subset", "timestep"])[columns]
+    for percentile in percentiles:
+        for (column, band) in grouped.quantile(percentile / 100).items():
+            bands[f"{column}_p{percentile}"] = band
+    return pd.DataFrame(bands)[[f"{column}_p{percentile}" for column in columns for percentile in percentiles]]
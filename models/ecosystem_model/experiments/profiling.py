@@ -0,0 +1,168 @@
+"""
+Profiling of where a run spends its time
+
+`Profiler` wraps every Policy and State Update Function of the State Update Blocks of a run, counting calls and
+timing each call, and times the phases of `experiments/run.py::run`:
+* "simulation": executing the Experiment or Simulation, including the engine's own work between function calls
+* "dataframe": building the raw results DataFrame from radCAD's list of dictionaries
+* "post_process": `post_processing.post_process()`
+
+```python
+profiler = Profiler()
+df, _exceptions = run(experiment, profiler=profiler)
+print(profiler.report())
+profiler.write_collapsed("profile.folded") # e.g. `flamegraph.pl profile.folded > profile.svg`
+```
+
+Functions are only wrapped when a profiler is given, so runs without one execute the original functions.
+Supported by the "radcad" and "vectorized" engines in a single process; the "fused" engine compiles every function
+of a run into one step function, so only its phases are timed.
+"""
+
+import contextlib
+import time
+
+import pandas as pd
+
+
+PHASES = ["simulation", "dataframe", "post_process"]
+
+
+def block_label(index, block):
+    """Label of a State Update Block: its description, or its position"""
+    description = " ".join(block.get("description", "").split())
+    return description or f"Block {index}"
+
+
+class Profiler:
+    """Call counts, cumulative and self times of the Policies and State Update Functions of runs, and phase timings
+
+    Self time excludes the time spent in other profiled functions called by a function.
+    Timings accumulate over every run profiled with the same profiler.
+    """
+
+    def __init__(self):
+        # (block index, block label, kind, key, function name) -> [calls, cumulative ns, ns in profiled callees]
+        self.functions = {}
+        # Phase -> ns
+        self.phases = dict.fromkeys(PHASES, 0)
+        # Time spent in profiled functions not called by another profiled function, per phase
+        self._profiled = dict.fromkeys(PHASES, 0)
+        self._stack = []
+        self._phase = None
+
+    def instrument(self, blocks):
+        """Return State Update Blocks with every Policy and State Update Function wrapped to be profiled"""
+        return [
+            {
+                **block,
+                "policies": {
+                    key: self._wrap(function, (index, block_label(index, block), "policy", key, _name(function, key)))
+                    for (key, function) in block["policies"].items()
+                },
+                "variables": {
+                    key: self._wrap(function, (index, block_label(index, block), "variable", key, _name(function, key)))
+                    for (key, function) in block["variables"].items()
+                },
+            }
+            for (index, block) in enumerate(blocks)
+        ]
+
+    def _wrap(self, function, label):
+        record = self.functions.setdefault(label, [0, 0, 0])
+        stack = self._stack
+        profiled = self._profiled
+        clock = time.perf_counter_ns
+
+        def profiled_function(*args):
+            stack.append(0)
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                elapsed = clock() - start
+                record[0] += 1
+                record[1] += elapsed
+                record[2] += stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                elif self._phase is not None:
+                    profiled[self._phase] += elapsed
+
+        profiled_function.__wrapped__ = function
+        return profiled_function
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a phase of a run"""
+        previous, self._phase = self._phase, name
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter_ns() - start
+            self._phase = previous
+
+    def report(self, by="function") -> pd.DataFrame:
+        """Table of call counts and times, sorted by self time
+
+        Args:
+            by (str): "function" for one row per profiled function, or "block" for one row per State Update Block
+
+        Returns:
+            pd.DataFrame: `calls`, `cumulative` and `self` time (s), `per_call` time (µs),
+                and `share` of the profiled time (%)
+        """
+        table = pd.DataFrame(
+            [(*label, *record) for (label, record) in self.functions.items()],
+            columns=["index", "block", "kind", "key", "function", "calls", "cumulative", "callees"],
+        )
+        table["self"] = table["cumulative"] - table["callees"]
+        if by == "block":
+            # Every function of a block is called once per execution of the block
+            table = table.groupby(["index", "block"], as_index=False, sort=False).agg({"calls": "first", "cumulative": "sum", "self": "sum"})
+        elif by != "function":
+            raise ValueError(f"Unknown report grouping {by}")
+
+        table = table.drop(columns=["index", "callees"], errors="ignore")
+        table["per_call"] = table["cumulative"] / table["calls"].where(table["calls"] > 0) / 1e3
+        table["share"] = 100 * table["self"] / max(table["self"].sum(), 1)
+        table[["cumulative", "self"]] = table[["cumulative", "self"]] / 1e9
+        return table.sort_values("self", ascending=False).reset_index(drop=True)
+
+    def phase_report(self) -> pd.DataFrame:
+        """Table of the time (s) of each phase, with the simulation time spent in profiled functions and in the engine"""
+        return pd.DataFrame({
+            "phase": PHASES + ["simulation: profiled functions", "simulation: engine"],
+            "time": [self.phases[phase] / 1e9 for phase in PHASES] + [
+                self._profiled["simulation"] / 1e9,
+                max(self.phases["simulation"] - self._profiled["simulation"], 0) / 1e9,
+            ],
+        })
+
+    def collapsed(self):
+        """Self times (µs) as collapsed stacks, one `phase;block;function count` line per stack, for flame graph tools
+
+        A function used under several keys of a block has one line per key, which flame graph tools merge.
+        """
+        lines = []
+        for ((_index, block, _kind, _key, function), (_calls, cumulative, callees)) in self.functions.items():
+            frames = ["simulation", block, function]
+            lines.append(f"{';'.join(frame.replace(';', ',') for frame in frames)} {(cumulative - callees) // 1000}")
+        lines.append(f"simulation;engine {max(self.phases['simulation'] - self._profiled['simulation'], 0) // 1000}")
+        lines.extend(f"{phase} {self.phases[phase] // 1000}" for phase in PHASES[1:])
+        return "\n".join(lines) + "\n"
+
+    def write_collapsed(self, path):
+        """Write `collapsed()` to a file"""
+        with open(path, "w") as file:
+            file.write(self.collapsed())
+
+
+def _name(function, key):
+    return getattr(function, "__name__", None) or key
+
+
+def phase(profiler, name):
+    """Time a phase of a run if a profiler is given"""
+    return profiler.phase(name) if profiler is not None else contextlib.nullcontext()
@@ -0,0 +1,139 @@
+"""
+Result store for experiment outputs
+
+Results are saved as Parquet (or Arrow IPC / Feather) files partitioned by subset:
+
+    <path>/subset=<subset>/part-<n>.parquet
+
+Every file carries the subset's System Parameters and the model version (`model.__version__`)
+as schema metadata. Loading memory-maps the files, and pushes column and subset selection down to the reader,
+so only the requested partitions and columns are read.
+"""
+
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+from radcad.core import generate_parameter_sweep
+
+from model import __version__
+from model.schedules import json_default
+
+
+METADATA_KEY = b"currents"
+EXTENSIONS = {"parquet": "parquet", "feather": "feather"}
+
+# Columns used to restore radCAD row order, as partitions are read in directory order
+ORDER_COLUMNS = ["simulation", "run", "subset", "timestep"]
+
+
+def _write_partitions(df: pd.DataFrame, path, parameters, format="parquet", part=0):
+    param_sweep = generate_parameter_sweep(parameters) or [parameters]
+
+    for (subset, subset_df) in df.groupby("subset", sort=False):
+        table = pa.Table.from_pandas(subset_df.drop(columns="subset"), preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            METADATA_KEY: json.dumps({
+                "model_version": __version__,
+                "subset": int(subset),
+                "parameters": param_sweep[subset],
+            }, default=json_default).encode(),
+        })
+
+        directory = os.path.join(path, f"subset={subset}")
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, f"part-{part}.{EXTENSIONS[format]}")
+        if format == "parquet":
+            pq.write_table(table, filename)
+        else:
+            feather.write_feather(table, filename)
+
+
+def save(df: pd.DataFrame, path, parameters, format="parquet"):
+    """Save experiment results, replacing any existing results at the path
+
+    Args:
+        df (pd.DataFrame): results including a `subset` column, e.g. as returned by `experiments/run.py::run`
+        path (str): result store directory
+        parameters (dict): System Parameters of the experiment, used to annotate each subset
+        format (str): "parquet" or "feather" (Arrow IPC)
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    _write_partitions(df, path, parameters, format)
+    return path
+
+
+def load(path, columns=None, subsets=None, format="parquet") -> pd.DataFrame:
+    """Load experiment results, in radCAD row order
+
+    Args:
+        columns (list, optional): columns to read. Defaults to all columns.
+        subsets (list, optional): subsets to read. Defaults to all subsets.
+    """
+    dataset = ds.dataset(
+        path,
+        format=format,
+        partitioning="hive",
+        filesystem=LocalFileSystem(use_mmap=True),
+    )
+
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns) + [column for column in ORDER_COLUMNS if column not in columns]
+    scan_filter = ds.field("subset").isin(list(subsets)) if subsets is not None else None
+
+    df = dataset.to_table(columns=read_columns, filter=scan_filter).to_pandas()
+    df = df.sort_values(ORDER_COLUMNS, kind="stable", ignore_index=True)
+
+    ordered_columns = [column for column in df.columns if column != "subset"]
+    ordered_columns.insert(ordered_columns.index("run") if "run" in ordered_columns else 0, "subset")
+    return df[list(columns) if columns is not None else ordered_columns]
+
+
+def load_metadata(path):
+    """Return the model version and System Parameters stored with each subset
+
+    Scheduled System Parameters (see `model/schedules.py`) are stored by their repr, e.g. "Schedule({0: 0.05, 180: 0.06})".
+
+    Returns:
+        dict: subset -> {"model_version": ..., "subset": ..., "parameters": {...}}
+    """
+    metadata = {}
+    for directory in sorted(os.listdir(path)):
+        if not directory.startswith("subset="):
+            continue
+        filename = os.path.join(path, directory, sorted(os.listdir(os.path.join(path, directory)))[0])
+        if filename.endswith(".parquet"):
+            schema = pq.read_schema(filename)
+        else:
+            schema = pa.ipc.open_file(pa.memory_map(filename)).schema
+        subset_metadata = json.loads(schema.metadata[METADATA_KEY])
+        metadata[subset_metadata["subset"]] = subset_metadata
+    return metadata
+
+
+class ResultStoreSink:
+    """Sink writing streamed, post-processed chunks to a result store, see `experiments/sinks.py`"""
+
+    def __init__(self, path, parameters, format="parquet"):
+        self.path = path
+        self.parameters = parameters
+        self.format = format
+        self.chunks = 0
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+    def write(self, df: pd.DataFrame):
+        _write_partitions(df, self.path, self.parameters, self.format, part=self.chunks)
+        self.chunks += 1
+
+    def close(self):
+        return self.path
@@ -1,48 +1,206 @@
+import numpy as np
 import pandas as pd
+import copy
+import functools
 import logging
 import sys
 import time
 
 from experiments.default_experiment import experiment
 from experiments.post_processing import post_process
+import experiments.checkpoints as checkpointing
+import experiments.collector as collector
+import experiments.fused as fused
+import experiments.parallel as parallel
+import experiments.profiling as profiling
+import experiments.sweeps as sweeps
+import experiments.vectorized as vectorized
+import model.schedules as schedules
 
-# Configure logging framework
-# e.g. Use logging.debug(...) to log to log file
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-# handler = logging.FileHandler(filename=f'logs/experiment-{datetime.now()}.log')
-handler = logging.StreamHandler(sys.stdout)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+def configure_logging(level=logging.DEBUG):
+    """Configure the logging framework to log to stdout, e.g. use logging.debug(...) to log to log file
 
+    Called by scripts and notebooks rather than on import, so that importing this module leaves logging to the application.
+    """
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    if any(getattr(handler, "experiment_handler", False) for handler in logger.handlers):
+        return
+    # handler = logging.FileHandler(filename=f'logs/experiment-{datetime.now()}.log')
+    handler = logging.StreamHandler(sys.stdout)
+    handler.experiment_handler = True
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+
+def _parameters(executable):
+    try:
+        return executable.simulations[0].model.params
+    except:
+        return executable.model.params
+
+
+def _scheduled(executable):
+    """Return a copy of an Experiment or Simulation whose radCAD State Update Blocks look up scheduled System Parameters"""
+    if not any(
+        isinstance(value, schedules.Schedule)
+        for simulation in vectorized.simulations(executable)
+        for values in simulation.model.params.values()
+        for value in values
+    ):
+        return executable
+
+    executable = copy.deepcopy(executable)
+    for simulation in vectorized.simulations(executable):
+        for values in simulation.model.params.values():
+            for value in values:
+                if isinstance(value, schedules.Schedule):
+                    value.dense(simulation.timesteps)
+        simulation.model.state_update_blocks = schedules.scheduled_state_update_blocks(simulation.model.state_update_blocks)
+    return executable
+
+
+def stream(executable, sink, engine="radcad", processes=1, chunk_size=1, columnar=False, convergence=None, design=None, stochastic=None, checkpoints=None, precision=np.float64):
+    """Execute an Experiment or Simulation in chunks, post-processing each chunk as soon as it completes and writing it to a sink
+
+    Peak memory is bounded by the chunk size rather than the sweep size.
+
+    Args:
+        sink: see `experiments/sinks.py`
+        chunk_size (int): (simulation, run, subset) triples per chunk. Defaults to one run of one subset.
+
+    Returns:
+        (any, list): the result of `sink.close()`, and the exceptions of failed runs and chunks
+    """
+    parameters = _parameters(executable)
+    exceptions = []
+    rows = 0
+    if checkpoints is not None:
+        checkpoints.record(checkpointing.simulation_records(executable))
+
+    for (df, chunk_exceptions) in parallel.imap(executable, processes, chunk_size, engine, columnar, convergence, stochastic, precision):
+        exceptions.extend(chunk_exceptions)
+        if df is None:
+            continue
+        # Label rows as in the non-streamed results
+        df.index = pd.RangeIndex(rows, rows + len(df))
+        rows += len(df)
+        if checkpoints is not None:
+            checkpoints.capture(df)
+        sink.write(post_process(df, parameters=parameters, design=design))
+
+    return sink.close(), exceptions
+
+
+def run(executable=experiment, engine="radcad", processes=1, chunk_size=None, columnar=False, sink=None, cache=None, convergence=None, design=None, stochastic=None, checkpoints=None, profiler=None, precision=np.float64):
+    """Execute an Experiment or Simulation and post-process the results
+
+    Args:
+        executable: radCAD Experiment or Simulation
+        engine (str): "radcad", "vectorized" to step the whole parameter sweep as NumPy arrays (see `experiments/vectorized.py`),
+            or "fused" to execute each run with a single compiled step function (see `experiments/fused.py`)
+        processes (int): number of worker processes; if greater than 1, the sweep is executed in chunks on a process pool (see `experiments/parallel.py`)
+        chunk_size (int, optional): (simulation, run, subset) triples per chunk when executing on a process pool
+        columnar (bool): collect radCAD results directly into typed NumPy columns instead of a list of dictionaries (see `experiments/collector.py`)
+        sink (optional): stream post-processed results to this sink chunk by chunk (see `stream()` and `experiments/sinks.py`), and return `sink.close()` instead of a DataFrame
+        cache (ResultCache, optional): return cached post-processed results per subset, only executing the subsets that are not cached (see `experiments/cache.py`)
+        convergence (Convergence, optional): stop runs once they reach a steady state, padding or truncating the remaining timesteps (see `experiments/convergence.py`).
+            Requires the "vectorized" or "fused" engine.
+        design (pd.DataFrame, optional): subset table of System Parameters to sweep instead of the executable's parameter sweep (see `experiments/sweeps.py`)
+        stochastic (Stochastic, optional): draw adoption and price noise from per-run seeded random streams, for Monte Carlo runs (see `model/stochastic.py`).
+            Requires the "vectorized" engine. See `post_processing.percentile_bands()` to summarise the runs.
+        checkpoints (Checkpoints, optional): keep the State Variables of every run every `checkpoints.interval` timesteps,
+            to fork the runs from with different System Parameters (see `experiments/checkpoints.py`)
+        profiler (Profiler, optional): count and time the calls of every Policy and State Update Function, and time the phases of the run
+            (see `experiments/profiling.py`). Requires a single process, and no sink or cache.
+        precision: dtype of the simulated State Variables, e.g. np.float32 to halve the size of the results.
+            Requires the "vectorized" or "fused" engine, which step the state in double precision either way.
+    """
+    if engine not in ["radcad", "vectorized", "fused"]:
+        raise ValueError(f"Unknown engine {engine}")
+    if convergence is not None and engine == "radcad":
+        raise ValueError("Steady-state detection requires the vectorized or fused engine")
+    if stochastic is not None and engine != "vectorized":
+        raise ValueError("The stochastic mode requires the vectorized engine")
+    if np.dtype(precision) != np.float64 and engine == "radcad":
+        raise ValueError("A reduced precision requires the vectorized or fused engine")
+
+    if profiler is not None and (processes > 1 or sink is not None or cache is not None):
+        raise ValueError("Profiling requires a single process, without a streaming sink or result cache")
+
+    if design is not None:
+        executable = sweeps.apply(executable, design)
+
+    if cache is not None:
+        if sink is not None:
+            raise ValueError("A result cache cannot be combined with a streaming sink")
+        if convergence is not None:
+            raise ValueError("A result cache cannot be combined with steady-state detection")
+        if stochastic is not None:
+            raise ValueError("A result cache cannot be combined with the stochastic mode")
+        if checkpoints is not None:
+            raise ValueError("A result cache cannot be combined with checkpoints")
+        return cache.run(executable, functools.partial(
+            run, engine=engine, processes=processes, chunk_size=chunk_size, columnar=columnar, precision=precision
+        ), engine, precision)
+
+    if engine == "radcad":
+        if profiler is not None:
+            executable = copy.deepcopy(executable)
+            for simulation in vectorized.simulations(executable):
+                simulation.model.state_update_blocks = profiler.instrument(simulation.model.state_update_blocks)
+        executable = _scheduled(executable)
+
+    if sink is not None:
+        logging.info("Running experiment, streaming post-processed results")
+        start_time = time.time()
+        result, exceptions = stream(executable, sink, engine, processes, chunk_size or 1, columnar, convergence, design, stochastic, checkpoints, precision)
+        logging.info(f"Experiment and post-processing complete in {time.time() - start_time} seconds")
+        return result, exceptions
 
-def run(executable=experiment):
     logging.info("Running experiment")
     start_time = time.time()
 
-    executable.run()
+    with profiling.phase(profiler, "simulation"):
+        if processes > 1:
+            df, exceptions = parallel.run(executable, processes, chunk_size, engine, columnar, convergence, stochastic, precision)
+        elif engine == "vectorized":
+            df = vectorized.run(executable, convergence, stochastic, profiler, precision)
+            exceptions = []
+        elif engine == "fused":
+            df = fused.run(executable, convergence, precision)
+            exceptions = []
+        elif columnar:
+            df, exceptions = collector.run(executable)
+        else:
+            executable.run()
+            df = None
+            exceptions = executable.exceptions
 
     experiment_duration = time.time() - start_time
     logging.info(f"Experiment complete in {experiment_duration} seconds")
 
     logging.info("Post-processing results")
 
-    df = pd.DataFrame(executable.results)
+    with profiling.phase(profiler, "dataframe"):
+        if df is None:
+            df = pd.DataFrame(executable.results)
 
-    try:
-        parameters = executable.simulations[0].model.params
-    except:
-        parameters = executable.model.params
+    if checkpoints is not None:
+        checkpoints.record(checkpointing.simulation_records(executable))
+        checkpoints.capture(df)
 
-    df = post_process(df, parameters=parameters)
+    with profiling.phase(profiler, "post_process"):
+        df = post_process(df, parameters=_parameters(executable), design=design)
 
     post_processing_duration = time.time() - start_time - experiment_duration
     logging.info(f"Post-processing complete in {post_processing_duration} seconds")
 
-    return df, executable.exceptions
+    return df, exceptions
 
 
 if __name__ == '__main__':
+    configure_logging()
     df, _exceptions = run()
     print(df)
@@ -0,0 +1,231 @@
+"""
+Global sensitivity analysis of the System Parameters
+
+* `sobol()`: first-order and total Sobol indices, estimated from Saltelli samples
+  (Saltelli 2010 first-order and Jansen total-effect estimators)
+* `morris()`: Morris elementary effects (mu, mu*, sigma) from one-at-a-time trajectories
+
+Both draw samples over user-given ranges of `Parameters` fields, and execute them in batches as one parameter sweep
+per batch, through the fastest engine that supports the model's State Update Blocks. Batches are added until the
+bootstrap confidence intervals of the indices are within a tolerance, or the sample budget is exhausted.
+
+Each output is summarised per simulation by the value at the final timestep, or a given aggregation such as "sum".
+"""
+
+import copy
+from dataclasses import fields
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from experiments.default_experiment import experiment
+from experiments.run import run
+import experiments.vectorized as vectorized
+from model.system_parameters import parameters, Parameters
+
+
+DEFAULT_OUTPUTS = ["hosts", "clients", "avg_price", "platform_daily_revenue"]
+
+
+def _validate(ranges):
+    names = {field.name for field in fields(Parameters)}
+    unknown = [name for name in ranges if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown System Parameters {unknown}")
+
+
+def evaluate(samples, names, outputs=DEFAULT_OUTPUTS, aggregation="last", simulation=None, processes=1):
+    """Simulate each row of parameter samples as one subset of a parameter sweep
+
+    Args:
+        samples (np.ndarray): (samples, parameters) array of parameter values
+        names (list): the System Parameter of each column
+        aggregation (str): how to summarise each output over the timesteps of a run, e.g. "last", "sum" or "mean"
+        simulation (optional): radCAD Simulation providing the other System Parameters, Initial State and timesteps.
+            Defaults to the default experiment's Simulation.
+
+    Returns:
+        pd.DataFrame: one row per sample, one column per output
+    """
+    simulation = copy.deepcopy(simulation or experiment.simulations[0])
+    simulation.model.params.update({name: list(samples[:, column]) for (column, name) in enumerate(names)})
+
+    engine = "vectorized" if vectorized.supports(simulation.model.state_update_blocks) else "radcad"
+    df, _exceptions = run(simulation, engine=engine, processes=processes)
+    return df.groupby("subset")[outputs].agg(aggregation).reindex(range(len(samples)))
+
+
+def _scale(unit_samples, bounds):
+    return bounds[:, 0] + unit_samples * (bounds[:, 1] - bounds[:, 0])
+
+
+def _z(confidence):
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def _sobol_indices(y_A, y_B, y_AB):
+    # Centre the outputs, which reduces the variance of the first-order estimator
+    mean = np.mean(np.concatenate([y_A, y_B]))
+    y_A, y_B, y_AB = y_A - mean, y_B - mean, y_AB - mean
+    variance = np.var(np.concatenate([y_A, y_B]))
+    first_order = np.mean(y_B[:, None] * (y_AB - y_A[:, None]), axis=0) / variance
+    total = 0.5 * np.mean((y_A[:, None] - y_AB) ** 2, axis=0) / variance
+    return first_order, total
+
+
+def sobol(ranges, outputs=DEFAULT_OUTPUTS, aggregation="last", batch_size=256, max_samples=4096,
+          tolerance=0.05, confidence=0.95, bootstrap=100, seed=None, simulation=None, processes=1):
+    """Estimate first-order (S1) and total (ST) Sobol indices
+
+    Each batch evaluates `batch_size * (parameters + 2)` simulations. Sampling stops once every confidence interval
+    (half-width) is within `tolerance`, or `max_samples` base samples have been drawn.
+
+    Args:
+        ranges (dict): System Parameter -> (lower bound, upper bound)
+
+    Returns:
+        pd.DataFrame: indexed by (output, parameter), with columns S1, S1_conf, ST, ST_conf.
+            `df.attrs["samples"]` and `df.attrs["evaluations"]` record the number of base samples and simulations.
+    """
+    _validate(ranges)
+    names = list(ranges)
+    bounds = np.array([ranges[name] for name in names], dtype=np.float64)
+    k = len(names)
+    rng = np.random.default_rng(seed)
+    z = _z(confidence)
+
+    y_A, y_B, y_AB = [], [], []
+    samples = 0
+    while samples < max_samples:
+        n = min(batch_size, max_samples - samples)
+        A = _scale(rng.random((n, k)), bounds)
+        B = _scale(rng.random((n, k)), bounds)
+        AB = np.repeat(A[None, :, :], k, axis=0)
+        for column in range(k):
+            AB[column, :, column] = B[:, column]
+
+        y = evaluate(np.vstack([A, B, AB.reshape(k * n, k)]), names, outputs, aggregation, simulation, processes)
+        y = y.to_numpy()
+        y_A.append(y[:n])
+        y_B.append(y[n:2 * n])
+        y_AB.append(y[2 * n:].reshape(k, n, len(outputs)).transpose(1, 0, 2))
+        samples += n
+
+        Y_A, Y_B, Y_AB = np.concatenate(y_A), np.concatenate(y_B), np.concatenate(y_AB)
+        results = []
+        for (output_index, output) in enumerate(outputs):
+            a, b, ab = Y_A[:, output_index], Y_B[:, output_index], Y_AB[:, :, output_index]
+            first_order, total = _sobol_indices(a, b, ab)
+            resamples = rng.integers(0, samples, (bootstrap, samples))
+            estimates = [_sobol_indices(a[rows], b[rows], ab[rows]) for rows in resamples]
+            first_order_conf = z * np.std([estimate[0] for estimate in estimates], axis=0)
+            total_conf = z * np.std([estimate[1] for estimate in estimates], axis=0)
+            for (column, name) in enumerate(names):
+                results.append((output, name, first_order[column], first_order_conf[column], total[column], total_conf[column]))
+
+        df = pd.DataFrame(results, columns=["output", "parameter", "S1", "S1_conf", "ST", "ST_conf"])
+        if np.nanmax(df[["S1_conf", "ST_conf"]].to_numpy()) <= tolerance:
+            break
+
+    df = df.set_index(["output", "parameter"])
+    df.attrs["samples"] = samples
+    df.attrs["evaluations"] = samples * (k + 2)
+    return df
+
+
+def _morris_trajectories(rng, trajectories, k, levels):
+    delta = levels / (2 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    starts = grid[grid <= 1 - delta + 1e-12]
+
+    points = np.empty((trajectories, k + 1, k))
+    for trajectory in range(trajectories):
+        x = rng.choice(starts, k)
+        signs = rng.choice([-1, 1], k)
+        # Start from the upper level for parameters that move down
+        x = np.where(signs < 0, x + delta, x)
+        points[trajectory, 0] = x
+        for (step, column) in enumerate(rng.permutation(k), start=1):
+            x = x.copy()
+            x[column] += signs[column] * delta
+            points[trajectory, step] = x
+    return points, delta
+
+
+def morris(ranges, outputs=DEFAULT_OUTPUTS, aggregation="last", levels=4, batch_size=10, max_trajectories=100,
+           tolerance=0.1, confidence=0.95, bootstrap=100, seed=None, simulation=None, processes=1):
+    """Estimate Morris elementary effects
+
+    Elementary effects are computed in the unit hypercube of the parameter ranges. Each batch evaluates
+    `batch_size * (parameters + 1)` simulations. Sampling stops once the confidence interval (half-width) of every mu*
+    is within `tolerance` relative to the largest mu* of its output, or `max_trajectories` have been drawn.
+
+    Args:
+        ranges (dict): System Parameter -> (lower bound, upper bound)
+
+    Returns:
+        pd.DataFrame: indexed by (output, parameter), with columns mu, mu_star, mu_star_conf, sigma.
+            `df.attrs["trajectories"]` and `df.attrs["evaluations"]` record the number of trajectories and simulations.
+    """
+    _validate(ranges)
+    names = list(ranges)
+    bounds = np.array([ranges[name] for name in names], dtype=np.float64)
+    k = len(names)
+    rng = np.random.default_rng(seed)
+    z = _z(confidence)
+
+    effects = []
+    trajectories = 0
+    while trajectories < max_trajectories:
+        n = min(batch_size, max_trajectories - trajectories)
+        points, delta = _morris_trajectories(rng, n, k, levels)
+
+        y = evaluate(_scale(points.reshape(n * (k + 1), k), bounds), names, outputs, aggregation, simulation, processes)
+        y = y.to_numpy().reshape(n, k + 1, len(outputs))
+
+        # Elementary effect of the parameter changed at each step of each trajectory
+        changed = np.argmax(np.abs(np.diff(points, axis=1)), axis=2)
+        step_signs = np.sign(np.take_along_axis(np.diff(points, axis=1), changed[:, :, None], axis=2))
+        batch_effects = np.empty((n, k, len(outputs)))
+        for trajectory in range(n):
+            batch_effects[trajectory, changed[trajectory]] = (
+                np.diff(y[trajectory], axis=0) * step_signs[trajectory] / delta
+            )
+        effects.append(batch_effects)
+        trajectories += n
+
+        elementary_effects = np.concatenate(effects)
+        mu_star = np.mean(np.abs(elementary_effects), axis=0)
+        resamples = rng.integers(0, trajectories, (bootstrap, trajectories))
+        mu_star_conf = z * np.std([np.mean(np.abs(elementary_effects[rows]), axis=0) for rows in resamples], axis=0)
+
+        scale = np.max(mu_star, axis=0)
+        if np.all(mu_star_conf <= tolerance * np.where(scale > 0, scale, 1)):
+            break
+
+    mu = np.mean(elementary_effects, axis=0)
+    sigma = np.std(elementary_effects, axis=0, ddof=1) if trajectories > 1 else np.full_like(mu, np.nan)
+    df = pd.DataFrame([
+        (output, name, mu[column, output_index], mu_star[column, output_index], mu_star_conf[column, output_index], sigma[column, output_index])
+        for (output_index, output) in enumerate(outputs)
+        for (column, name) in enumerate(names)
+    ], columns=["output", "parameter", "mu", "mu_star", "mu_star_conf", "sigma"]).set_index(["output", "parameter"])
+    df.attrs["trajectories"] = trajectories
+    df.attrs["evaluations"] = trajectories * (k + 1)
+    return df
+
+
+if __name__ == '__main__':
+    # Sobol indices over +/-25% of every default System Parameter, bounded to [0, 1] for fractions
+    ranges = {}
+    for field in fields(Parameters):
+        value = parameters[field.name][0]
+        lower, upper = 0.75 * value, 1.25 * value
+        if 0 < value < 1:
+            upper = min(upper, 0.99)
+        ranges[field.name] = (lower, upper)
+
+    df = sobol(ranges, seed=0)
+    print(f"{df.attrs['samples']} samples, {df.attrs['evaluations']} simulations")
+    print(df.round(3).to_string())
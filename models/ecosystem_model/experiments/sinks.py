@@ -0,0 +1,47 @@
+"""
+Sinks for streamed, post-processed results
+
+When `experiments/run.py::run` is given a sink, every chunk of runs is post-processed as soon as it
+completes and written to the sink, so memory is bounded by the chunk size rather than the sweep size.
+
+A sink implements `write(df)`, called once per post-processed chunk in radCAD order,
+and `close()`, which returns the result of `run()`.
+
+See also `experiments/aggregation.py::SummarySink`, which reduces Monte Carlo runs to summary statistics.
+"""
+
+import pandas as pd
+
+
+class MemorySink:
+    """Concatenate the post-processed chunks into a single DataFrame"""
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, df: pd.DataFrame):
+        self.frames.append(df)
+
+    def close(self) -> pd.DataFrame:
+        df = pd.concat(self.frames) if self.frames else pd.DataFrame()
+        self.frames = []
+        return df
+
+
+class CSVSink:
+    """Append the post-processed chunks to a CSV file
+
+    Args:
+        path (str): output file, overwritten by the first chunk
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = 0
+
+    def write(self, df: pd.DataFrame):
+        df.to_csv(self.path, mode="a" if self.chunks else "w", header=not self.chunks, index=False)
+        self.chunks += 1
+
+    def close(self):
+        return self.path
@@ -0,0 +1,149 @@
+"""
+Sweep designs over the System Parameters
+
+A design is an explicit subset table: a DataFrame with one row per subset and one column per swept System Parameter.
+radCAD's `generate_parameter_sweep` zips System Parameter lists (padding shorter lists with their last value) rather
+than taking their product, so a design is applied by setting each swept System Parameter to its column, see `apply()`.
+The number of subsets is the number of rows, whatever the number of swept System Parameters.
+
+* `latin_hypercube()`: one sample in each of `samples` equal strata of every System Parameter range
+* `sobol_sequence()`: low-discrepancy Sobol sequence points, optionally randomized with a digital shift
+* `one_at_a_time()`: a baseline subset, and subsets varying one System Parameter at a time from the baseline
+
+`experiments/run.py::run` and `experiments/post_processing.py::post_process` accept a design directly.
+"""
+
+import copy
+from dataclasses import fields
+
+import numpy as np
+import pandas as pd
+
+import experiments.vectorized as vectorized
+from model.system_parameters import parameters as default_parameters, Parameters
+
+
+# Primitive polynomial degree `s`, coefficients `a` and initial direction numbers `m` of Sobol sequence dimensions 2, 3, ...
+# (from the Joe & Kuo "new-joe-kuo-6.21201" direction numbers)
+SOBOL_DIRECTION_NUMBERS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+]
+SOBOL_BITS = 30
+
+
+def _validate(names):
+    unknown = set(names) - {field.name for field in fields(Parameters)}
+    if unknown:
+        raise ValueError(f"Unknown System Parameters {sorted(unknown)}")
+
+
+def _table(unit_samples, ranges):
+    names = list(ranges)
+    _validate(names)
+    bounds = np.array([ranges[name] for name in names], dtype=np.float64)
+    values = bounds[:, 0] + unit_samples * (bounds[:, 1] - bounds[:, 0])
+    return pd.DataFrame(values, columns=names).rename_axis("subset")
+
+
+def latin_hypercube(ranges, samples, seed=None):
+    """Latin hypercube design
+
+    Args:
+        ranges (dict): System Parameter -> (lower bound, upper bound)
+        samples (int): number of subsets
+
+    Returns:
+        pd.DataFrame: subset table
+    """
+    rng = np.random.default_rng(seed)
+    strata = np.array([rng.permutation(samples) for _ in ranges]).T
+    return _table((strata + rng.random((samples, len(ranges)))) / samples, ranges)
+
+
+def _sobol_directions(dimension):
+    if dimension == 0:
+        return np.array([1 << (SOBOL_BITS - k) for k in range(1, SOBOL_BITS + 1)], dtype=np.int64)
+
+    s, a, m = SOBOL_DIRECTION_NUMBERS[dimension - 1]
+    directions = [m[k] << (SOBOL_BITS - k - 1) for k in range(s)]
+    for k in range(s, SOBOL_BITS):
+        direction = directions[k - s] ^ (directions[k - s] >> s)
+        for j in range(1, s):
+            if (a >> (s - 1 - j)) & 1:
+                direction ^= directions[k - j]
+        directions.append(direction)
+    return np.array(directions, dtype=np.int64)
+
+
+def sobol_sequence(ranges, samples, seed=None):
+    """Sobol sequence design, with balance properties when `samples` is a power of 2
+
+    Args:
+        ranges (dict): System Parameter -> (lower bound, upper bound)
+        samples (int): number of subsets
+        seed (int, optional): randomize the sequence with a random digital shift, otherwise start from its first point
+
+    Returns:
+        pd.DataFrame: subset table
+    """
+    if len(ranges) > len(SOBOL_DIRECTION_NUMBERS) + 1:
+        raise ValueError(f"Sobol sequence designs support at most {len(SOBOL_DIRECTION_NUMBERS) + 1} System Parameters")
+
+    index = np.arange(samples, dtype=np.int64)
+    gray_code = index ^ (index >> 1)
+    points = np.zeros((samples, len(ranges)), dtype=np.int64)
+    for dimension in range(len(ranges)):
+        directions = _sobol_directions(dimension)
+        for bit in range(SOBOL_BITS):
+            points[:, dimension] ^= ((gray_code >> bit) & 1) * directions[bit]
+
+    if seed is not None:
+        points ^= np.random.default_rng(seed).integers(0, 1 << SOBOL_BITS, len(ranges))
+    return _table(points / (1 << SOBOL_BITS), ranges)
+
+
+def one_at_a_time(values, baseline=None):
+    """One-factor-at-a-time design
+
+    Args:
+        values (dict): System Parameter -> list of values to sweep
+        baseline (dict, optional): baseline System Parameters. Defaults to the default System Parameters.
+
+    Returns:
+        pd.DataFrame: subset table, starting with the baseline subset
+    """
+    _validate(values)
+    baseline = {name: (baseline or {}).get(name, default_parameters[name][0]) for name in values}
+    rows = [baseline]
+    for (name, name_values) in values.items():
+        rows.extend({**baseline, name: value} for value in name_values if value != baseline[name])
+    return pd.DataFrame(rows, columns=list(values)).rename_axis("subset")
+
+
+def apply(executable, design):
+    """Return a copy of a radCAD Experiment or Simulation with the design's System Parameters
+
+    System Parameters not in the design keep their first value.
+    """
+    _validate(design.columns)
+    executable = copy.deepcopy(executable)
+    for simulation in vectorized.simulations(executable):
+        params = simulation.model.params
+        for name in params:
+            params[name] = design[name].tolist() if name in design else params[name][:1]
+    return executable
+
@@ -0,0 +1,250 @@
+"""
+Vectorized NumPy simulation engine
+
+An alternative to radCAD that advances all (run, subset) pairs of a Simulation together,
+storing each State Variable as a NumPy array, and the history of every timestep in one preallocated typed array.
+Returns the same raw result columns as `pd.DataFrame(executable.results)` from radCAD with `drop_substeps=True`.
+
+pandas is only imported by the functions returning DataFrames, so that `simulate()` starts without it (see `experiments/cli.py`).
+"""
+
+import numpy as np
+from radcad.core import generate_parameter_sweep
+
+from model.schedules import Schedule
+from model.vectorized import vectorize_state_update_blocks, vectorized_functions, step
+
+
+def simulations(executable):
+    """Return the Simulations of a radCAD Experiment, or the Simulation itself as a list"""
+    try:
+        return executable.simulations
+    except AttributeError:
+        return [executable]
+
+
+def supports(state_update_blocks):
+    """Return whether every Policy and State Update Function of the State Update Blocks has a vectorized counterpart"""
+    return all(
+        function in vectorized_functions
+        for block in state_update_blocks
+        for group in ["policies", "variables"]
+        for function in block[group].values()
+    )
+
+
+def sweep_arrays(param_sweep, subsets, timesteps=None):
+    """Convert a radCAD parameter sweep to arrays with one element per simulated subset
+
+    Scheduled System Parameters (see `model/schedules.py`) are converted to (timesteps + 1, subsets) arrays instead.
+
+    Args:
+        param_sweep (list): parameter sets, as returned by `generate_parameter_sweep`
+        subsets (np.ndarray): the subset index of each (run, subset) pair being simulated
+        timesteps (int, optional): last timestep of the horizon, required if any System Parameter is scheduled
+    """
+    arrays = {}
+    for key in param_sweep[0]:
+        values = [param_set[key] for param_set in param_sweep]
+        if any(isinstance(value, Schedule) for value in values):
+            table = np.array([
+                value.dense(timesteps) if isinstance(value, Schedule) else np.full(timesteps + 1, value, dtype=np.float64)
+                for value in values
+            ])
+            arrays[key] = np.ascontiguousarray(table.T[:, subsets])
+        else:
+            arrays[key] = np.array(values, dtype=np.float64)[subsets]
+    return arrays
+
+
+def index_columns(simulation_index, run_indices, subset_indices, rows, blocks, initial_timestep=0):
+    """Return the simulation/subset/run/substep/timestep result columns
+
+    Args:
+        run_indices (np.ndarray): the (0-based) run of each simulated (run, subset) pair
+        subset_indices (np.ndarray): the subset of each pair
+        rows (np.ndarray): the number of result rows (timesteps + 1) of each pair
+        blocks (int): the number of State Update Blocks, the substep of every row after the initial state
+        initial_timestep (int): the timestep of the initial state
+    """
+    timestep = np.arange(rows.sum()) - np.repeat(np.cumsum(rows) - rows, rows)
+    return {
+        "simulation": np.full(rows.sum(), simulation_index),
+        "subset": np.repeat(subset_indices, rows),
+        "run": np.repeat(run_indices + 1, rows),
+        "substep": np.where(timestep == 0, 0, blocks),
+        "timestep": timestep + initial_timestep,
+    }
+
+
+def simulate(initial_state, state_update_blocks, params, timesteps, runs=1, simulation_index=0, indices=None, convergence=None, stochastic=None, initial_timestep=0, profiler=None, precision=np.float64):
+    """Execute a Simulation's (run, subset) pairs with the vectorized engine
+
+    Args:
+        initial_state (dict): Initial State, each value either shared by every pair or an array with one element per pair
+        indices (list, optional): (run, subset) pairs to simulate. Defaults to every pair, ordered run-major as in radCAD.
+        convergence (Convergence, optional): stop stepping pairs that reach a steady state, see `experiments/convergence.py`
+        stochastic (Stochastic, optional): draw adoption and price noise from per-run random streams, see `model/stochastic.py`
+        initial_timestep (int): timestep of the Initial State, e.g. a checkpoint's (see `experiments/checkpoints.py`).
+            `timesteps` are simulated after it.
+        profiler (Profiler, optional): profile the vectorized functions, see `experiments/profiling.py`
+        precision: dtype of the stored State Variables, e.g. np.float32 to halve the size of the results.
+            The state is stepped in double precision either way.
+
+    Returns:
+        dict: result columns, each a NumPy array of length len(indices) * (timesteps + 1), unless runs are truncated
+    """
+    if convergence is not None and stochastic is not None:
+        raise ValueError("Steady-state detection cannot be combined with the stochastic mode")
+
+    param_sweep = generate_parameter_sweep(params) or [params]
+    if indices is None:
+        indices = [(run, subset) for run in range(runs) for subset in range(len(param_sweep))]
+    run_indices = np.array([run for (run, _subset) in indices], dtype=np.int64)
+    subset_indices = np.array([subset for (_run, subset) in indices], dtype=np.int64)
+
+    size = len(indices)
+    params = sweep_arrays(param_sweep, subset_indices, initial_timestep + timesteps)
+    # Scheduled System Parameters are looked up every timestep
+    scheduled = [key for (key, values) in params.items() if values.ndim == 2]
+    blocks = vectorize_state_update_blocks(state_update_blocks)
+    if stochastic is not None:
+        streams = stochastic.streams(run_indices, initial_timestep)
+        blocks = stochastic.state_update_blocks(blocks, streams)
+    if profiler is not None:
+        blocks = profiler.instrument(blocks)
+
+    state = {key: np.full(size, value, dtype=np.float64) for (key, value) in initial_state.items()}
+    # One (timesteps + 1, pairs) block per State Variable, allocated at once, so each timestep is written contiguously.
+    # Not records as in the fused engine (see `model/state_variables.py::state_dtype`), whose interleaved fields would
+    # make every write of a pair's array strided.
+    keys = list(state)
+    history = np.empty((len(keys), timesteps + 1, size), dtype=precision)
+    for (column, key) in enumerate(keys):
+        history[column, 0] = state[key]
+
+    # Last simulated timestep of each pair, and the pairs still being stepped
+    stopped = np.full(size, timesteps)
+    active = slice(None)
+    if convergence is not None:
+        monitor = convergence.monitor(initial_state, size)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for timestep in range(1, timesteps + 1):
+            if stochastic is not None:
+                streams.advance(initial_timestep + timestep)
+            if scheduled:
+                step_params = {**params, **{key: params[key][initial_timestep + timestep] for key in scheduled}}
+            else:
+                step_params = params
+            previous_state, state = state, step(step_params, state, blocks)
+            for (column, key) in enumerate(keys):
+                history[column, timestep, active] = state[key]
+
+            if convergence is not None:
+                converged = monitor.update(previous_state, state)
+                if converged.any():
+                    active = np.arange(size)[active]
+                    stopped[active[converged]] = timestep
+                    keep = ~converged
+                    active = active[keep]
+                    state = {key: values[keep] for (key, values) in state.items()}
+                    params = {key: values[..., keep] for (key, values) in params.items()}
+                    monitor.keep(keep)
+                    if not len(active):
+                        break
+
+    if convergence is None:
+        columns = {key: history[column].T.ravel() for (column, key) in enumerate(keys)}
+    else:
+        columns = {key: convergence.finish(history[column].T, stopped) for (column, key) in enumerate(keys)}
+
+    rows = np.full(size, timesteps + 1) if convergence is None else convergence.rows(stopped, timesteps)
+    columns.update(index_columns(simulation_index, run_indices, subset_indices, rows, len(blocks), initial_timestep))
+    if convergence is not None and convergence.truncate:
+        columns["truncated"] = np.repeat(stopped < timesteps, rows)
+
+    return columns
+
+
+def run(executable, convergence=None, stochastic=None, profiler=None, precision=np.float64):
+    """Execute a radCAD Experiment or Simulation with the vectorized engine
+
+    Args:
+        convergence (Convergence, optional): see `experiments/convergence.py`
+        stochastic (Stochastic, optional): see `model/stochastic.py`
+        profiler (Profiler, optional): profile the vectorized functions, see `experiments/profiling.py`
+        precision: dtype of the stored State Variables, see `simulate()`
+
+    Returns:
+        pd.DataFrame: raw (not post-processed) results, with the same columns and row order as radCAD
+    """
+    import pandas as pd
+
+    df = pd.concat(
+        [
+            pd.DataFrame(simulate(
+                simulation.model.initial_state,
+                simulation.model.state_update_blocks,
+                simulation.model.params,
+                simulation.timesteps,
+                simulation.runs,
+                simulation_index,
+                convergence=convergence,
+                stochastic=stochastic,
+                profiler=profiler,
+                precision=precision,
+            ))
+            for (simulation_index, simulation) in enumerate(simulations(executable))
+        ],
+        ignore_index=True,
+    )
+    return df
+
+
+def validate(executable, rtol=1e-9, atol=1e-6):
+    """Check that the vectorized engine reproduces the radCAD results of an Experiment or Simulation
+
+    Raises:
+        AssertionError: if any State Variable differs by more than the given tolerance
+
+    Returns:
+        float: the maximum absolute difference across all State Variables
+    """
+    import pandas as pd
+
+    executable.run()
+    return compare(pd.DataFrame(executable.results), run(executable), rtol, atol)
+
+
+def compare(expected, actual, rtol=1e-9, atol=1e-6):
+    """Check that raw results match the raw radCAD results `expected`, see `validate()`
+
+    Returns:
+        float: the maximum absolute difference across all State Variables
+    """
+    assert list(actual.columns) == list(expected.columns), "Result columns differ from radCAD"
+    assert len(actual) == len(expected), "Result rows differ from radCAD"
+
+    max_difference = 0.0
+    for column in expected.columns:
+        expected_values = expected[column].to_numpy(dtype=np.float64)
+        actual_values = actual[column].to_numpy(dtype=np.float64)
+        np.testing.assert_allclose(actual_values, expected_values, rtol=rtol, atol=atol, err_msg=column)
+        max_difference = max(max_difference, float(np.max(np.abs(actual_values - expected_values))))
+
+    return max_difference
+
+
+if __name__ == '__main__':
+    import copy
+
+    from experiments.default_experiment import experiment
+
+    validation_experiment = copy.deepcopy(experiment)
+    validation_experiment.simulations[0].runs = 2
+    validation_experiment.simulations[0].model.params.update({
+        "host_setup_delay": [14, 30, 90],
+        "avg_client_allocation": [5, 10, 20, 40],
+    })
+    print(f"Maximum absolute difference to radCAD: {validate(validation_experiment)}")
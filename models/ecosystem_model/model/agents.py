@@ -0,0 +1,376 @@
+"""
+# Agent-based variant of the network State Update Block.
+
+The aggregate model reduces the geography of the network to `constants.max_clients_servicable_by_host`.
+`AgentNetwork` instead places individual hosts and clients on a map, and attaches each client to the nearest host
+within radio range that has spare capacity (clients per host):
+* agents are stored in array-backed tables (`AgentTable`), grown to the `hosts` and `clients` State Variables each day
+* range queries use a uniform grid with cells of the radio range (`GridIndex`), so a query only visits nine cells
+* attachment is incremental: clients stay attached to their host, and hosts never lose capacity, so an unattached
+  client is only matched against the new clients' candidates and the hosts added since its last attempt
+* with `links=True`, every (client, host) pair within radio range is kept as a link, over which attached clients'
+  bandwidth demand is allocated to the hosts' line capacities (see `model/allocation.py`)
+
+`agent_state_update_blocks()` replaces the network penetration and allocation Policies of the model with a Policy
+that advances one `AgentNetwork` per run, and feeds back:
+* `network_penetration`: the fraction of clients attached to a host (the access of `p_network_allocation`)
+* `network_allocation`: `clients * avg_client_allocation * price_attractiveness * network_penetration`, as in the aggregate
+  model, or with `allocation=True` the bandwidth allocated to the attached clients over the links, which cannot exceed
+  the hosts' capacity `avg_host_line * (1 - network_inefficiencies)`
+
+The agent network is held by the Policy rather than the state, so it is not copied into every row of the results.
+Agent-based State Update Blocks run on the radCAD engine (see `experiments/run.py::run`).
+"""
+
+
+import numpy as np
+
+from model.allocation import ProportionalAllocation
+import model.constants as constant
+import model.policy_functions as policy
+from model.state_update_blocks import state_update_blocks as default_state_update_blocks
+
+
+class AgentTable:
+    """Columns of NumPy arrays with one element per agent, grown by appending agents
+
+    Args:
+        dtypes (dict): column -> NumPy dtype
+    """
+
+    def __init__(self, dtypes, capacity=1024):
+        self.size = 0
+        self.data = {column: np.empty(capacity, dtype=dtype) for (column, dtype) in dtypes.items()}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, column):
+        return self.data[column][:self.size]
+
+    def append(self, **columns):
+        """Append agents, given one array per column"""
+        count = len(next(iter(columns.values())))
+        capacity = len(next(iter(self.data.values())))
+        if self.size + count > capacity:
+            # Grow geometrically, so appending one day's agents is amortized O(agents)
+            capacity = max(2 * capacity, self.size + count)
+            for (column, values) in self.data.items():
+                grown = np.empty(capacity, dtype=values.dtype)
+                grown[:self.size] = values[:self.size]
+                self.data[column] = grown
+        for (column, values) in columns.items():
+            self.data[column][self.size:self.size + count] = values
+        self.size += count
+
+
+class GridIndex:
+    """Uniform grid bucket index of points, for queries of the points within a radius
+
+    Args:
+        x, y (np.ndarray): point coordinates
+        radius (float): query radius, and the size of the grid cells
+    """
+
+    def __init__(self, x, y, radius):
+        self.radius = radius
+        self.x, self.y = x, y
+        cell_x, cell_y = self._cells(x, y)
+        self.origin = (cell_x.min(initial=0), cell_y.min(initial=0))
+        self.shape = (cell_x.max(initial=0) - self.origin[0] + 1, cell_y.max(initial=0) - self.origin[1] + 1)
+        cells = self._cell_index(cell_x, cell_y)
+        # Points sorted by cell, and the start of each cell's points (CSR layout)
+        self.order = np.argsort(cells, kind="stable")
+        self.starts = np.searchsorted(cells[self.order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def _cells(self, x, y):
+        return np.floor(x / self.radius).astype(np.int64), np.floor(y / self.radius).astype(np.int64)
+
+    def _cell_index(self, cell_x, cell_y):
+        return (cell_x - self.origin[0]) * self.shape[1] + (cell_y - self.origin[1])
+
+    def query(self, x, y):
+        """Return the (query, point, distance) pairs of the points within the radius of each query point, sorted by query and distance"""
+        cell_x, cell_y = self._cells(x, y)
+        queries, points = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbour_x, neighbour_y = cell_x + dx, cell_y + dy
+                inside = (
+                    (neighbour_x >= self.origin[0]) & (neighbour_x < self.origin[0] + self.shape[0])
+                    & (neighbour_y >= self.origin[1]) & (neighbour_y < self.origin[1] + self.shape[1])
+                )
+                query = np.flatnonzero(inside)
+                cells = self._cell_index(neighbour_x[query], neighbour_y[query])
+                starts, counts = self.starts[cells], self.starts[cells + 1] - self.starts[cells]
+                query = np.repeat(query, counts)
+                # Position of each candidate within its cell
+                offsets = np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts, counts)
+                queries.append(query)
+                points.append(self.order[np.repeat(starts, counts) + offsets])
+
+        query, point = np.concatenate(queries), np.concatenate(points)
+        distance = np.hypot(self.x[point] - x[query], self.y[point] - y[query])
+        within = distance <= self.radius
+        query, point, distance = query[within], point[within], distance[within]
+        # Sort by query, then distance, with a single key: distances within the radius are less than one query apart
+        order = np.argsort(query + distance / (2 * self.radius))
+        return query[order], point[order], distance[order]
+
+
+class AgentNetwork:
+    """Hosts and clients placed on a map, clients attached to hosts within radio range up to the hosts' capacity
+
+    Args:
+        width, height (float): extent of the map (km)
+        radio_range (float): maximum distance between a client and its host (km)
+        host_capacity (int): clients per host
+        neighbourhoods (np.ndarray, optional): (neighbourhoods, 4) array of centre x, centre y, standard deviation and
+            weight of Gaussian neighbourhoods to place agents in. Defaults to placing agents uniformly over the map.
+        seed (optional): seed of the placement random numbers
+        links (bool): keep every (client, host) pair within radio range, for `allocate()`
+    """
+
+    def __init__(self, width=10.0, height=10.0, radio_range=0.2, host_capacity=constant.max_clients_servicable_by_host,
+                 neighbourhoods=None, seed=None, links=False):
+        self.width, self.height = width, height
+        self.radio_range = radio_range
+        self.host_capacity = host_capacity
+        self.neighbourhoods = None if neighbourhoods is None else np.asarray(neighbourhoods, dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
+
+        self.hosts = AgentTable({"x": np.float64, "y": np.float64, "load": np.int64})
+        self.clients = AgentTable({"x": np.float64, "y": np.float64, "host": np.int64})
+        self.links = AgentTable({"client": np.int64, "host": np.int64}) if links else None
+        self.allocation = ProportionalAllocation()
+        self.index = None
+        # Hosts that unattached clients have already been matched against
+        self.matched_hosts = 0
+        self.attached = 0
+
+    def place(self, count):
+        """Draw `count` agent positions, uniformly or from the neighbourhoods"""
+        if self.neighbourhoods is None:
+            return self.rng.uniform(0, self.width, count), self.rng.uniform(0, self.height, count)
+        weights = self.neighbourhoods[:, 3] / self.neighbourhoods[:, 3].sum()
+        neighbourhood = self.neighbourhoods[self.rng.choice(len(weights), count, p=weights)]
+        x = self.rng.normal(neighbourhood[:, 0], neighbourhood[:, 2])
+        y = self.rng.normal(neighbourhood[:, 1], neighbourhood[:, 2])
+        return np.clip(x, 0, self.width), np.clip(y, 0, self.height)
+
+    def grow(self, hosts, clients):
+        """Add agents up to the given numbers of hosts and clients, and attach the unattached clients"""
+        new_hosts = max(int(hosts) - len(self.hosts), 0)
+        if new_hosts:
+            x, y = self.place(new_hosts)
+            self.hosts.append(x=x, y=y, load=np.zeros(new_hosts, dtype=np.int64))
+        new_clients = max(int(clients) - len(self.clients), 0)
+        if new_clients:
+            x, y = self.place(new_clients)
+            self.clients.append(x=x, y=y, host=np.full(new_clients, -1, dtype=np.int64))
+        if new_hosts or new_clients:
+            self.attach(first_new_client=len(self.clients) - new_clients)
+
+    def attach(self, first_new_client):
+        """Attach unattached clients to the nearest host in range with spare capacity
+
+        Clients from `first_new_client` are matched against every host, earlier unattached clients only against
+        the hosts added since they were last matched: the other hosts were out of range or full, and stay so.
+        With links, every earlier client is linked to the new hosts in range.
+        """
+        if len(self.hosts) > self.matched_hosts:
+            new_hosts = np.arange(self.matched_hosts, len(self.hosts))
+            if self.links is None:
+                previous = np.flatnonzero(self.clients["host"][:first_new_client] < 0)
+            else:
+                previous = np.arange(first_new_client)
+            candidates = [self._candidates(previous, new_hosts)]
+        else:
+            candidates = []
+        if first_new_client < len(self.clients) and len(self.hosts):
+            candidates.append(self._candidates(np.arange(first_new_client, len(self.clients)), np.arange(len(self.hosts))))
+        self.matched_hosts = len(self.hosts)
+        if not candidates:
+            return
+
+        # Earlier clients come first, so the candidates stay sorted by client and distance
+        client, host, distance = (np.concatenate(columns) for columns in zip(*candidates))
+        if self.links is not None:
+            self.links.append(client=client, host=host)
+            unattached = self.clients["host"][client] < 0
+            client, host, distance = client[unattached], host[unattached], distance[unattached]
+        self._match(client, host, distance)
+
+    def _candidates(self, clients, hosts):
+        if not len(clients) or not len(hosts):
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+        if len(hosts) == len(self.hosts):
+            if self.index is None or len(self.index.x) != len(self.hosts):
+                self.index = GridIndex(self.hosts["x"], self.hosts["y"], self.radio_range)
+            index = self.index
+        else:
+            index = GridIndex(self.hosts["x"][hosts], self.hosts["y"][hosts], self.radio_range)
+        query, point, distance = index.query(self.clients["x"][clients], self.clients["y"][clients])
+        return clients[query], hosts[point], distance
+
+    def _match(self, client, host, distance):
+        """Greedy matching of candidate (client, host) pairs sorted by client and distance
+
+        Every round, each client proposes to its nearest remaining candidate host, and each host accepts its nearest
+        proposals up to its spare capacity. Rejected clients move on to their next candidate.
+        """
+        load = self.hosts.data["load"]
+        clients = self.clients.data["host"]
+        # Each client's candidates are the contiguous pairs [next, end)
+        starts = np.flatnonzero(np.r_[True, client[1:] != client[:-1]]) if len(client) else np.zeros(0, dtype=np.int64)
+        ends = np.r_[starts[1:], len(client)]
+        position = starts.copy()
+
+        while len(position):
+            proposal_host = host[position]
+            # Skip candidates that are already full
+            full = load[proposal_host] >= self.host_capacity
+            position[full] += 1
+            active = position < ends
+            if full.any():
+                position, ends = position[active], ends[active]
+                continue
+
+            order = np.lexsort([distance[position], proposal_host])
+            sorted_hosts = proposal_host[order]
+            first = np.r_[True, sorted_hosts[1:] != sorted_hosts[:-1]]
+            group_start = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+            rank = np.arange(len(order)) - group_start
+            accepted = order[rank < self.host_capacity - load[sorted_hosts]]
+
+            clients[client[position[accepted]]] = host[position[accepted]]
+            np.add.at(load, host[position[accepted]], 1)
+            self.attached += len(accepted)
+
+            remaining = np.ones(len(position), dtype=bool)
+            remaining[accepted] = False
+            position, ends = position[remaining] + 1, ends[remaining]
+            active = position < ends
+            position, ends = position[active], ends[active]
+
+    def allocate(self, demand, capacity):
+        """Allocate the demand of attached clients over the links to the hosts' capacity, warm-started from the previous day
+
+        Args:
+            demand (float): bandwidth demand of each attached client (Mbps)
+            capacity (float): bandwidth capacity of each host (Mbps)
+
+        Returns:
+            float: total allocated bandwidth (Mbps)
+        """
+        if self.links is None:
+            raise ValueError("Bandwidth allocation requires an AgentNetwork with links")
+        demands = np.where(self.clients["host"] >= 0, demand, 0.0)
+        capacities = np.full(len(self.hosts), float(capacity))
+        return self.allocation.solve(self.links["client"], self.links["host"], demands, capacities).sum()
+
+    @property
+    def penetration(self):
+        """Fraction of clients attached to a host"""
+        return self.attached / len(self.clients) if len(self.clients) else 0.0
+
+
+class AgentNetworks:
+    """One `AgentNetwork` per run, created when the run starts
+
+    radCAD executes runs one after another in a process, so only the network of the current run is kept. A run starts
+    when the (simulation, subset, run) changes, or when the timestep goes backwards, e.g. when an Experiment is run again.
+
+    Args:
+        seed (int): seed of the agent placement, combined with the simulation, subset and run
+        allocation (bool): allocate bandwidth over the links of the network, see `AgentNetwork.allocate()`
+        network_options: `AgentNetwork` arguments
+    """
+
+    def __init__(self, seed=0, allocation=False, **network_options):
+        self.seed = seed
+        self.allocation = allocation
+        self.network_options = {**network_options, "links": allocation or network_options.get("links", False)}
+        self.key = None
+        self.timestep = None
+        self.network = None
+
+    def get(self, previous_state):
+        key = (previous_state["simulation"], previous_state["subset"], previous_state["run"])
+        timestep = previous_state["timestep"]
+        if key != self.key or timestep < self.timestep:
+            self.key = key
+            self.network = AgentNetwork(**self.network_options, seed=[self.seed, *key])
+        self.timestep = timestep
+        return self.network
+
+    def p_agent_network(self, params, substep, state_history, previous_state):
+        """Policy growing the run's agent network to the State Variables, returning its network penetration and allocation"""
+        avg_client_allocation = params["avg_client_allocation"]
+        competitor_price = params["client_competitor_price"]
+        avg_host_line = params["avg_host_line"]
+        network_inefficiencies = params["network_inefficiencies"]
+
+        clients = previous_state["clients"]
+        avg_price = previous_state["avg_price"]
+
+        network = self.get(previous_state)
+        network.grow(previous_state["hosts"], clients)
+        network_penetration = network.penetration
+
+        if(avg_price > 0):
+            price_attractiveness = competitor_price/avg_price
+        else:
+            price_attractiveness = 1
+
+        if self.allocation:
+            network_allocation = network.allocate(
+                avg_client_allocation * price_attractiveness,
+                avg_host_line * (1-network_inefficiencies),
+            )
+        else:
+            network_allocation = clients * avg_client_allocation * price_attractiveness * network_penetration
+
+        return {"network_penetration": network_penetration, "network_allocation": network_allocation}
+
+
+def agent_state_update_blocks(blocks=default_state_update_blocks, seed=0, allocation=False, **network_options):
+    """Replace the network penetration and allocation Policies of State Update Blocks with an agent-based network Policy
+
+    Args:
+        blocks (list): radCAD State Update Blocks. Defaults to `model.state_update_blocks.state_update_blocks`.
+        seed (int): seed of the agent placement, see `AgentNetworks`
+        allocation (bool): compute `network_allocation` with the capacity-constrained allocation of `model/allocation.py`
+        network_options: `AgentNetwork` arguments, e.g. `radio_range` or `neighbourhoods`
+
+    Returns:
+        list: State Update Blocks with the same State Update Functions
+    """
+    networks = AgentNetworks(seed, allocation, **network_options)
+    replaced = {policy.p_network_penetration, policy.p_network_allocation}
+    agent_blocks = []
+    for block in blocks:
+        policies = {key: function for (key, function) in block["policies"].items() if function not in replaced}
+        if len(policies) < len(block["policies"]):
+            # A single Policy returns both Signals, which radCAD would otherwise sum once per registration
+            policies["agent_network"] = networks.p_agent_network
+        agent_blocks.append({**block, "policies": policies})
+    return agent_blocks
+
+
+if __name__ == '__main__':
+    # Check that running an Experiment again reproduces its results, i.e. that every run starts from a new network
+    import copy
+
+    import pandas as pd
+
+    from experiments.default_experiment import experiment
+    from experiments.run import run
+
+    repeated_experiment = copy.deepcopy(experiment)
+    repeated_experiment.simulations[0].timesteps = 50
+    repeated_experiment.simulations[0].model.state_update_blocks = agent_state_update_blocks(radio_range=0.5)
+    first, _exceptions = run(repeated_experiment)
+    second, _exceptions = run(repeated_experiment)
+    pd.testing.assert_frame_equal(first, second)
+    print("Repeated runs are identical")
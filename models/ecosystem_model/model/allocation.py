@@ -0,0 +1,89 @@
+"""
+# Capacity-constrained bandwidth allocation between clients and hosts.
+
+Clients can draw bandwidth through any host they have a link to (a host within radio range), and a host's line
+capacity is shared by the clients linked to it. The links form a sparse bipartite graph, stored as parallel
+`client` and `host` arrays with one element per link, so every sum over a client's or a host's links is a
+`np.bincount` over the links (a sparse matrix-vector product), whatever the number of hosts.
+
+`ProportionalAllocation` splits each client's demand over its links, and iteratively moves the shares of its demand
+away from overloaded hosts towards hosts with spare capacity:
+* a host whose requested load exceeds its capacity serves each request in proportion (`scale = capacity / load`)
+* each client's shares are multiplied by the scale of their hosts, and renormalized
+
+At the fixed point, every client only uses the least congested of its hosts, and no host exceeds its capacity
+at any iteration. The shares are kept between solves: links are only ever appended (agents do not move), so the
+previous day's shares are a warm start, and a day with few new clients and hosts converges in a few iterations.
+"""
+
+
+import numpy as np
+
+
+class ProportionalAllocation:
+    """Warm-started proportional allocation of client demands over host capacities
+
+    Args:
+        tolerance (float): stop once no host's requested load changes by more than this fraction of its capacity
+        max_iterations (int): iterations per solve
+    """
+
+    def __init__(self, tolerance=1e-3, max_iterations=100):
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.shares = np.zeros(0)
+        self.iterations = 0
+
+    def solve(self, client, host, demand, capacity):
+        """Allocate the client demands over the links
+
+        Args:
+            client, host (np.ndarray): the client and host of each link. Links appended since the previous solve
+                are warm-started, otherwise the shares are reset.
+            demand (np.ndarray): bandwidth demand of each client (Mbps)
+            capacity (np.ndarray): bandwidth capacity of each host (Mbps)
+
+        Returns:
+            np.ndarray: bandwidth allocated over each link (Mbps)
+        """
+        clients, hosts = len(demand), len(capacity)
+        if len(client) < len(self.shares):
+            self.shares = np.zeros(0)
+        new = len(client) - len(self.shares)
+        links = np.bincount(client, minlength=clients)
+        # A new link starts with an even share of its client's demand
+        shares = np.concatenate([self.shares, 1 / links[client[len(client) - new:]]])
+        shares = self._normalize(shares, client, links)
+
+        # Only the links of clients with demand take part
+        link_demand = demand[client]
+        active = np.flatnonzero(link_demand > 0)
+        active_client, active_host, link_demand = client[active], host[active], link_demand[active]
+        active_shares = shares[active]
+
+        previous_load = None
+        for self.iterations in range(1, self.max_iterations + 1):
+            load = np.bincount(active_host, link_demand * active_shares, minlength=hosts)
+            scale = np.divide(capacity, load, out=np.ones(hosts), where=load > capacity)
+            # Shares weighted by the fraction of their request each host serves
+            served_shares = active_shares * scale[active_host]
+            if previous_load is not None and np.all(np.abs(load - previous_load) <= self.tolerance * capacity):
+                break
+            previous_load = load
+            active_shares = self._normalize(served_shares, active_client, links)
+
+        shares[active] = active_shares
+        self.shares = shares
+        allocation = np.zeros(len(client))
+        allocation[active] = link_demand * served_shares
+        return allocation
+
+    def _normalize(self, shares, client, links):
+        """Scale each client's shares to sum to one"""
+        totals = np.bincount(client, shares, minlength=len(links))
+        empty = (totals == 0) & (links > 0)
+        normalized = shares * (1 / np.where(totals > 0, totals, 1))[client]
+        if empty.any():
+            # Hosts without capacity can zero every share of a client, which then restarts from an even split
+            normalized = np.where(empty[client], 1 / links[client], normalized)
+        return normalized
@@ -0,0 +1,186 @@
+"""
+# Fused single-step kernel for the model's State Update Blocks.
+
+`compile_step()` compiles the four State Update Blocks in `model/state_update_blocks.py` into one step function
+over a flat list of State Variable values:
+* System Parameters and State Variable positions are resolved once, instead of by string key in every Policy
+* each distinct Policy is evaluated once per substep; a Policy registered more than once in a block
+  (`p_host_daily_yields`) has its Signals scaled by the number of registrations, as radCAD sums Signals with the same key
+* values derived only from System Parameters are computed once
+* the substep order, and the floating point operations of each Policy and State Update Function, are unchanged
+
+The kernel is transcribed by hand, so `compile_step()` checks the source of the Policy and State Update Functions
+against `FUSED_SOURCE_HASH`, the hash of the sources it was transcribed from. After changing a Policy or State Update
+Function, update the kernel to match, check it with `experiments/fused.py::validate()`, and update the hash to
+`source_hash()`.
+"""
+
+
+import functools
+import hashlib
+import inspect
+
+import model.constants as constant
+import model.policy_functions as policy
+from model.state_update_blocks import state_update_blocks as default_state_update_blocks
+
+
+# `source_hash()` of the Policy and State Update Functions the kernel was transcribed from
+FUSED_SOURCE_HASH = "dd7b0fb90f82f4214c8fede00fd1c9ef1c0fbde8eb37773cd8a005bd81afc623"
+
+
+def _functions(blocks):
+    return [(list(block["policies"].items()), list(block["variables"].items())) for block in blocks]
+
+
+@functools.lru_cache(maxsize=None)
+def source_hash():
+    """Hash the source of the Policy and State Update Functions of the model's State Update Blocks, in block order"""
+    digest = hashlib.sha256()
+    for (policies, variables) in _functions(default_state_update_blocks):
+        for (key, function) in policies + variables:
+            digest.update(key.encode())
+            digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()
+
+
+def compile_step(params, state_variables, state_update_blocks=default_state_update_blocks):
+    """Compile the State Update Blocks into a single step function for one parameter set
+
+    Args:
+        params (dict): System Parameters of a single subset (one value per parameter)
+        state_variables (list): State Variable keys, in the order of the flat state
+        state_update_blocks (list): must be the model's State Update Blocks
+
+    Returns:
+        Callable: `step(previous_state, state=None) -> state`, taking a list of State Variable values and writing the
+            next values into `state` in place, or into a new list if not given
+
+    Raises:
+        ValueError: if the State Update Blocks, or the source of their functions, differ from those the kernel was fused from
+    """
+    if _functions(state_update_blocks) != _functions(default_state_update_blocks):
+        raise ValueError("The fused kernel only supports the State Update Blocks in `model/state_update_blocks.py`")
+    if source_hash() != FUSED_SOURCE_HASH:
+        raise ValueError(
+            "The Policy or State Update Functions changed since the fused kernel was transcribed from them: "
+            "update `model/fused.py` to match, and `FUSED_SOURCE_HASH` to `source_hash()`"
+        )
+
+    index = {key: position for (position, key) in enumerate(state_variables)}
+    CLIENTS = index["clients"]
+    HOSTS = index["hosts"]
+    POTENTIAL_USERS = index["potential_users"]
+    AVG_PRICE = index["avg_price"]
+    NETWORK_CAPACITY = index["network_capacity"]
+    INDICATED_NETWORK_DEMAND = index["indicated_network_demand"]
+    NETWORK_ALLOCATION = index["network_allocation"]
+    NETWORK_PENETRATION = index["network_penetration"]
+    HOSTS_DAILY_REVENUE = index["hosts_daily_revenue"]
+    HOSTS_DAILY_PROFIT = index["hosts_daily_profit"]
+    PLATFORM_DAILY_REVENUE = index["platform_daily_revenue"]
+
+    onboarding_coeff = params["onboarding_coefficient"]
+    competitor_price = params["client_competitor_price"]
+    registration_delay = params["client_registration_delay"]
+    setup_delay = params["host_setup_delay"]
+    host_line_cost = params["host_line_cost"]
+    avg_host_line = params["avg_host_line"]
+    technical_difficulty = params["host_technical_difficulty"]
+    MIN_expected_fulfillment = params["MIN_expected_fulfillment"]
+    avg_client_allocation = params["avg_client_allocation"]
+    population = params["initial_population"]
+    network_inefficiencies = params["network_inefficiencies"]
+    avg_reserve_capacity = params["avg_reserve_capacity"]
+    price_change_delay = params["price_change_delay"]
+    service_fee = params["service_fee"]
+    max_clients_servicable_by_host = constant.max_clients_servicable_by_host
+
+    # Derived only from System Parameters
+    max_clients = (avg_host_line / avg_client_allocation)
+    operating_expenses = host_line_cost * avg_host_line
+    host_difficulty = (1-technical_difficulty)
+    host_efficiency = (1-network_inefficiencies)
+    reserve_efficiency = (1-avg_reserve_capacity)
+
+    # Number of times each yields Signal is summed by radCAD
+    yields_registrations = list(default_state_update_blocks[3]["policies"].values()).count(policy.p_host_daily_yields)
+
+    def step(previous_state, state=None):
+        avg_price = previous_state[AVG_PRICE]
+        hosts = previous_state[HOSTS]
+        clients = previous_state[CLIENTS]
+        potential_users = previous_state[POTENTIAL_USERS]
+        network_penetration = previous_state[NETWORK_PENETRATION]
+
+        # User Adoption: p_client_adoption, p_host_adoption
+        probability_WOM = (clients + hosts) / (clients + hosts + potential_users)
+
+        price_desirability = 0
+        if (competitor_price-avg_price > 0):
+            price_desirability = (competitor_price-avg_price)/competitor_price
+        clientsRegistering = onboarding_coeff* (potential_users * price_desirability * probability_WOM) / registration_delay
+        if(clientsRegistering > potential_users):
+            clientsRegistering = 0
+
+        host_expected_fulfillment = MIN_expected_fulfillment
+        if (MIN_expected_fulfillment < network_penetration):
+            host_expected_fulfillment = network_penetration
+        expected_revenue = avg_price * max_clients * host_expected_fulfillment * avg_client_allocation
+        profit = expected_revenue - operating_expenses
+        if(profit >= 0):
+            expected_margin = (profit / expected_revenue)
+        else:
+            expected_margin = 0.01
+        hostsOnboarding = onboarding_coeff * (expected_margin * potential_users * probability_WOM * host_difficulty ) / setup_delay
+        if(hostsOnboarding > potential_users):
+            hostsOnboarding = 0
+
+        # User Adoption: s_clients, s_hosts, s_potential_users
+        clients = clients + clientsRegistering
+        hosts = hosts + hostsOnboarding
+        potential_users = potential_users - clientsRegistering - hostsOnboarding
+        if(potential_users < 0):
+            potential_users = 0
+
+        # Network Demand & Allocation
+        if (avg_price > 0):
+            price_attractiveness = competitor_price/avg_price
+        else:
+            price_attractiveness = 1
+        indicated_network_demand = clients * avg_client_allocation * price_attractiveness
+        network_capacity = hosts * avg_host_line * host_efficiency
+        network_allocation = indicated_network_demand * network_penetration
+        network_penetration = min(1, (hosts*max_clients_servicable_by_host/population))
+
+        # Price
+        if (network_capacity > 0):
+            supply_demand_ratio = indicated_network_demand / (network_capacity*reserve_efficiency)
+        else:
+            supply_demand_ratio = 1
+        desired_price = (avg_price * supply_demand_ratio)
+        avg_price = avg_price + ((desired_price - avg_price) / price_change_delay)
+        if(avg_price < 0):
+            avg_price = 0
+
+        # Yields
+        total_daily_revenue = avg_price * network_allocation
+        total_daily_profit = total_daily_revenue - hosts * host_line_cost * avg_host_line
+        platform_daily_revenue = previous_state[HOSTS_DAILY_REVENUE] * service_fee
+
+        if state is None:
+            state = [0.0] * len(previous_state)
+        state[CLIENTS] = clients
+        state[HOSTS] = hosts
+        state[POTENTIAL_USERS] = potential_users
+        state[AVG_PRICE] = avg_price
+        state[NETWORK_CAPACITY] = network_capacity
+        state[INDICATED_NETWORK_DEMAND] = indicated_network_demand
+        state[NETWORK_ALLOCATION] = network_allocation
+        state[NETWORK_PENETRATION] = network_penetration
+        state[HOSTS_DAILY_REVENUE] = total_daily_revenue * yields_registrations
+        state[HOSTS_DAILY_PROFIT] = total_daily_profit * yields_registrations
+        state[PLATFORM_DAILY_REVENUE] = platform_daily_revenue
+        return state
+
+    return step
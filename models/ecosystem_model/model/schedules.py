@@ -0,0 +1,119 @@
+"""
+# Time-varying System Parameters.
+
+A System Parameter value can be a `Schedule` instead of a constant, in the same place in the parameter lists
+(so schedules can be swept like any other value):
+
+```python
+params.update({
+    "client_competitor_price": [Schedule(lambda t: 2 * 0.9 ** (t / 365))], # falls 10% a year
+    "host_line_cost": [Schedule({0: 0.05, 180: 0.06})], # tariff change on day 180
+})
+```
+
+A schedule is precomputed once per horizon into a dense array with one value per timestep, so Policies never evaluate
+the schedule's function while stepping: the value used while computing the state of timestep `t` is `schedule[t]`.
+* `experiments/vectorized.py` looks up the (timesteps + 1, pairs) array of each scheduled System Parameter every timestep
+* `experiments/fused.py` compiles one step function per distinct combination of scheduled values
+* radCAD is given State Update Blocks whose functions look up the scheduled values, see `scheduled_state_update_blocks()`
+"""
+
+
+import functools
+
+import numpy as np
+
+
+class Schedule:
+    """Time-varying System Parameter value
+
+    Args:
+        source: one of
+            * a sequence of values per timestep from 0, the last value holding after its end
+            * a dict of timestep -> value from that timestep on (a piecewise constant schedule)
+            * a function of the timestep, called once with an array of every timestep of the horizon
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._dense = None
+
+    def dense(self, timesteps):
+        """Return the values of timesteps 0, ..., `timesteps` as an array, computed once for the longest horizon"""
+        if self._dense is not None and len(self._dense) > timesteps:
+            return self._dense[:timesteps + 1]
+
+        steps = np.arange(timesteps + 1)
+        if callable(self.source):
+            values = np.broadcast_to(np.asarray(self.source(steps), dtype=np.float64), steps.shape)
+        elif isinstance(self.source, dict):
+            changes = sorted(self.source.items())
+            starts = np.array([timestep for (timestep, _value) in changes])
+            if starts[0] > 0:
+                raise ValueError("A piecewise schedule must start at timestep 0")
+            values = np.array([value for (_timestep, value) in changes], dtype=np.float64)[
+                np.searchsorted(starts, steps, side="right") - 1
+            ]
+        else:
+            source = np.asarray(self.source, dtype=np.float64)
+            values = source[np.minimum(steps, len(source) - 1)]
+
+        self._dense = np.ascontiguousarray(values)
+        return self._dense
+
+    def __getitem__(self, timestep):
+        return self._dense[timestep]
+
+    def __repr__(self):
+        # Cache keys use the dense values instead (see `experiments/cache.py`), as a function has no stable representation
+        if callable(self.source):
+            return f"Schedule({self.source.__module__}.{self.source.__qualname__})"
+        if isinstance(self.source, dict):
+            return f"Schedule({dict(sorted(self.source.items()))!r})"
+        return f"Schedule({np.asarray(self.source).tolist()!r})"
+
+
+def json_default(value):
+    """`json.dumps()` default of parameter sets: NumPy scalars as Python numbers, and schedules (or any other value) by their repr"""
+    return value.item() if isinstance(value, np.generic) else repr(value)
+
+
+def scheduled(param_set):
+    """Return the keys of the scheduled System Parameters of a parameter set"""
+    return [key for (key, value) in param_set.items() if isinstance(value, Schedule)]
+
+
+def densify(param_sweep, timesteps):
+    """Precompute the schedules of every parameter set of a sweep for a horizon"""
+    for param_set in param_sweep:
+        for key in scheduled(param_set):
+            param_set[key].dense(timesteps)
+
+
+def at(param_set, timestep, keys=None):
+    """Return a parameter set with the scheduled System Parameters (or `keys`) replaced by their value at a timestep"""
+    keys = scheduled(param_set) if keys is None else keys
+    if not keys:
+        return param_set
+    return {**param_set, **{key: param_set[key][timestep] for key in keys}}
+
+
+def _scheduled_function(function, params, substep, state_history, previous_state, *policy_input):
+    # radCAD sets the timestep of the state to the timestep being computed from the second substep on
+    timestep = previous_state["timestep"] + 1 if substep == 0 else previous_state["timestep"]
+    return function(at(params, timestep), substep, state_history, previous_state, *policy_input)
+
+
+def scheduled_state_update_blocks(blocks):
+    """Wrap every Policy and State Update Function of radCAD State Update Blocks to receive the scheduled System Parameter values
+
+    The schedules must have been precomputed with `densify()`.
+    """
+    return [
+        {
+            **block,
+            "policies": {key: functools.partial(_scheduled_function, function) for (key, function) in block["policies"].items()},
+            "variables": {key: functools.partial(_scheduled_function, function) for (key, function) in block["variables"].items()},
+        }
+        for block in blocks
+    ]
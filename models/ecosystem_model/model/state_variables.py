@@ -1,8 +1,14 @@
 from dataclasses import dataclass
 
+import numpy as np
+
 import model.system_parameters as p
 from model.types import (
-    Percentage
+    Percentage,
+    Person,
+    Mbps,
+    ZAR_per_Mbps,
+    ZAR_per_Day,
 )
 
 
@@ -18,21 +24,34 @@ class StateVariables:
     state variable key: state variable type = default state variable value
     """
 
-    clients: int = 10
-    hosts: int = 1
-    potential_users: int = 10_000 # p.Parameters["initial_population"][0]
+    clients: Person = 10
+    hosts: Person = 1
+    potential_users: Person = 10_000 # p.Parameters["initial_population"][0]
 
-    avg_price: float = 2 # (ZAR/Mbps/Day) The price hosts set for connectivity
+    avg_price: ZAR_per_Mbps = 2 # (ZAR/Mbps/Day) The price hosts set for connectivity
 
-    network_capacity: int = 1 # hosts * p.Parameters["avg_host_line"][0] # (Mbps) Total host capacity
-    indicated_network_demand: int = 0 # clients * p.Parameters["avg_client_allocation"][0] # (Mbps) Estimated total demand for connectivity
-    network_allocation: int = 0 # (Mbps) Actual allocated demand
+    network_capacity: Mbps = 1 # hosts * p.Parameters["avg_host_line"][0] # (Mbps) Total host capacity
+    indicated_network_demand: Mbps = 0 # clients * p.Parameters["avg_client_allocation"][0] # (Mbps) Estimated total demand for connectivity
+    network_allocation: Mbps = 0 # (Mbps) Actual allocated demand
     network_penetration: Percentage = 0 # (%) Population servicable by hosts (a function of network coverage)
     
-    hosts_daily_revenue: float = 0 # (ZAR/Day)
-    hosts_daily_profit: float = 0 # (ZAR/Day)
-    platform_daily_revenue: float = 0 # (ZAR/Day)
+    hosts_daily_revenue: ZAR_per_Day = 0 # (ZAR/Day)
+    hosts_daily_profit: ZAR_per_Day = 0 # (ZAR/Day)
+    platform_daily_revenue: ZAR_per_Day = 0 # (ZAR/Day)
 
 
 # Initialize State Variables instance with default values
-initial_state = StateVariables().__dict__
\ No newline at end of file
+initial_state = StateVariables().__dict__
+
+
+def state_dtype(state_variables=initial_state, precision=np.float64):
+    """Structured NumPy dtype of a state record, one `precision` field per State Variable, used for preallocated result histories
+
+    Counts (`Person`, `Mbps`) are declared as int but change by fractional flows, e.g. clients registering per day,
+    so every State Variable is stored as floating point: integers would truncate the model's results.
+
+    Args:
+        state_variables (list): State Variable keys, in field order
+        precision: dtype of the State Variables, e.g. np.float32 to halve the size of the stored history
+    """
+    return np.dtype([(key, precision) for key in state_variables])
@@ -0,0 +1,204 @@
+"""
+# Stochastic variants of the vectorized Policies, for Monte Carlo runs.
+
+The deterministic model computes the expected number of clients and hosts onboarding each day.
+In stochastic mode (see `Stochastic`):
+* onboarding is drawn from a Binomial distribution over the potential users (or a Poisson distribution) with that expectation
+* the average price is multiplied by log-normal noise with mean 1
+
+Random numbers come from one `numpy.random.Generator` per Monte Carlo run, a Philox stream keyed on `(seed, run)`, so a run is
+reproducible whatever the chunking or the other runs and subsets it is simulated with, and every subset of a run
+sees the same random numbers (common random numbers). Each stream draws the uniform and normal variates of a block
+of timesteps at once, and each timestep's variates of all runs are then used as one array: the samplers below
+transform them to Binomial and Poisson draws by inversion, or by a normal approximation for large expectations.
+"""
+
+
+import numpy as np
+
+import model.vectorized as vectorized
+
+
+ADOPTION_DISTRIBUTIONS = ["binomial", "poisson"]
+# Expectation above which adoption draws use a normal approximation instead of inversion (the usual n p >= 10 rule)
+INVERSION_LIMIT = 10
+# Timesteps of random variates drawn from each run's Generator at once
+BLOCK_TIMESTEPS = 64
+
+
+def _invert(uniform, probability, a, b, r, limit):
+    """Inverse transform sampling of a discrete distribution on 0, 1, ..., limit with P(k + 1) / P(k) = (a - b k) r / (k + 1)
+
+    Args:
+        probability (np.ndarray): P(0)
+    """
+    draws = np.zeros(len(uniform))
+    cdf = probability.copy()
+    index = np.flatnonzero((uniform > cdf) & (limit > 0))
+    # The draw is the number of k at which the CDF is still below the uniform variate. Iterate over arrays of the
+    # elements not yet drawn, compacted once at most half of them remain.
+    uniform, probability, cdf, a, r, limit = (values[index] for values in (uniform, probability, cdf, a, r, limit))
+    counts = np.ones(len(index))
+    k = 0
+    while len(index):
+        probability *= (a - b * k) * r / (k + 1)
+        k += 1
+        cdf += probability
+        remaining = (uniform > cdf) & (limit > k) & (probability > 0)
+        counts += remaining
+        if np.count_nonzero(remaining) * 2 <= len(index):
+            # Elements stop for good once the CDF reaches their uniform variate
+            draws[index[~remaining]] = counts[~remaining]
+            index, uniform, probability, cdf, a, r, limit, counts = (
+                values[remaining] for values in (index, uniform, probability, cdf, a, r, limit, counts)
+            )
+    return draws
+
+
+def binomial(n, p, uniform, normal):
+    """Binomial(n, p) draws from standard uniform and normal variates (n is rounded to an integer)"""
+    n = np.maximum(np.round(n), 0)
+    p = np.clip(np.nan_to_num(p), 0, 1)
+    # Sample the smaller of p and 1 - p, which keeps (1 - q)^n from underflowing
+    flip = p > 0.5
+    q = np.where(flip, 1 - p, p)
+    mean = n * q
+
+    draws = np.empty(len(n))
+    small = mean <= INVERSION_LIMIT
+    if small.any():
+        ns, qs = n[small], q[small]
+        draws[small] = _invert(uniform[small], (1 - qs) ** ns, ns, 1, qs / (1 - qs), ns)
+    large = ~small
+    if large.any():
+        deviation = np.sqrt(mean[large] * (1 - q[large])) * normal[large]
+        draws[large] = np.clip(np.round(mean[large] + deviation), 0, n[large])
+
+    return np.where(flip, n - draws, draws)
+
+
+def poisson(lam, uniform, normal):
+    """Poisson(lam) draws from standard uniform and normal variates"""
+    lam = np.maximum(np.nan_to_num(lam), 0)
+
+    draws = np.empty(len(lam))
+    small = lam <= INVERSION_LIMIT
+    if small.any():
+        lams = lam[small]
+        ones = np.ones(len(lams))
+        draws[small] = _invert(uniform[small], np.exp(-lams), lams, 0, ones, np.full(len(lams), np.inf))
+    large = ~small
+    if large.any():
+        draws[large] = np.maximum(np.round(lam[large] + np.sqrt(lam[large]) * normal[large]), 0)
+
+    return draws
+
+
+class Stochastic:
+    """Stochastic mode of the vectorized engine
+
+    Args:
+        seed (int): seed of the random streams, see `RandomStreams`
+        adoption (str): "binomial" or "poisson" distribution of clients and hosts onboarding each day, or None to keep the expectation
+        price_volatility (float): standard deviation of the daily log-normal noise of the average price
+    """
+
+    def __init__(self, seed=0, adoption="binomial", price_volatility=0.0):
+        if adoption is not None and adoption not in ADOPTION_DISTRIBUTIONS:
+            raise ValueError(f"Unknown adoption distribution {adoption}")
+        self.seed = seed
+        self.adoption = adoption
+        self.price_volatility = price_volatility
+
+    def streams(self, run_indices, timestep=0):
+        return RandomStreams(self.seed, run_indices, timestep)
+
+    def state_update_blocks(self, blocks, streams):
+        """Replace the adoption and price Policies of vectorized State Update Blocks with stochastic ones drawing from `streams`"""
+        def p_client_adoption(params, previous_state):
+            expected = vectorized.p_client_adoption(params, previous_state)["clients"]
+            return {"clients": self._adoption(expected, previous_state["potential_users"], *streams.variates(0))}
+
+        def p_host_adoption(params, previous_state):
+            expected = vectorized.p_host_adoption(params, previous_state)["hosts"]
+            return {"hosts": self._adoption(expected, previous_state["potential_users"], *streams.variates(1))}
+
+        def p_avg_price(params, previous_state):
+            price = vectorized.p_avg_price(params, previous_state)["avg_price"]
+            if self.price_volatility:
+                _uniform, normal = streams.variates(2)
+                price = price * np.exp(self.price_volatility * normal - self.price_volatility ** 2 / 2)
+            return {"avg_price": price}
+
+        stochastic_functions = {
+            vectorized.p_client_adoption: p_client_adoption,
+            vectorized.p_host_adoption: p_host_adoption,
+            vectorized.p_avg_price: p_avg_price,
+        }
+        return [
+            {
+                **block,
+                "policies": {key: stochastic_functions.get(function, function) for (key, function) in block["policies"].items()},
+            }
+            for block in blocks
+        ]
+
+    def _adoption(self, expected, potential_users, uniform, normal):
+        if self.adoption == "binomial":
+            n = np.maximum(potential_users, 0)
+            p = np.divide(expected, n, out=np.zeros(len(n)), where=n > 0)
+            return binomial(n, p, uniform, normal)
+        if self.adoption == "poisson":
+            return np.minimum(poisson(expected, uniform, normal), np.maximum(np.round(potential_users), 0))
+        return expected
+
+
+class RandomStreams:
+    """Per-run random streams of uniform and normal variates
+
+    Args:
+        seed (int): seed, combined with each run index as the key of that run's Philox Generator
+        run_indices (np.ndarray): the (0-based) run of each simulated (run, subset) pair
+        timestep (int): the timestep the runs start from, e.g. when resuming from a checkpoint. The variates of
+            the earlier timesteps are skipped, so a resumed run draws the same variates as an uninterrupted one.
+    """
+
+    # Variates per timestep: client adoption, host adoption, price noise
+    VARIATES = 3
+
+    def __init__(self, seed, run_indices, timestep=0):
+        self.runs, self.pairs = np.unique(run_indices, return_inverse=True)
+        # Whether each pair is a different run, in run order
+        self.identity = np.array_equal(self.pairs, np.arange(len(self.pairs)))
+        self.generators = [np.random.Generator(np.random.Philox(key=[seed, run])) for run in self.runs]
+        # Skip the blocks before the starting timestep. Each Philox counter increment produces four variates.
+        skipped_blocks = timestep // BLOCK_TIMESTEPS
+        if skipped_blocks:
+            for generator in self.generators:
+                generator.bit_generator.advance(skipped_blocks * BLOCK_TIMESTEPS * 2 * self.VARIATES // 4)
+        self.block = None
+
+    def advance(self, timestep):
+        """Select the variates of a timestep (from 1), drawing the next block of timesteps of every run when needed"""
+        block_timestep = (timestep - 1) % BLOCK_TIMESTEPS
+        if block_timestep == 0 or self.block is None:
+            uniforms = np.empty((len(self.generators), BLOCK_TIMESTEPS * 2 * self.VARIATES))
+            for (run, generator) in enumerate(self.generators):
+                generator.random(out=uniforms[run])
+            # (block timesteps, 2, variates, runs), so the variates of a timestep are contiguous across runs
+            uniforms = np.ascontiguousarray(
+                uniforms.reshape(len(self.generators), BLOCK_TIMESTEPS, 2, self.VARIATES).transpose(1, 2, 3, 0)
+            )
+            uniform = uniforms[:, 0]
+            # Box-Muller transform. Each draw uses either its uniform or its normal variate, never both.
+            normal = np.sqrt(-2 * np.log1p(-uniforms[:, 1])) * np.cos(2 * np.pi * uniform)
+            self.block = (uniform, normal)
+        uniform, normal = self.block
+        self.current = (uniform[block_timestep], normal[block_timestep])
+
+    def variates(self, variate):
+        """Return the (uniform, normal) variates of every pair for the current timestep"""
+        uniform, normal = self.current
+        if self.identity:
+            return uniform[variate], normal[variate]
+        return uniform[variate][self.pairs], normal[variate][self.pairs]
@@ -0,0 +1,274 @@
+"""
+# Vectorized (NumPy) counterparts of the Policy and State Update Functions.
+
+Every State Variable and System Parameter is a NumPy array with one element per (run, subset) pair,
+so a whole parameter sweep is advanced by one timestep with a single set of array operations.
+
+The functions mirror `model/policy_functions.py` and `model/state_update_functions.py` one-to-one,
+and `vectorize_state_update_blocks()` maps the radCAD `state_update_blocks` onto them, so the
+substep order and the summing of Policy Signals with the same key (radCAD's `reduce_signals`) are preserved.
+"""
+
+
+import numpy as np
+
+import model.constants as constant
+import model.policy_functions as policy
+import model.state_update_functions as state
+from model.state_update_blocks import state_update_blocks
+
+
+def p_client_adoption(params, previous_state):
+
+    onboarding_coeff = params["onboarding_coefficient"]
+    competitor_price = params["client_competitor_price"]
+    registration_delay = params["client_registration_delay"]
+
+    avg_price = previous_state["avg_price"]
+    hosts = previous_state["hosts"]
+    clients = previous_state["clients"]
+    potential_users = previous_state["potential_users"]
+
+    probability_WOM = (clients + hosts) / (clients + hosts + potential_users)
+
+    price_desirability = np.where(
+        competitor_price - avg_price > 0,
+        (competitor_price - avg_price) / competitor_price,
+        0,
+    )
+
+    clientsRegistering = onboarding_coeff * (potential_users * price_desirability * probability_WOM) / registration_delay
+    clientsRegistering = np.where(clientsRegistering > potential_users, 0, clientsRegistering)
+
+    return {"clients": clientsRegistering}
+
+
+def p_host_adoption(params, previous_state):
+
+    onboarding_coeff = params["onboarding_coefficient"]
+    setup_delay = params["host_setup_delay"]
+    host_line_cost = params["host_line_cost"]
+    avg_host_line = params["avg_host_line"]
+    technical_difficulty = params["host_technical_difficulty"]
+    MIN_expected_fulfillment = params["MIN_expected_fulfillment"]
+    avg_client_allocation = params["avg_client_allocation"]
+
+    avg_price = previous_state["avg_price"]
+    hosts = previous_state["hosts"]
+    clients = previous_state["clients"]
+    potential_users = previous_state["potential_users"]
+    network_penetration = previous_state["network_penetration"]
+
+    probability_WOM = (clients + hosts) / (clients + hosts + potential_users)
+
+    max_clients = (avg_host_line / avg_client_allocation) # (Person)
+
+    host_expected_fulfillment = np.where(
+        MIN_expected_fulfillment < network_penetration,
+        network_penetration,
+        MIN_expected_fulfillment,
+    )
+
+    expected_revenue = avg_price * max_clients * host_expected_fulfillment * avg_client_allocation # (ZAR/Day)
+    operating_expenses = host_line_cost * avg_host_line # (ZAR/Day)
+
+    profit = expected_revenue - operating_expenses # (ZAR/Day)
+
+    expected_margin = np.where(profit >= 0, profit / expected_revenue, 0.01)
+
+    hostsOnboarding = onboarding_coeff * (expected_margin * potential_users * probability_WOM * (1-technical_difficulty) ) / setup_delay
+    hostsOnboarding = np.where(hostsOnboarding > potential_users, 0, hostsOnboarding)
+
+    return {"hosts": hostsOnboarding}
+
+
+def p_network_capacity(params, previous_state):
+
+    avg_host_line = params["avg_host_line"]
+    hosts = previous_state["hosts"]
+    network_inefficiencies = params["network_inefficiencies"]
+
+    network_capacity = hosts * avg_host_line * (1-network_inefficiencies)
+    return {"network_capacity": network_capacity}
+
+
+def _price_attractiveness(params, previous_state):
+    competitor_price = params["client_competitor_price"]
+    avg_price = previous_state["avg_price"]
+
+    # Divide only where the price is positive, to avoid division-by-zero warnings
+    safe_price = np.where(avg_price > 0, avg_price, 1)
+    return np.where(avg_price > 0, competitor_price / safe_price, 1)
+
+
+def p_indicated_network_demand(params, previous_state):
+
+    avg_client_allocation = params["avg_client_allocation"]
+    clients = previous_state["clients"]
+
+    indicated_network_demand = clients * avg_client_allocation * _price_attractiveness(params, previous_state)
+
+    return {"indicated_network_demand": indicated_network_demand}
+
+
+def p_network_allocation(params, previous_state):
+
+    avg_client_allocation = params["avg_client_allocation"]
+
+    clients = previous_state["clients"]
+    access = previous_state["network_penetration"]
+
+    network_allocation = clients * avg_client_allocation * _price_attractiveness(params, previous_state) * access
+
+    return {"network_allocation": network_allocation}
+
+
+def p_network_penetration(params, previous_state):
+
+    hosts = previous_state["hosts"]
+    population = params["initial_population"]
+
+    network_penetration = np.minimum(1, (hosts*constant.max_clients_servicable_by_host/population))
+
+    return {"network_penetration": network_penetration}
+
+
+def p_avg_price(params, previous_state):
+
+    avg_reserve_capacity = params["avg_reserve_capacity"]
+    price_change_delay = params["price_change_delay"]
+
+    currentPrice = previous_state["avg_price"]
+    indicated_network_demand = previous_state["indicated_network_demand"]
+    network_capacity = previous_state["network_capacity"]
+
+    effective_capacity = network_capacity*(1-avg_reserve_capacity)
+    safe_capacity = np.where(network_capacity > 0, effective_capacity, 1)
+    supply_demand_ratio = np.where(network_capacity > 0, indicated_network_demand / safe_capacity, 1)
+
+    desired_price = (currentPrice * supply_demand_ratio)
+    newPrice = currentPrice + ((desired_price - currentPrice) / price_change_delay)
+
+    return {"avg_price": np.maximum(newPrice, 0)}
+
+
+def p_host_daily_yields(params, previous_state):
+
+    host_line_cost = params["host_line_cost"]
+    avg_host_line = params["avg_host_line"]
+
+    avg_price = previous_state["avg_price"]
+    hosts = previous_state["hosts"]
+    network_allocation = previous_state["network_allocation"]
+
+    total_daily_revenue = avg_price * network_allocation # (ZAR/Day)
+    total_daily_operating_expenses = hosts * host_line_cost * avg_host_line # (ZAR/Day)
+    total_daily_profit = total_daily_revenue - total_daily_operating_expenses # (ZAR/Day)
+
+    return {"hosts_daily_revenue": total_daily_revenue, "hosts_daily_profit": total_daily_profit}
+
+
+def p_platform_daily_revenue(params, previous_state):
+
+    hosts_daily_revenue = previous_state["hosts_daily_revenue"]
+    service_fee = params["service_fee"]
+
+    return {"platform_daily_revenue": hosts_daily_revenue * service_fee}
+
+
+def s_clients(params, previous_state, policy_input):
+    return ("clients", previous_state["clients"] + policy_input["clients"])
+
+def s_hosts(params, previous_state, policy_input):
+    return ("hosts", previous_state["hosts"] + policy_input["hosts"])
+
+def s_potential_users(params, previous_state, policy_input):
+    potential_users = previous_state["potential_users"] - policy_input["clients"] - policy_input["hosts"]
+    return ("potential_users", np.maximum(potential_users, 0))
+
+def s_network_capacity(params, previous_state, policy_input):
+    return ("network_capacity", policy_input["network_capacity"])
+
+def s_indicated_network_demand(params, previous_state, policy_input):
+    return ("indicated_network_demand", policy_input["indicated_network_demand"])
+
+def s_network_allocation(params, previous_state, policy_input):
+    return ("network_allocation", policy_input["network_allocation"])
+
+def s_network_penetration(params, previous_state, policy_input):
+    return ("network_penetration", policy_input["network_penetration"])
+
+def s_avg_price(params, previous_state, policy_input):
+    return ("avg_price", policy_input["avg_price"])
+
+def s_hosts_daily_revenue(params, previous_state, policy_input):
+    return ("hosts_daily_revenue", policy_input["hosts_daily_revenue"])
+
+def s_hosts_daily_profit(params, previous_state, policy_input):
+    return ("hosts_daily_profit", policy_input["hosts_daily_profit"])
+
+def s_platform_daily_revenue(params, previous_state, policy_input):
+    return ("platform_daily_revenue", policy_input["platform_daily_revenue"])
+
+
+# Mapping from the radCAD (scalar) functions to their vectorized counterparts
+vectorized_functions = {
+    policy.p_client_adoption: p_client_adoption,
+    policy.p_host_adoption: p_host_adoption,
+    policy.p_network_capacity: p_network_capacity,
+    policy.p_indicated_network_demand: p_indicated_network_demand,
+    policy.p_network_allocation: p_network_allocation,
+    policy.p_network_penetration: p_network_penetration,
+    policy.p_avg_price: p_avg_price,
+    policy.p_host_daily_yields: p_host_daily_yields,
+    policy.p_platform_daily_revenue: p_platform_daily_revenue,
+    state.s_clients: s_clients,
+    state.s_hosts: s_hosts,
+    state.s_potential_users: s_potential_users,
+    state.s_network_capacity: s_network_capacity,
+    state.s_indicated_network_demand: s_indicated_network_demand,
+    state.s_network_allocation: s_network_allocation,
+    state.s_network_penetration: s_network_penetration,
+    state.s_avg_price: s_avg_price,
+    state.s_hosts_daily_revenue: s_hosts_daily_revenue,
+    state.s_hosts_daily_profit: s_hosts_daily_profit,
+    state.s_platform_daily_revenue: s_platform_daily_revenue,
+}
+
+
+def vectorize_state_update_blocks(blocks=state_update_blocks):
+    """Replace every Policy and State Update Function in a radCAD State Update Block list with its vectorized counterpart
+
+    Args:
+        blocks (list): radCAD State Update Blocks. Defaults to `model.state_update_blocks.state_update_blocks`.
+
+    Returns:
+        list: State Update Blocks with the same structure and descriptions, referencing the functions in this module
+    """
+    return [
+        {
+            **block,
+            "policies": {key: vectorized_functions[function] for (key, function) in block["policies"].items()},
+            "variables": {key: vectorized_functions[function] for (key, function) in block["variables"].items()},
+        }
+        for block in blocks
+    ]
+
+
+def step(params, previous_state, blocks):
+    """Advance the vectorized state by one timestep, executing each State Update Block as one substep
+
+    Policy Signals with the same key are summed, as in radCAD.
+    """
+    for block in blocks:
+        signals = {}
+        for function in block["policies"].values():
+            for (key, value) in function(params, previous_state).items():
+                signals[key] = signals[key] + value if key in signals else value
+
+        previous_state = {
+            **previous_state,
+            **dict(function(params, previous_state, signals) for function in block["variables"].values()),
+        }
+
+    return previous_state
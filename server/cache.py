@@ -0,0 +1,67 @@
+"""
+In-memory cache of completed job results
+
+Results are keyed on the normalized job spec (see `jobs.py`), so repeated identical requests, e.g. dashboards requesting
+the default System Parameters, are served without simulating. The cache is limited in size, counting the memory of
+each cached DataFrame, and evicts the least recently used results.
+"""
+
+import collections
+import threading
+
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2 # 512 MB
+
+
+def size(df):
+    """Memory of a DataFrame (bytes), including its index and the contents of object columns"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class MemoryCache:
+    """Least-recently-used cache of (results, exceptions) limited to `max_bytes`
+
+    Args:
+        max_bytes (int): maximum total size of the cached results. Results larger than this are not cached.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached (results, exceptions), or None on a cache miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[:2]
+
+    def put(self, key, df, exceptions):
+        """Cache results, evicting the least recently used results until the cache is within its size limit"""
+        entry_bytes = size(df)
+        if entry_bytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[2]
+            self.entries[key] = (df, exceptions, entry_bytes)
+            self.bytes += entry_bytes
+            while self.bytes > self.max_bytes:
+                (_key, (_df, _exceptions, evicted_bytes)) = self.entries.popitem(last=False)
+                self.bytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def describe(self):
+        """JSON-serializable size of the cache"""
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
@@ -0,0 +1,395 @@
+"""
+Simulation jobs of the simulation server
+
+A job is a JSON spec of System Parameter overrides and an optional sweep design, applied to the default experiment
+(`experiments/default_experiment.py`) and executed with `experiments/run.py::run`:
+
+```json
+{
+    "engine": "vectorized",
+    "timesteps": 365,
+    "runs": 1,
+    "parameters": {"service_fee": 0.05, "host_line_cost": [0.04, 0.06]},
+    "sweep": {"design": "latin_hypercube", "ranges": {"avg_host_line": [10, 50]}, "samples": 16, "seed": 0}
+}
+```
+
+* `engine` (default "vectorized"): engine of `run()`
+* `parameters`: a value overrides a System Parameter, a list of values sweeps it (zipped with the other lists, as in radCAD)
+* `sweep` (optional): a design of `experiments/sweeps.py` ("latin_hypercube", "sobol_sequence" or "one_at_a_time")
+  and its arguments, replacing the sweep of `parameters`
+
+`Jobs` queues the jobs in a bounded queue, executed by a fixed pool of worker threads sharing the process' imported model,
+and keeps the post-processed results of the most recent jobs for polling and streaming. Identical specs are executed once,
+compared once normalized (a value and a list of that one value are the same override, and overrides equal to the
+default System Parameters are dropped):
+* a submission identical to a queued or running job is coalesced into that job, so every submitter polls the same job
+* completed results are kept in an in-memory LRU cache (see `cache.py`), so a later identical submission completes at once
+"""
+
+import collections
+import copy
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from cache import MemoryCache, DEFAULT_MAX_BYTES
+from experiments.default_experiment import experiment
+from experiments.run import run
+import experiments.sweeps as sweeps
+from model.system_parameters import parameters as default_parameters
+
+
+ENGINES = ["radcad", "vectorized", "fused"]
+DESIGNS = {
+    "latin_hypercube": sweeps.latin_hypercube,
+    "sobol_sequence": sweeps.sobol_sequence,
+    "one_at_a_time": sweeps.one_at_a_time,
+}
+SPEC_KEYS = {"engine", "timesteps", "runs", "parameters", "sweep"}
+
+
+class JobError(ValueError):
+    """Invalid job spec, or a job that cannot be accepted"""
+
+
+def normalize(spec, max_rows=None):
+    """Validate a job spec, fill in its defaults and build its sweep design
+
+    The number of result rows is checked against `max_rows` before the design is built, so an oversized design is
+    rejected without allocating it.
+
+    Args:
+        spec (dict): job spec, see the module docstring
+        max_rows (int, optional): largest number of result rows accepted
+
+    Returns:
+        (dict, pd.DataFrame): the normalized job spec, and the subset table of its sweep design (None without one)
+
+    Raises:
+        JobError: if the spec is invalid, or its results would exceed `max_rows`
+    """
+    if not isinstance(spec, dict):
+        raise JobError("A job spec must be a JSON object")
+    unknown = set(spec) - SPEC_KEYS
+    if unknown:
+        raise JobError(f"Unknown job spec keys {sorted(unknown)}")
+
+    simulation = experiment.simulations[0]
+    normalized = {
+        "engine": spec.get("engine", "vectorized"),
+        "timesteps": spec.get("timesteps", simulation.timesteps),
+        "runs": spec.get("runs", simulation.runs),
+        "parameters": spec.get("parameters", {}),
+        "sweep": spec.get("sweep"),
+    }
+    if normalized["engine"] not in ENGINES:
+        raise JobError(f"Unknown engine {normalized['engine']}, expected one of {ENGINES}")
+    for key in ["timesteps", "runs"]:
+        if not isinstance(normalized[key], int) or isinstance(normalized[key], bool) or normalized[key] < 1:
+            raise JobError(f"{key} must be a positive integer")
+    if not isinstance(normalized["parameters"], dict):
+        raise JobError("parameters must be a JSON object of System Parameter -> value or list of values")
+    unknown = set(normalized["parameters"]) - set(default_parameters)
+    if unknown:
+        raise JobError(f"Unknown System Parameters {sorted(unknown)}")
+    # Canonical overrides, so that equivalent specs share a cache key: every value is a list of values,
+    # and overrides equal to the default System Parameters are dropped
+    overrides = {}
+    for (name, value) in normalized["parameters"].items():
+        values = value if isinstance(value, list) else [value]
+        if not values:
+            raise JobError(f"System Parameter {name} has an empty list of values")
+        if values != default_parameters[name]:
+            overrides[name] = values
+    normalized["parameters"] = overrides
+
+    sweep = normalized["sweep"]
+    if sweep is not None and (not isinstance(sweep, dict) or sweep.get("design") not in DESIGNS):
+        raise JobError(f"sweep must be a JSON object with a design, one of {list(DESIGNS)}")
+
+    job_rows = rows(normalized)
+    if max_rows is not None and job_rows > max_rows:
+        raise JobError(f"The job would return {job_rows:,} rows, more than the limit of {max_rows:,}")
+    return normalized, design(normalized)
+
+
+def key(spec):
+    """Cache key of a normalized job spec"""
+    return json.dumps(spec, sort_keys=True, separators=(",", ":"))
+
+
+def design(spec):
+    """Subset table of the sweep design of a normalized job spec, or None
+
+    Raises:
+        JobError: if the design's arguments are invalid
+    """
+    if spec["sweep"] is None:
+        return None
+    arguments = {key: value for (key, value) in spec["sweep"].items() if key != "design"}
+    try:
+        return DESIGNS[spec["sweep"]["design"]](**arguments)
+    except (TypeError, ValueError) as e:
+        raise JobError(f"Invalid {spec['sweep']['design']} design: {e}")
+
+
+def subsets(spec):
+    """Number of subsets of a normalized job spec, without building its sweep design
+
+    At most this many for a one_at_a_time design, which drops the values equal to the baseline.
+
+    Raises:
+        JobError: if the size arguments of the design are invalid
+    """
+    sweep = spec["sweep"]
+    if sweep is None:
+        return max([len(values) for values in spec["parameters"].values()], default=1)
+    if sweep["design"] == "one_at_a_time":
+        values = sweep.get("values")
+        if not isinstance(values, dict) or not all(isinstance(value, list) for value in values.values()):
+            raise JobError("A one_at_a_time design requires values, a JSON object of System Parameter -> list of values")
+        return 1 + sum(len(value) for value in values.values())
+    samples = sweep.get("samples")
+    if not isinstance(samples, int) or isinstance(samples, bool) or samples < 1:
+        raise JobError(f"A {sweep['design']} design requires samples, a positive integer")
+    return samples
+
+
+def rows(spec):
+    """Number of post-processed result rows of a normalized job spec (at most this many, see `subsets()`)"""
+    return spec["timesteps"] * subsets(spec) * spec["runs"]
+
+
+def execute(spec, table=None):
+    """Execute a normalized job spec
+
+    Args:
+        table (pd.DataFrame, optional): subset table of the spec's sweep design, as built by `normalize()`
+
+    Returns:
+        (pd.DataFrame, list): post-processed results, and the exceptions of failed runs
+    """
+    executable = copy.deepcopy(experiment)
+    for simulation in executable.simulations:
+        simulation.timesteps = spec["timesteps"]
+        simulation.runs = spec["runs"]
+        for (name, values) in spec["parameters"].items():
+            simulation.model.params[name] = list(values)
+
+    if table is None:
+        table = design(spec)
+    # System Parameters not in the design keep their first (overridden) value, see `sweeps.apply()`
+    return run(executable, engine=spec["engine"], design=table)
+
+
+class Job:
+    """A queued, running or completed job
+
+    Args:
+        spec (dict): normalized job spec
+        table (pd.DataFrame, optional): subset table of its sweep design
+    """
+
+    def __init__(self, spec, table=None):
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.table = table
+        self.key = key(spec)
+        self.cached = False
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.exceptions = []
+        self.error = None
+        self.done = threading.Event()
+
+    def describe(self):
+        """JSON-serializable status of the job"""
+        description = {
+            "id": self.id,
+            "status": self.status,
+            "spec": self.spec,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "cached": self.cached,
+        }
+        if self.result is not None:
+            description["rows"] = len(self.result)
+            description["columns"] = list(self.result.columns)
+            description["failed_runs"] = len(self.exceptions)
+        if self.error is not None:
+            description["error"] = self.error
+        return description
+
+
+class Metrics:
+    """Thread-safe counters, and latencies (s) summarised over a window of the most recent observations"""
+
+    def __init__(self, window=1000):
+        self.counters = collections.Counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.totals = collections.Counter()
+        self.maxima = collections.Counter()
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            self.counters[f"{name}_count"] += 1
+            self.totals[name] += seconds
+            self.maxima[name] = max(self.maxima[name], seconds)
+
+    def describe(self):
+        """JSON-serializable counters, and the count, total, mean, median, 95th percentile and maximum of each latency"""
+        with self.lock:
+            latencies = {}
+            for (name, window) in self.latencies.items():
+                values = sorted(window)
+                count = self.counters[f"{name}_count"]
+                latencies[name] = {
+                    "count": count,
+                    "total": self.totals[name],
+                    "mean": self.totals[name] / count,
+                    "p50": values[len(values) // 2],
+                    "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+                    "max": self.maxima[name],
+                }
+            counters = {name: value for (name, value) in self.counters.items() if not name.endswith("_count")}
+        return {"counters": counters, "latency": latencies}
+
+
+class Jobs:
+    """Bounded job queue executed by a pool of worker threads, coalescing and caching identical jobs
+
+    Args:
+        workers (int): worker threads, i.e. jobs executed concurrently
+        max_queued (int): jobs waiting for a worker, above which submissions are refused
+        max_jobs (int): jobs kept for polling and streaming; the oldest completed jobs are dropped first
+        max_rows (int, optional): largest number of result rows of a job
+        cache_bytes (int): size limit of the result cache, see `cache.py`. 0 disables the cache.
+    """
+
+    def __init__(self, workers=2, max_queued=32, max_jobs=256, max_rows=10_000_000, cache_bytes=DEFAULT_MAX_BYTES):
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.jobs = collections.OrderedDict()
+        # Cache key -> queued or running job
+        self.in_flight = {}
+        self.cache = MemoryCache(cache_bytes)
+        self.metrics = Metrics()
+        self.max_jobs = max_jobs
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.workers = [
+            threading.Thread(target=self._work, name=f"simulation-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, spec):
+        """Validate and queue a job spec
+
+        Returns:
+            Job: the queued job, the queued or running job of an identical spec, or a completed job with cached results
+
+        Raises:
+            JobError: if the spec is invalid
+            queue.Full: if the queue is full
+        """
+        self.metrics.count("submitted")
+        try:
+            job = Job(*normalize(spec, self.max_rows))
+        except JobError:
+            self.metrics.count("invalid")
+            raise
+
+        with self.lock:
+            in_flight = self.in_flight.get(job.key)
+            if in_flight is not None:
+                self.metrics.count("coalesced")
+                return in_flight
+
+            cached = self.cache.get(job.key)
+            if cached is not None:
+                self.metrics.count("cache_hits")
+                job.result, job.exceptions = cached
+                job.cached = True
+                job.status = "done"
+                job.started = job.finished = time.time()
+                job.done.set()
+            else:
+                try:
+                    self.queue.put_nowait(job)
+                except queue.Full:
+                    self.metrics.count("rejected")
+                    raise
+                self.metrics.count("cache_misses")
+                self.in_flight[job.key] = job
+            self.jobs[job.id] = job
+            self._evict()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def _evict(self):
+        completed = (job_id for (job_id, job) in self.jobs.items() if job.done.is_set())
+        for job_id in list(itertools.islice(completed, max(len(self.jobs) - self.max_jobs, 0))):
+            del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            job.status = "running"
+            job.started = time.time()
+            self.metrics.observe("queue_wait", job.started - job.submitted)
+            try:
+                result, exceptions = execute(job.spec, job.table)
+                # Cached before leaving the in-flight jobs, so that an identical submission finds one or the other
+                self.cache.put(job.key, result, exceptions)
+                job.result, job.exceptions = result, exceptions
+                job.status = "done"
+                self.metrics.count("completed")
+            except Exception as e:
+                logging.exception(f"Job {job.id} failed")
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+                self.metrics.count("failed")
+            finally:
+                job.finished = time.time()
+                self.metrics.observe("execution", job.finished - job.started)
+                with self.lock:
+                    self.in_flight.pop(job.key, None)
+                job.done.set()
+                self.queue.task_done()
+
+    def describe_metrics(self):
+        """JSON-serializable metrics of the jobs, the queue and the result cache"""
+        metrics = self.metrics.describe()
+        counters = metrics["counters"]
+        lookups = counters.get("cache_hits", 0) + counters.get("cache_misses", 0)
+        with self.lock:
+            jobs = collections.Counter(job.status for job in self.jobs.values())
+        return {
+            **metrics,
+            "cache": {**self.cache.describe(), "hit_ratio": counters.get("cache_hits", 0) / lookups if lookups else None},
+            "queue": {"queued": self.queue.qsize(), "max_queued": self.queue.maxsize, "workers": len(self.workers)},
+            "jobs": dict(jobs),
+        }
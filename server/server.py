@@ -1,18 +1,180 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler
+"""
+Simulation HTTP service
+
+Serves simulations of the ecosystem model (`models/ecosystem_model`) from one warm process, so that requests do not
+pay the model's import and startup costs. Jobs are queued and executed by a bounded pool of worker threads
+(see `jobs.py`), and requests are handled concurrently by a threading HTTP server.
+
+Endpoints:
+* `POST /jobs`: queue a job spec (see `jobs.py`), responding `202` with the job's status and its `Location`
+  Identical job specs are coalesced into the same job while it is queued or running, and completed results are cached.
+* `GET /jobs`: status of every job kept by the server
+* `GET /jobs/<id>`: status of a job: "queued", "running", "done" or "failed"
+* `GET /jobs/<id>/results`: post-processed results of a completed job, streamed in chunks as NDJSON (the default),
+  or as an Arrow IPC stream with `?format=arrow` or `Accept: application/vnd.apache.arrow.stream`.
+  `?wait=<seconds>` waits for the job to complete first.
+* `GET /metrics`: counters of submissions, cache hits and misses and coalesced submissions, job latencies (queue wait and
+  execution), and the size of the result cache
+
+Usage: `python server/server.py [--port 8000] [--workers 2] [--cache-mb 512]`
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "ecosystem_model"))
+
+import pyarrow as pa
+
+from experiments.run import configure_logging
+from jobs import Jobs, JobError
+
+
+NDJSON = "application/x-ndjson"
+ARROW = "application/vnd.apache.arrow.stream"
+# Result rows per streamed chunk
+CHUNK_ROWS = 10_000
+# Largest accepted request body (bytes)
+MAX_BODY = 1 << 20
+
+
+class ChunkedWriter:
+    """File-like writer of an HTTP/1.1 chunked transfer-encoded response body"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.closed = False
+
+    def write(self, data):
+        if data:
+            self.wfile.write(b"%x\r\n" % len(data) + bytes(data) + b"\r\n")
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def close(self):
+        if not self.closed:
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+            self.closed = True
+
 
 class handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by `main()`
+    jobs = None
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            return self.send_json(404, {"error": "Not found"})
+
+        try:
+            length = int(self.headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self.send_json(400, {"error": "Invalid Content-Length header"})
+        if length > MAX_BODY:
+            return self.send_json(413, {"error": f"Request body larger than {MAX_BODY} bytes"})
+        try:
+            spec = json.loads(self.rfile.read(length) or b"{}")
+            job = self.jobs.submit(spec)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            return self.send_json(400, {"error": f"Invalid JSON: {e}"})
+        except JobError as e:
+            return self.send_json(400, {"error": str(e)})
+        except queue.Full:
+            return self.send_json(503, {"error": "The job queue is full, retry later"}, {"Retry-After": "5"})
+
+        self.send_json(202, job.describe(), {"Location": f"/jobs/{job.id}"})
+
     def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["metrics"]:
+            return self.send_json(200, self.jobs.describe_metrics())
+        if parts == ["jobs"]:
+            return self.send_json(200, [job.describe() for job in self.jobs.list()])
+        if len(parts) not in [2, 3] or parts[0] != "jobs" or (len(parts) == 3 and parts[2] != "results"):
+            return self.send_json(404, {"error": "Not found"})
+
+        job = self.jobs.get(parts[1])
+        if job is None:
+            return self.send_json(404, {"error": f"Unknown job {parts[1]}"})
+        if len(parts) == 2:
+            return self.send_json(200, job.describe())
+
+        query = parse_qs(url.query)
+        if "wait" in query:
+            try:
+                job.done.wait(float(query["wait"][0]))
+            except ValueError:
+                return self.send_json(400, {"error": "wait must be a number of seconds"})
+        if job.status == "failed":
+            return self.send_json(500, job.describe())
+        if job.status != "done":
+            return self.send_json(409, job.describe())
+
+        result_format = query.get("format", [None])[0]
+        if result_format is None:
+            result_format = "arrow" if ARROW in self.headers.get("accept", "") else "ndjson"
+        if result_format not in ["ndjson", "arrow"]:
+            return self.send_json(400, {"error": f"Unknown format {result_format}, expected ndjson or arrow"})
+        self.stream(job.result, result_format)
+
+    def stream(self, df, result_format):
+        """Stream a DataFrame in chunks of `CHUNK_ROWS` rows"""
         self.send_response(200)
-        self.send_header('content-type', 'test/html')
+        self.send_header("Content-Type", ARROW if result_format == "arrow" else NDJSON)
+        self.send_header("Transfer-Encoding", "chunked")
         self.end_headers()
-        self.wfile.write('Test message'.encode())
 
+        writer = ChunkedWriter(self.wfile)
+        chunks = (df.iloc[start:start + CHUNK_ROWS] for start in range(0, len(df), CHUNK_ROWS))
+        try:
+            if result_format == "arrow":
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                with pa.ipc.new_stream(writer, schema) as arrow_writer:
+                    for chunk in chunks:
+                        arrow_writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+            else:
+                for chunk in chunks:
+                    writer.write(chunk.to_json(orient="records", lines=True).rstrip("\n").encode() + b"\n")
+            writer.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading
+            self.close_connection = True
+
+    def send_json(self, status, body, headers={}):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for (key, value) in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
 
 
 def main():
-    PORT = 8000
-    server = HTTPServer(('', PORT), handler)
-    print('Sever is running on port %s' % PORT)
+    parser = argparse.ArgumentParser(description="Simulation HTTP service")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="jobs executed concurrently")
+    parser.add_argument("--max-queued", type=int, default=32, help="jobs waiting for a worker")
+    parser.add_argument("--cache-mb", type=int, default=512, help="size limit of the result cache (MB), 0 to disable it")
+    arguments = parser.parse_args()
+
+    configure_logging(logging.INFO)
+    handler.jobs = Jobs(workers=arguments.workers, max_queued=arguments.max_queued, cache_bytes=arguments.cache_mb * 1024 ** 2)
+    server = ThreadingHTTPServer(('', arguments.port), handler)
+    print('Server is running on port %s' % arguments.port)
     server.serve_forever()
 
 if __name__ == '__main__':